@@ -1,3 +1,77 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from main.pagination import PaginateurPlafonne
+from .models import Avis, NotePlat
+from .services import NOTES, suivi_notes
 
-# Register your models here.
+
+class NoteFilter(admin.SimpleListFilter):
+    # Choix fixes : le filtre par défaut lirait les notes distinctes de toute la table
+    title = 'note'
+    parameter_name = 'note'
+
+    def lookups(self, request, model_admin):
+        return [(str(note), f'{note}/5') for note in NOTES]
+
+    def queryset(self, request, queryset):
+        if self.value() in {str(note) for note in NOTES}:
+            return queryset.filter(note=self.value())
+        return queryset
+
+
+def _action_approbation(approuve, description):
+    @admin.action(description=description, permissions=['change'])
+    def action(modeladmin, request, queryset):
+        nombre = 0
+        # Un avis après l'autre dans suivi_notes : agrégats du plat et résumé de l'auteur suivent
+        with transaction.atomic():
+            for avis in queryset.filter(is_deleted=False).exclude(est_approuve=approuve).order_by('pk'):
+                with suivi_notes(avis):
+                    avis.est_approuve = approuve
+                    avis.is_updated = True
+                    avis.updated_by = request.user.id
+                    avis.save(update_fields=['est_approuve', 'is_updated', 'updated_by', 'updated_at'])
+                nombre += 1
+        modeladmin.message_user(request, f"{nombre} avis mis à jour.", messages.SUCCESS)
+    action.__name__ = 'approuver' if approuve else 'desapprouver'
+    return action
+
+
+@admin.register(Avis)
+class AvisAdmin(admin.ModelAdmin):
+    list_display = ('id', 'utilisateur', 'plat', 'note', 'est_approuve', 'est_anonyme', 'created_at', 'is_deleted')
+    # Période en filtre, comme pour les commandes : pas de date_hierarchy sur une grande table
+    list_filter = ('est_approuve', 'is_deleted', NoteFilter, 'created_at')
+    list_select_related = ('utilisateur', 'plat')
+    search_fields = ('=id', 'utilisateur__email', 'utilisateur__nom', 'plat__nom')
+    ordering = ('-created_at', '-id')
+    raw_id_fields = ('utilisateur', 'commande')
+    autocomplete_fields = ('plat',)
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
+    actions = [
+        _action_approbation(True, "Approuver les avis sélectionnés"),
+        _action_approbation(False, "Retirer l'approbation des avis sélectionnés"),
+    ]
+
+    def save_model(self, request, obj, form, change):
+        with suivi_notes(obj):
+            super().save_model(request, obj, form, change)
+
+    def get_actions(self, request):
+        # La suppression en masse contournerait suivi_notes
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+@admin.register(NotePlat)
+class NotePlatAdmin(admin.ModelAdmin):
+    list_display = ('plat', 'nb_avis', 'moyenne', 'dernier_avis_le')
+    list_select_related = ('plat',)
+    search_fields = ('plat__nom',)
+    # Tenu par suivi_notes ; recalculer_notes après une correction manuelle
+    readonly_fields = ('plat', 'nb_avis', 'somme_notes', 'nb_1', 'nb_2', 'nb_3', 'nb_4', 'nb_5', 'dernier_avis_le')
+
+    def has_add_permission(self, request):
+        return False
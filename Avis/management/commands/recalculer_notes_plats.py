@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from Avis.services import recalculer_notes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats de notes des plats depuis la table des avis et corrige les écarts "
+        "(écritures hors Avis.views : shell, admin, loaddata). --verifier se contente de les signaler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verifier', action='store_true', help="Signale les écarts sans les corriger")
+
+    def handle(self, *args, **options):
+        ecarts = recalculer_notes(corriger=not options['verifier'])
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("Agrégats de notes à jour."))
+            return
+        plats = ', '.join(str(plat_id) for plat_id in ecarts)
+        if options['verifier']:
+            self.stdout.write(self.style.WARNING(f"{len(ecarts)} plats en écart : {plats}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(ecarts)} plats corrigés : {plats}"))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Avis', '0004_initial'),
+        ('Commandes', '0007_commande_commande_utilisateur_actif_idx_and_more'),
+        ('Plats', '0003_plat_plat_actif_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(condition=models.Q(('est_approuve', True), ('is_deleted', False)), fields=['plat', '-created_at'], name='avis_plat_publie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at'], name='avis_created_actif_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def calculer_notes(apps, schema_editor):
+    Avis = apps.get_model('Avis', 'Avis')
+    NotePlat = apps.get_model('Avis', 'NotePlat')
+    alias = schema_editor.connection.alias
+    lignes = Avis.objects.using(alias).filter(
+        est_approuve=True, is_deleted=False, plat__isnull=False
+    ).values('plat_id').annotate(
+        nb_avis=Count('id'),
+        somme_notes=Sum('note'),
+        dernier_avis_le=Max('created_at'),
+        **{f'nb_{note}': Count('id', filter=Q(note=note)) for note in range(1, 6)}
+    ).order_by()
+    NotePlat.objects.using(alias).bulk_create([NotePlat(**ligne) for ligne in lignes], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Avis', '0005_avis_avis_plat_publie_idx_and_more'),
+        ('Plats', '0004_plats_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotePlat',
+            fields=[
+                ('plat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notes', serialize=False, to='Plats.plat')),
+                ('nb_avis', models.PositiveIntegerField(default=0)),
+                ('somme_notes', models.PositiveIntegerField(default=0)),
+                ('nb_1', models.PositiveIntegerField(default=0)),
+                ('nb_2', models.PositiveIntegerField(default=0)),
+                ('nb_3', models.PositiveIntegerField(default=0)),
+                ('nb_4', models.PositiveIntegerField(default=0)),
+                ('nb_5', models.PositiveIntegerField(default=0)),
+                ('dernier_avis_le', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(calculer_notes, migrations.RunPython.noop),
+    ]
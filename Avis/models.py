@@ -24,8 +24,49 @@ class Avis(models.Model):
     deleted_by = models.IntegerField(null=True, blank=True)
     
     def __str__(self):
-        return f"Avis de {self.utilisateur.prenom} sur {self.plat.nom}"
+        auteur = self.utilisateur.prenom if self.utilisateur else 'anonyme'
+        return f"Avis de {auteur} sur {self.plat.nom if self.plat else 'un plat supprimé'}"
     
     class Meta:
         unique_together = ['utilisateur', 'commande']
-        ordering = ['-created_at']
\ No newline at end of file
+        indexes = [
+            # Avis publiés d'un plat (page plat, API). est_approuve est dans la
+            # condition : SQLite ne sait pas chercher sur une colonne booléenne nue
+            models.Index(
+                fields=['plat', '-created_at'],
+                condition=models.Q(est_approuve=True, is_deleted=False),
+                name='avis_plat_publie_idx'
+            ),
+            # Avis récents, publiés ou à modérer, et statistiques sur une période
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_deleted=False),
+                name='avis_created_actif_idx'
+            ),
+            # Liste de l'admin Django, supprimés compris : tri -created_at, -id seulement
+            models.Index(fields=['created_at', 'id'], name='avis_created_idx'),
+        ]
+        ordering = ['-created_at']
+
+class NotePlat(models.Model):
+    """Agrégats des avis publiés (approuvés, non supprimés) d'un plat, tenus à jour par Avis.services"""
+    plat = models.OneToOneField('Plats.Plat', on_delete=models.CASCADE, primary_key=True, related_name='notes')
+    nb_avis = models.PositiveIntegerField(default=0)
+    somme_notes = models.PositiveIntegerField(default=0)
+    nb_1 = models.PositiveIntegerField(default=0)
+    nb_2 = models.PositiveIntegerField(default=0)
+    nb_3 = models.PositiveIntegerField(default=0)
+    nb_4 = models.PositiveIntegerField(default=0)
+    nb_5 = models.PositiveIntegerField(default=0)
+    dernier_avis_le = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Notes de {self.plat_id} : {self.moyenne:.1f} ({self.nb_avis} avis)"
+
+    @property
+    def moyenne(self):
+        return self.somme_notes / self.nb_avis if self.nb_avis else 0
+
+    @property
+    def repartition(self):
+        return {note: getattr(self, f'nb_{note}') for note in range(1, 6)}
@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from Commandes import activite
+from .models import Avis, NotePlat
+
+NOTES = range(1, 6)
+
+
+def avis_publies():
+    return Avis.objects.filter(est_approuve=True, is_deleted=False, plat__isnull=False)
+
+
+def notes_plat(plat):
+    """Agrégats du plat ; un NotePlat vide (non enregistré) s'il n'a aucun avis publié"""
+    try:
+        return plat.notes
+    except NotePlat.DoesNotExist:
+        return NotePlat(plat=plat)
+
+
+def _contribution(etat):
+    """(plat_id, note, created_at) si l'avis compte dans les agrégats de son plat"""
+    if etat and etat['plat_id'] and etat['est_approuve'] and not etat['is_deleted']:
+        return etat['plat_id'], int(etat['note']), etat['created_at']
+    return None
+
+
+@contextmanager
+def suivi_notes(avis):
+    """Transaction autour de l'écriture d'un avis : les agrégats de son plat suivent.
+
+    L'état d'avant est relu sous verrou de ligne, pas pris sur l'instance :
+    deux modifications concurrentes (modération et édition) ne comptent pas double.
+    """
+    champs = ('plat_id', 'note', 'est_approuve', 'is_deleted', 'created_at', 'utilisateur_id')
+    with transaction.atomic():
+        etat_avant = None
+        if avis.pk:
+            etat_avant = Avis.objects.select_for_update().filter(pk=avis.pk).values(*champs).first()
+        yield
+        etat_apres = {champ: getattr(avis, champ) for champ in champs}
+        avant, apres = _contribution(etat_avant), _contribution(etat_apres)
+        if avant != apres:
+            if avant:
+                _retirer(*avant)
+            if apres:
+                _ajouter(*apres)
+
+        # Résumé d'activité de l'auteur (avis non supprimés, approuvés ou non)
+        variations = {}
+        for etat, delta in ((etat_avant, -1), (etat_apres, 1)):
+            if etat and not etat['is_deleted']:
+                activite.variation_avis(variations, etat['utilisateur_id'], etat['note'], etat['est_approuve'], delta)
+        activite.appliquer(variations)
+
+
+def _ajouter(plat_id, note, created_at):
+    maj = {
+        'nb_avis': F('nb_avis') + 1,
+        'somme_notes': F('somme_notes') + note,
+        f'nb_{note}': F(f'nb_{note}') + 1,
+        'dernier_avis_le': Greatest(Coalesce('dernier_avis_le', Value(created_at)), Value(created_at)),
+    }
+    if NotePlat.objects.filter(plat_id=plat_id).update(**maj):
+        return
+    try:
+        with transaction.atomic():
+            NotePlat.objects.create(
+                plat_id=plat_id, nb_avis=1, somme_notes=note, dernier_avis_le=created_at, **{f'nb_{note}': 1}
+            )
+    except IntegrityError:
+        # Premier avis du plat publié en même temps par une autre transaction
+        NotePlat.objects.filter(plat_id=plat_id).update(**maj)
+
+
+def _retirer(plat_id, note, created_at):
+    # L'avis est déjà enregistré : la sous-requête ne le compte plus
+    NotePlat.objects.filter(plat_id=plat_id).update(
+        nb_avis=F('nb_avis') - 1,
+        somme_notes=F('somme_notes') - note,
+        **{f'nb_{note}': F(f'nb_{note}') - 1},
+        dernier_avis_le=Subquery(
+            avis_publies().filter(plat_id=OuterRef('plat_id')).order_by('-created_at').values('created_at')[:1]
+        )
+    )
+
+
+def calculer_notes():
+    """Agrégats recalculés depuis la table des avis, par plat (une requête groupée)"""
+    lignes = avis_publies().values('plat_id').annotate(
+        nb_avis=Count('id'),
+        somme_notes=Sum('note'),
+        dernier_avis_le=Max('created_at'),
+        **{f'nb_{note}': Count('id', filter=Q(note=note)) for note in NOTES}
+    ).order_by()
+    return {ligne.pop('plat_id'): ligne for ligne in lignes}
+
+
+def recalculer_notes(corriger=True):
+    """Compare les agrégats enregistrés au recalcul ; corrige les écarts sauf si corriger=False.
+
+    Retourne les identifiants des plats en écart.
+    """
+    attendus = calculer_notes()
+    champs = ['nb_avis', 'somme_notes', *[f'nb_{note}' for note in NOTES], 'dernier_avis_le']
+    vide = dict.fromkeys(champs, 0) | {'dernier_avis_le': None}
+
+    with transaction.atomic():
+        enregistres = {notes.plat_id: notes for notes in NotePlat.objects.select_for_update()}
+        ecarts = []
+        a_modifier = []
+        a_creer = []
+        for plat_id in enregistres.keys() | attendus.keys():
+            valeurs = attendus.get(plat_id, vide)
+            notes = enregistres.get(plat_id)
+            if notes is None:
+                ecarts.append(plat_id)
+                a_creer.append(NotePlat(plat_id=plat_id, **valeurs))
+            elif any(getattr(notes, champ) != valeurs[champ] for champ in champs):
+                ecarts.append(plat_id)
+                for champ in champs:
+                    setattr(notes, champ, valeurs[champ])
+                a_modifier.append(notes)
+        if corriger:
+            NotePlat.objects.bulk_create(a_creer)
+            NotePlat.objects.bulk_update(a_modifier, champs, batch_size=500)
+    return sorted(ecarts)
@@ -1,3 +1,103 @@
+from datetime import timedelta
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from Commandes.models import Commande
+from Menus.models import Menu
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+from .models import Avis, NotePlat
+from .services import recalculer_notes
 
-# Create your tests here.
+
+class NotesPlatTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            email='admin@avis.test', prenom='Ada', nom='Admin', role='admin'
+        )
+        cls.collaborateur = Utilisateur.objects.create_user(
+            email='collab@avis.test', prenom='Col', nom='Laborateur'
+        )
+        cls.plat = Plat.objects.create(nom='Ndolé', description='-')
+        menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(hours=2)
+        )
+        cls.commande = Commande.objects.create(
+            utilisateur=cls.collaborateur, menu=menu, plat=cls.plat, statut='confirmee'
+        )
+
+    def notes(self):
+        return NotePlat.objects.get(plat=self.plat)
+
+    def donner_avis(self, note):
+        self.client.force_login(self.collaborateur)
+        self.client.post(reverse('donner_avis_commande', args=[self.commande.id]), {'note': note})
+        return Avis.objects.get(commande=self.commande)
+
+    def test_cycle_de_vie(self):
+        avis = self.donner_avis('4')
+        self.assertFalse(NotePlat.objects.exists())
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('approuver_avis', args=[avis.id]))
+        notes = self.notes()
+        self.assertEqual((notes.nb_avis, notes.somme_notes, notes.nb_4), (1, 4, 1))
+        self.assertEqual(notes.dernier_avis_le, avis.created_at)
+
+        self.client.force_login(self.collaborateur)
+        self.client.post(reverse('modifier_avis', args=[avis.id]), {'note': '2'})
+        notes = self.notes()
+        self.assertEqual(notes.repartition, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+        self.assertEqual(notes.moyenne, 2)
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('rejeter_avis', args=[avis.id]))
+        notes = self.notes()
+        self.assertEqual((notes.nb_avis, notes.somme_notes, notes.nb_2), (0, 0, 0))
+        self.assertIsNone(notes.dernier_avis_le)
+        self.assertEqual(recalculer_notes(), [])
+
+    def test_note_invalide_ignoree(self):
+        self.client.force_login(self.collaborateur)
+        self.client.post(reverse('donner_avis_commande', args=[self.commande.id]), {'note': '9'})
+        self.assertFalse(Avis.objects.exists())
+
+    def test_api_lit_les_agregats(self):
+        Avis.objects.create(utilisateur=self.collaborateur, plat=self.plat, note=5, est_approuve=True)
+        Avis.objects.create(utilisateur=self.admin, plat=self.plat, note=3, est_approuve=True)
+        # Écritures hors des vues : le recalcul rattrape l'écart
+        self.assertEqual(recalculer_notes(corriger=False), [self.plat.id])
+        self.assertEqual(recalculer_notes(), [self.plat.id])
+        self.assertEqual(recalculer_notes(), [])
+
+        self.client.force_login(self.collaborateur)
+        with self.assertNumQueries(4):  # session, utilisateur, plat + notes, avis
+            response = self.client.get(reverse('api_avis_plat', args=[self.plat.id]))
+        plat = response.json()['plat']
+        self.assertEqual((plat['moyenne'], plat['nb_avis']), (4, 2))
+        self.assertEqual(plat['repartition'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1})
+
+    def test_statistiques_lisent_les_agregats(self):
+        autre = Plat.objects.create(nom='Eru', description='-')
+        for utilisateur, plat, note in [
+            (self.collaborateur, self.plat, 5), (self.admin, self.plat, 3), (self.collaborateur, autre, 2)
+        ]:
+            Avis.objects.create(utilisateur=utilisateur, plat=plat, note=note, est_approuve=True)
+        Avis.objects.create(utilisateur=self.admin, plat=autre, note=1)
+        recalculer_notes()
+
+        self.client.force_login(self.admin)
+        # session, utilisateur, totaux NotePlat, classement NotePlat, derniers avis
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('statistiques_avis'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats_generales'], {'total_avis': 3, 'moyenne_generale': 10 / 3})
+        self.assertEqual(response.context['repartition_notes'], {1: 0, 2: 1, 3: 1, 4: 0, 5: 1})
+        self.assertEqual(
+            [(plat['plat__nom'], plat['moyenne'], plat['nb_avis']) for plat in response.context['top_plats']],
+            [('Ndolé', 4, 2), ('Eru', 2, 1)]
+        )
+        self.assertEqual(len(response.context['avis_recents']), 3)
@@ -2,16 +2,25 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Avg, Count
+from django.db.models import Q, Avg, Count, F, FloatField, Sum
+from django.db.models.functions import Cast
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.http import JsonResponse
 from datetime import timedelta
-from .models import Avis
+from .models import Avis, NotePlat
+from .services import NOTES, notes_plat, suivi_notes
 from Plats.models import Plat
+from Commandes.activite import activite
 from Commandes.models import Commande
+from main.pagination import paginer
+from Utilisateurs.services import debut_jour
 
 
 
+NOTES_SAISIES = {str(note) for note in NOTES}
+
+
 def is_admin(user):
  
     return user.is_authenticated and user.role == 'admin'
@@ -33,18 +42,19 @@ def mes_avis(request):
     avis = Avis.objects.filter(
         utilisateur=request.user,
         is_deleted=False
-    ).select_related('plat').order_by('-created_at')
+    ).select_related('plat')
+
+    # Résumé d'activité lu par clé primaire plutôt qu'un agrégat sur tous les avis
+    resume = activite(request.user)
+    stats_perso = {
+        'total_avis': resume.nb_avis,
+        'moyenne_perso': resume.moyenne_avis,
+        'avis_approuves': resume.nb_avis_approuves,
+        'avis_en_attente': resume.nb_avis - resume.nb_avis_approuves,
+    }
 
-    stats_perso = avis.aggregate(
-        total_avis=Count('id'),
-        moyenne_perso=Avg('note'),
-        avis_approuves=Count('id', filter=Q(est_approuve=True))
-    )
+    page_obj = paginer(request, avis, ('-created_at', '-id'), 10)
 
-    paginator = Paginator(avis, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
     context = {
         'page_obj': page_obj,
         'stats_perso': stats_perso,
@@ -78,27 +88,30 @@ def donner_avis(request, commande_id=None, plat_id=None):
         commentaire = request.POST.get('commentaire', '')
         est_anonyme = request.POST.get('est_anonyme') == 'on'
         
-        if note:
+        if note in NOTES_SAISIES:
             if avis_existant:
                
-                avis_existant.note = note
-                avis_existant.commentaire = commentaire
-                avis_existant.est_anonyme = est_anonyme
-                avis_existant.is_updated = True
-                avis_existant.updated_by = request.user.id
-                avis_existant.save()
+                with suivi_notes(avis_existant):
+                    avis_existant.note = int(note)
+                    avis_existant.commentaire = commentaire
+                    avis_existant.est_anonyme = est_anonyme
+                    avis_existant.is_updated = True
+                    avis_existant.updated_by = request.user.id
+                    avis_existant.save()
                 messages.success(request, "Votre avis a été modifié avec succès.")
             else:
                 
-                avis = Avis.objects.create(
+                avis = Avis(
                     utilisateur=request.user,
                     plat=plat,
                     commande=commande,
-                    note=note,
+                    note=int(note),
                     commentaire=commentaire,
                     est_anonyme=est_anonyme,
                     created_by=request.user.id
                 )
+                with suivi_notes(avis):
+                    avis.save()
                 messages.success(request, "Merci pour votre avis !")
             
             return redirect('mes_avis')
@@ -121,13 +134,14 @@ def modifier_avis(request, avis_id):
         commentaire = request.POST.get('commentaire', '')
         est_anonyme = request.POST.get('est_anonyme') == 'on'
         
-        if note:
-            avis.note = note
-            avis.commentaire = commentaire
-            avis.est_anonyme = est_anonyme
-            avis.is_updated = True
-            avis.updated_by = request.user.id
-            avis.save()
+        if note in NOTES_SAISIES:
+            with suivi_notes(avis):
+                avis.note = int(note)
+                avis.commentaire = commentaire
+                avis.est_anonyme = est_anonyme
+                avis.is_updated = True
+                avis.updated_by = request.user.id
+                avis.save()
             
             messages.success(request, "Votre avis a été modifié avec succès.")
             return redirect('mes_avis')
@@ -144,10 +158,11 @@ def supprimer_avis(request, avis_id):
     avis = get_object_or_404(Avis, id=avis_id, utilisateur=request.user)
     
     if request.method == 'POST':
-        avis.is_deleted = True
-        avis.deleted_at = timezone.now()
-        avis.deleted_by = request.user.id
-        avis.save()
+        with suivi_notes(avis):
+            avis.is_deleted = True
+            avis.deleted_at = timezone.now()
+            avis.deleted_by = request.user.id
+            avis.save()
         
         messages.success(request, "Votre avis a été supprimé.")
         return redirect('mes_avis')
@@ -184,9 +199,7 @@ def moderation_avis(request):
     )
     
  
-    paginator = Paginator(avis, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginer(request, avis, ('-created_at', '-id'), 20)
     
     plats = Plat.objects.filter(est_actif=True)
     
@@ -206,10 +219,11 @@ def approuver_avis(request, avis_id):
     avis = get_object_or_404(Avis, id=avis_id)
     
     if request.method == 'POST':
-        avis.est_approuve = True
-        avis.is_updated = True
-        avis.updated_by = request.user.id
-        avis.save()
+        with suivi_notes(avis):
+            avis.est_approuve = True
+            avis.is_updated = True
+            avis.updated_by = request.user.id
+            avis.save()
         
         messages.success(request, f"Avis #{avis.id} approuvé avec succès.")
         return redirect('moderation_avis')
@@ -224,10 +238,11 @@ def rejeter_avis(request, avis_id):
     avis = get_object_or_404(Avis, id=avis_id)
     
     if request.method == 'POST':
-        avis.is_deleted = True
-        avis.deleted_at = timezone.now()
-        avis.deleted_by = request.user.id
-        avis.save()
+        with suivi_notes(avis):
+            avis.is_deleted = True
+            avis.deleted_at = timezone.now()
+            avis.deleted_by = request.user.id
+            avis.save()
         
         messages.success(request, f"Avis #{avis.id} rejeté et supprimé.")
         return redirect('moderation_avis')
@@ -239,30 +254,33 @@ def rejeter_avis(request, avis_id):
 @user_passes_test(is_admin)
 def statistiques_avis(request):
 
-    date_debut = request.GET.get('date_debut', (timezone.now() - timedelta(days=30)).date())
-    date_fin = request.GET.get('date_fin', timezone.now().date())
-    
-    avis = Avis.objects.filter(
-        created_at__date__range=[date_debut, date_fin],
-        est_approuve=True,
-        is_deleted=False
-    )
+    date_debut = parse_date(request.GET.get('date_debut', '')) or (timezone.now() - timedelta(days=30)).date()
+    date_fin = parse_date(request.GET.get('date_fin', '')) or timezone.now().date()
 
-    stats_generales = avis.aggregate(
-        total_avis=Count('id'),
-        moyenne_generale=Avg('note'),
-        taux_reponse=Count('id')  
+    # Totaux, moyenne et répartition de tous les avis publiés : une requête sur les
+    # agrégats par plat (NotePlat), sans parcourir la table des avis
+    stats_generales = NotePlat.objects.aggregate(
+        total_avis=Sum('nb_avis', default=0),
+        somme_notes=Sum('somme_notes', default=0),
+        **{f'note_{i}': Sum(f'nb_{i}', default=0) for i in NOTES}
+    )
+    repartition_notes = {i: stats_generales.pop(f'note_{i}') for i in NOTES}
+    somme_notes = stats_generales.pop('somme_notes')
+    stats_generales['moyenne_generale'] = (
+        somme_notes / stats_generales['total_avis'] if stats_generales['total_avis'] else None
     )
 
-    repartition_notes = {}
-    for i in range(1, 6):
-        repartition_notes[i] = avis.filter(note=i).count()
+    top_plats = NotePlat.objects.filter(nb_avis__gt=0).annotate(
+        moyenne=Cast('somme_notes', FloatField()) / F('nb_avis')
+    ).order_by('-moyenne', '-nb_avis').values('plat__nom', 'plat_id', 'moyenne', 'nb_avis')[:10]
 
-    top_plats = avis.values('plat__nom', 'plat_id').annotate(
-        moyenne=Avg('note'),
-        nb_avis=Count('id')
-    ).order_by('-moyenne')[:10]
-    
+    # Seule la liste des derniers avis dépend de la période
+    avis = Avis.objects.filter(
+        created_at__gte=debut_jour(date_debut),
+        created_at__lt=debut_jour(date_fin + timedelta(days=1)),
+        est_approuve=True,
+        is_deleted=False
+    )
     avis_recents = avis.select_related('utilisateur', 'plat').order_by('-created_at')[:10]
     
     context = {
@@ -280,17 +298,19 @@ def statistiques_avis(request):
 def avis_plats(request, plat_id=None):
 
     if plat_id:
-        plat = get_object_or_404(Plat, id=plat_id, est_actif=True)
+        plat = get_object_or_404(Plat.objects.select_related('notes'), id=plat_id, est_actif=True)
         avis = Avis.objects.filter(
             plat=plat,
             est_approuve=True,
             is_deleted=False
         ).select_related('utilisateur').order_by('-created_at')
         
-        stats_plat = avis.aggregate(
-            moyenne=Avg('note'),
-            total=Count('id')
-        )
+        notes = notes_plat(plat)
+        stats_plat = {
+            'moyenne': notes.moyenne,
+            'total': notes.nb_avis,
+            'repartition': notes.repartition
+        }
     else:
         plat = None
         avis = Avis.objects.filter(
@@ -317,27 +337,30 @@ def avis_plats(request, plat_id=None):
 @login_required
 def api_avis_plat(request, plat_id):
     """API pour récupérer les avis d'un plat"""
-    plat = get_object_or_404(Plat, id=plat_id)
+    plat = get_object_or_404(Plat.objects.select_related('notes'), id=plat_id)
+    notes = notes_plat(plat)
     
     avis = Avis.objects.filter(
         plat=plat,
         est_approuve=True,
         is_deleted=False
-    ).select_related('utilisateur').order_by('-created_at')[:10]
-    
+    ).select_related('utilisateur')
+    # ?curseur= : le jeton "suivant" de la réponse précédente
+    page = paginer(request, avis, ('-created_at', '-id'), 10)
+
     data = {
         'plat': {
             'id': plat.id,
             'nom': plat.nom,
-            'moyenne': Avis.objects.filter(
-                plat=plat, 
-                est_approuve=True
-            ).aggregate(moyenne=Avg('note'))['moyenne'] or 0
+            'moyenne': notes.moyenne,
+            'nb_avis': notes.nb_avis,
+            'repartition': notes.repartition
         },
-        'avis': []
+        'avis': [],
+        'suivant': page.curseur_suivant
     }
-    
-    for avis in avis:
+
+    for avis in page:
         data['avis'].append({
             'utilisateur': avis.utilisateur.prenom if not avis.est_anonyme else 'Anonyme',
             'note': avis.note,
@@ -0,0 +1,183 @@
+"""Résumé d'activité par utilisateur (ActiviteUtilisateur), tenu à jour à chaque écriture.
+
+Les services de commande et d'avis décrivent leurs écritures par des
+variations ({utilisateur_id: compteurs à ajouter}) ; appliquer() les reporte
+sous verrou de ligne, dans la transaction de l'écriture, en une lecture et une
+écriture quel que soit le nombre d'utilisateurs (changements de statut en masse).
+"""
+from collections import Counter
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import ActiviteUtilisateur, Commande
+
+COMPTEURS = ('commandes_par_mois', 'commandes_par_statut', 'commandes_par_plat')
+TOTAUX = ('nb_avis', 'somme_notes', 'nb_avis_approuves')
+
+
+def _vide():
+    return {**{champ: Counter() for champ in COMPTEURS}, **dict.fromkeys(TOTAUX, 0)}
+
+
+def mois(date_heure):
+    return timezone.localdate(date_heure).strftime('%Y-%m')
+
+
+def variation_commande(variations, utilisateur_id, created_at, statut, plat_id, delta):
+    """Commande active ajoutée (+1) ou retirée (-1) du résumé de son auteur"""
+    if utilisateur_id is None:
+        return
+    variation = variations.setdefault(utilisateur_id, _vide())
+    variation['commandes_par_mois'][mois(created_at)] += delta
+    variation['commandes_par_statut'][statut] += delta
+    if plat_id is not None:
+        variation['commandes_par_plat'][str(plat_id)] += delta
+
+
+def variation_statut(variations, utilisateur_id, ancien_statut, nouveau_statut):
+    if utilisateur_id is None or ancien_statut == nouveau_statut:
+        return
+    compteur = variations.setdefault(utilisateur_id, _vide())['commandes_par_statut']
+    compteur[ancien_statut] -= 1
+    compteur[nouveau_statut] += 1
+
+
+def variation_avis(variations, utilisateur_id, note, est_approuve, delta):
+    """Avis non supprimé ajouté (+1) ou retiré (-1) du résumé de son auteur"""
+    if utilisateur_id is None:
+        return
+    variation = variations.setdefault(utilisateur_id, _vide())
+    variation['nb_avis'] += delta
+    variation['somme_notes'] += delta * int(note)
+    variation['nb_avis_approuves'] += delta if est_approuve else 0
+
+
+def ajuster_commande(commande, delta, statut=None, plat_id=None):
+    """Répercute une commande active (+1) ou retirée (-1) sur le résumé de son auteur"""
+    variations = {}
+    variation_commande(
+        variations, commande.utilisateur_id, commande.created_at,
+        statut or commande.statut, plat_id or commande.plat_id, delta
+    )
+    appliquer(variations)
+
+
+def ajuster_commandes(commandes, delta):
+    """Répercute un lot de commandes sur les résumés de leurs auteurs, en une lecture et une écriture"""
+    variations = {}
+    for commande in commandes:
+        variation_commande(
+            variations, commande.utilisateur_id, commande.created_at, commande.statut, commande.plat_id, delta
+        )
+    appliquer(variations)
+
+
+def _ajouter(compteur, variation):
+    compteur = dict(compteur)
+    for cle, delta in variation.items():
+        total = compteur.get(cle, 0) + delta
+        if total:
+            compteur[cle] = total
+        else:
+            compteur.pop(cle, None)
+    return compteur
+
+
+def appliquer(variations):
+    """Reporte les variations sur les résumés, verrouillés dans l'ordre des clés (pas d'interblocage)"""
+    variations = {
+        utilisateur_id: variation for utilisateur_id, variation in variations.items()
+        if any(variation[champ] for champ in TOTAUX) or any(any(variation[champ].values()) for champ in COMPTEURS)
+    }
+    if not variations:
+        return
+
+    def verrouiller(utilisateur_ids):
+        activites = ActiviteUtilisateur.objects.select_for_update().filter(pk__in=utilisateur_ids).order_by('pk')
+        return {resume.pk: resume for resume in activites}
+
+    # Sans point de sauvegarde : une erreur annule de toute façon l'écriture appelante
+    with transaction.atomic(savepoint=False):
+        resumes = verrouiller(variations)
+        manquants = [utilisateur_id for utilisateur_id in variations if utilisateur_id not in resumes]
+        if manquants:
+            # Premier passage de l'utilisateur ; ignore_conflicts couvre une création concurrente
+            ActiviteUtilisateur.objects.bulk_create(
+                [ActiviteUtilisateur(utilisateur_id=utilisateur_id) for utilisateur_id in manquants],
+                ignore_conflicts=True
+            )
+            resumes.update(verrouiller(manquants))
+
+        for utilisateur_id, variation in variations.items():
+            resume = resumes[utilisateur_id]
+            for champ in COMPTEURS:
+                setattr(resume, champ, _ajouter(getattr(resume, champ), variation[champ]))
+            for champ in TOTAUX:
+                setattr(resume, champ, getattr(resume, champ) + variation[champ])
+        _enregistrer(resumes.values())
+
+
+def _enregistrer(resumes):
+    """Un UPDATE par résumé, préparé une seule fois (executemany) : bulk_update compilerait
+    un CASE WHEN par champ et par ligne, plus coûteux que l'écriture elle-même"""
+    champs = [ActiviteUtilisateur._meta.get_field(nom) for nom in (*COMPTEURS, *TOTAUX)]
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        quote(ActiviteUtilisateur._meta.db_table),
+        ', '.join(f'{quote(champ.column)} = %s' for champ in champs),
+        quote(ActiviteUtilisateur._meta.pk.column)
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [champ.get_db_prep_save(getattr(resume, champ.attname), connection) for champ in champs] + [resume.pk]
+            for resume in resumes
+        ])
+
+
+def activite(utilisateur):
+    """Résumé de l'utilisateur ; un résumé vide (non enregistré) s'il n'a encore rien commandé"""
+    return ActiviteUtilisateur.objects.filter(pk=utilisateur.pk).first() or ActiviteUtilisateur(utilisateur=utilisateur)
+
+
+def calculer_activite():
+    """Résumés recalculés depuis les commandes et les avis (deux requêtes groupées)"""
+    from Avis.models import Avis
+
+    resumes = {}
+
+    def resume(utilisateur_id):
+        return resumes.setdefault(utilisateur_id, {**{champ: {} for champ in COMPTEURS}, **dict.fromkeys(TOTAUX, 0)})
+
+    lignes = Commande.objects.filter(is_deleted=False, utilisateur__isnull=False).annotate(
+        mois=TruncMonth('created_at')
+    ).values('utilisateur_id', 'mois', 'statut', 'plat_id').annotate(nombre=Count('id')).order_by()
+    for ligne in lignes.iterator():
+        valeurs = resume(ligne['utilisateur_id'])
+        for champ, cle in (
+            ('commandes_par_mois', ligne['mois'].strftime('%Y-%m')),
+            ('commandes_par_statut', ligne['statut']),
+            ('commandes_par_plat', str(ligne['plat_id']) if ligne['plat_id'] is not None else None),
+        ):
+            if cle is not None:
+                valeurs[champ][cle] = valeurs[champ].get(cle, 0) + ligne['nombre']
+
+    lignes = Avis.objects.filter(is_deleted=False, utilisateur__isnull=False).values('utilisateur_id').annotate(
+        nb=Count('id'), somme=Sum('note'), approuves=Count('id', filter=Q(est_approuve=True))
+    ).order_by()
+    for ligne in lignes:
+        valeurs = resume(ligne['utilisateur_id'])
+        valeurs.update(nb_avis=ligne['nb'], somme_notes=ligne['somme'], nb_avis_approuves=ligne['approuves'])
+    return resumes
+
+
+def reconstruire(batch_size=1000):
+    """Recalcule entièrement les résumés. Retourne le nombre d'utilisateurs concernés"""
+    resumes = calculer_activite()
+    with transaction.atomic():
+        ActiviteUtilisateur.objects.all().delete()
+        ActiviteUtilisateur.objects.bulk_create(
+            (ActiviteUtilisateur(utilisateur_id=utilisateur_id, **valeurs) for utilisateur_id, valeurs in resumes.items()),
+            batch_size=batch_size
+        )
+    return len(resumes)
@@ -1,3 +1,102 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from main.pagination import PaginateurPlafonne
+from . import services
+from .models import ActiviteUtilisateur, Commande, HistoriqueStatut, StatCommandeJour
 
-# Register your models here.
+
+def _action_statut(statut, libelle):
+    """Action de changement de statut en masse (mêmes transitions que les écrans cuisine)"""
+    @admin.action(description=f"Passer les commandes sélectionnées à « {libelle} »", permissions=['change'])
+    def action(modeladmin, request, queryset):
+        selection = queryset.count()
+        nombre = services.changer_statut_en_masse(queryset, statut, request.user)
+        modeladmin.message_user(request, f"{nombre} commande(s) passée(s) à « {libelle} ».", messages.SUCCESS)
+        if nombre < selection:
+            modeladmin.message_user(
+                request, f"{selection - nombre} commande(s) ignorée(s) : statut incompatible ou commande annulée.",
+                messages.WARNING
+            )
+    action.__name__ = f'passer_{statut}'
+    return action
+
+
+class HistoriqueStatutInline(admin.TabularInline):
+    model = HistoriqueStatut
+    extra = 0
+    can_delete = False
+    readonly_fields = ('ancien_statut', 'nouveau_statut', 'origine', 'change_le', 'change_par')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Commande)
+class CommandeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'utilisateur', 'menu', 'plat', 'statut', 'created_at', 'is_deleted')
+    # Filtre par période plutôt que date_hierarchy : la hiérarchie lit les mois
+    # distincts de toute la table (DISTINCT sur created_at tronqué : l'index
+    # commande_created_idx ne sert que le tri ci-dessous, pas cette agrégation)
+    list_filter = ('statut', 'is_deleted', 'menu__site', 'created_at')
+    list_select_related = ('utilisateur', 'menu', 'plat')
+    search_fields = ('=id', 'utilisateur__email', 'utilisateur__nom', 'plat__nom')
+    ordering = ('-created_at', '-id')
+    inlines = [HistoriqueStatutInline]
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
+    actions = [
+        _action_statut(statut, libelle)
+        for statut, libelle in Commande.STATUT_CHOICES
+        if statut in services.TRANSITIONS_EN_MASSE
+    ]
+    # Compteurs des plats, statistiques et résumés d'activité suivent les écritures de
+    # Commandes.services : l'admin ne crée pas de commande et n'en change ni le
+    # contenu ni le statut (actions ci-dessus)
+    readonly_fields = (
+        'utilisateur', 'menu', 'plat', 'statut', 'created_at', 'updated_at',
+        'is_deleted', 'deleted_at', 'deleted_by', 'created_by', 'updated_by',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+@admin.register(HistoriqueStatut)
+class HistoriqueStatutAdmin(admin.ModelAdmin):
+    list_display = ('commande', 'ancien_statut', 'nouveau_statut', 'origine', 'change_le', 'change_par')
+    list_filter = ('origine', 'nouveau_statut')
+    list_select_related = ('commande__utilisateur',)
+    raw_id_fields = ('commande',)
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
+
+
+@admin.register(StatCommandeJour)
+class StatCommandeJourAdmin(admin.ModelAdmin):
+    list_display = ('date', 'site', 'menu', 'plat', 'statut', 'nombre')
+    list_filter = ('menu__site', 'statut', 'date')
+    list_select_related = ('menu', 'plat')
+    raw_id_fields = ('menu', 'plat')
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
+
+
+@admin.register(ActiviteUtilisateur)
+class ActiviteUtilisateurAdmin(admin.ModelAdmin):
+    list_display = ('utilisateur', 'nb_commandes', 'nb_avis', 'nb_avis_approuves')
+    list_select_related = ('utilisateur',)
+    search_fields = ('utilisateur__email', 'utilisateur__nom')
+    # Tenu par Commandes.activite ; reconstruire_activite après une correction manuelle
+    readonly_fields = (
+        'utilisateur', 'commandes_par_mois', 'commandes_par_statut', 'commandes_par_plat',
+        'nb_avis', 'somme_notes', 'nb_avis_approuves',
+    )
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,69 @@
+from django.db.models import Aggregate, Count, Q, TextField, Value
+from .models import Commande
+from Plats.models import Plat
+
+STATUTS_CUISINE = ['confirmee', 'prete']
+SEPARATEUR_NOTES = '\x1f'
+
+
+class GroupConcat(Aggregate):
+    """Concaténation des valeurs d'un groupe (GROUP_CONCAT / STRING_AGG)"""
+    function = 'GROUP_CONCAT'
+    output_field = TextField()
+
+    def __init__(self, expression, separateur=SEPARATEUR_NOTES, **extra):
+        super().__init__(expression, Value(separateur), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='STRING_AGG', **extra_context)
+
+
+def commandes_cuisine(date_cible, statuts=STATUTS_CUISINE):
+    return Commande.objects.filter(
+        menu__date=date_cible,
+        statut__in=statuts,
+        is_deleted=False
+    )
+
+
+def consolider(date_cible, sites=None, statuts=STATUTS_CUISINE):
+    """Quantités par site et par plat (clé plat_id), détail par statut et notes, en une requête groupée"""
+    commandes = commandes_cuisine(date_cible, statuts)
+    if sites:
+        commandes = commandes.filter(menu__site__in=sites)
+
+    lignes = list(commandes.values('menu__site', 'plat_id').annotate(
+        quantite=Count('id'),
+        statut_confirmee=Count('id', filter=Q(statut='confirmee')),
+        statut_prete=Count('id', filter=Q(statut='prete')),
+        notes=GroupConcat('notes_speciales', filter=~Q(notes_speciales=''))
+    ).order_by('menu__site'))
+
+    plats = Plat.objects.in_bulk({ligne['plat_id'] for ligne in lignes if ligne['plat_id']})
+
+    consolidation = {site: {'plats_quantites': {}, 'total_commandes': 0} for site in sites or []}
+    for ligne in lignes:
+        plat = plats.get(ligne['plat_id'])
+        site = consolidation.setdefault(ligne['menu__site'], {'plats_quantites': {}, 'total_commandes': 0})
+        # Clé plat_id : deux plats homonymes restent distincts ; None regroupe les plats supprimés
+        site['plats_quantites'][ligne['plat_id']] = {
+            'plat': plat,
+            'nom': plat.nom if plat else '',
+            'quantite': ligne['quantite'],
+            'statut_confirmee': ligne['statut_confirmee'],
+            'statut_prete': ligne['statut_prete'],
+            'notes_speciales': ligne['notes'].split(SEPARATEUR_NOTES) if ligne['notes'] else [],
+        }
+        site['total_commandes'] += ligne['quantite']
+
+    for site in consolidation.values():
+        site['plats_quantites'] = dict(sorted(site['plats_quantites'].items(), key=lambda item: item[1]['nom']))
+    return consolidation
+
+
+def commandes_plat(date_cible, site, plat_id, statuts=STATUTS_CUISINE):
+    """Commandes individuelles d'un plat, chargées seulement quand le plat est déplié"""
+    return commandes_cuisine(date_cible, statuts).filter(
+        menu__site=site,
+        plat_id=plat_id
+    ).select_related('utilisateur', 'plat').order_by('created_at')
@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+TYPES_EVENEMENTS = ['created', 'modified', 'cancelled', 'statuts', 'prete', 'livree']
+
+
+class Abonnement:
+    """File d'événements d'un client SSE, alimentée depuis n'importe quel thread"""
+
+    def __init__(self, bus, canal, taille_max=1000):
+        self.bus = bus
+        self.canal = canal
+        self._loop = asyncio.get_running_loop()
+        self._file = asyncio.Queue(maxsize=taille_max)
+
+    def pousser(self, evenement):
+        self._loop.call_soon_threadsafe(self._ajouter, evenement)
+
+    def _ajouter(self, evenement):
+        # Un client trop lent perd les événements les plus récents plutôt
+        # que de faire grossir la mémoire du serveur
+        if not self._file.full():
+            self._file.put_nowait(evenement)
+
+    async def prochain(self, timeout):
+        """Prochain événement, ou None si rien n'arrive avant timeout secondes"""
+        try:
+            return await asyncio.wait_for(self._file.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def fermer(self):
+        self.bus.desabonner(self)
+
+
+class BusLocal:
+    """Pub/sub en mémoire du processus ; remplaçable par un broker via COMMANDES_BUS_EVENEMENTS"""
+
+    def __init__(self):
+        self._abonnes = defaultdict(set)
+        self._verrou = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def abonner(self, canal):
+        abonnement = Abonnement(self, canal)
+        with self._verrou:
+            self._abonnes[canal].add(abonnement)
+        return abonnement
+
+    def desabonner(self, abonnement):
+        with self._verrou:
+            self._abonnes[abonnement.canal].discard(abonnement)
+            if not self._abonnes[abonnement.canal]:
+                del self._abonnes[abonnement.canal]
+
+    def publier(self, canal, evenement):
+        evenement = dict(evenement, id=next(self._ids))
+        with self._verrou:
+            abonnes = list(self._abonnes.get(canal, ()))
+        for abonnement in abonnes:
+            abonnement.pousser(evenement)
+
+
+_bus = None
+_bus_verrou = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_verrou:
+            if _bus is None:
+                chemin = getattr(settings, 'COMMANDES_BUS_EVENEMENTS', 'Commandes.evenements.BusLocal')
+                _bus = import_string(chemin)()
+    return _bus
+
+
+def canal(site, date_menu):
+    return f"{site}:{date_menu.isoformat()}"
+
+
+def publier_commande(type_evenement, commande, menu, **extra):
+    """Publie un événement de commande une fois la transaction validée"""
+    evenement = {
+        'type': type_evenement,
+        'commande_id': commande.id,
+        'plat_id': commande.plat_id,
+        'statut': commande.statut,
+        'notes_speciales': commande.notes_speciales,
+        **extra
+    }
+    nom_canal = canal(menu.site, menu.date)
+    transaction.on_commit(lambda: get_bus().publier(nom_canal, evenement))
+
+
+def publier_statuts(site, date_menu, statut, commandes):
+    """Un seul événement pour un changement de statut en masse : commandes = [{commande_id, plat_id, ancien_statut}]"""
+    evenement = {'type': 'statuts', 'statut': statut, 'commandes': commandes}
+    nom_canal = canal(site, date_menu)
+    transaction.on_commit(lambda: get_bus().publier(nom_canal, evenement))
+
+
+def format_sse(evenement):
+    return f"id: {evenement['id']}\nevent: {evenement['type']}\ndata: {json.dumps(evenement)}\n\n"
@@ -0,0 +1,247 @@
+"""Export des commandes en CSV ou XLSX, produit en flux.
+
+Les lignes sont lues par lots (iterator) et écrites au fur et à mesure : la
+mémoire reste constante quel que soit le nombre de commandes. Le XLSX est
+écrit directement (zipfile sur un flux non positionnable, chaînes en ligne),
+sans dépendance à une bibliothèque de tableur.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import DecimalField, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from Menus.models import MenuPlat
+from Plats.recherche import ids_plats
+from Utilisateurs.services import debut_jour
+from .models import Commande
+
+TAILLE_LOT = 2000
+
+COLONNES = [
+    ('Commande', 'id'),
+    ('Date de commande', 'created_at'),
+    ('Statut', 'statut'),
+    ('Date du menu', 'menu__date'),
+    ('Site', 'menu__site'),
+    ('Nom', 'utilisateur__nom'),
+    ('Prénom', 'utilisateur__prenom'),
+    ('Email', 'utilisateur__email'),
+    ('Département', 'utilisateur__departement'),
+    ('Plat', 'plat__nom'),
+    ('Prix', 'prix'),
+    ('Notes', 'notes_speciales'),
+]
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def filtrer_commandes(commandes, filtres):
+    """Filtres des pages admin_orders et gestion des commandes : search, status, site (du menu),
+    date, et pour les exports de période date_debut / date_fin (dates de commande incluses)"""
+    recherche = filtres.get('search', '')
+    if recherche:
+        commandes = commandes.filter(
+            Q(utilisateur__nom__icontains=recherche) |
+            Q(utilisateur__prenom__icontains=recherche) |
+            Q(plat_id__in=ids_plats(recherche))
+        )
+    if filtres.get('status'):
+        commandes = commandes.filter(statut=filtres['status'])
+    if filtres.get('site'):
+        commandes = commandes.filter(menu__site=filtres['site'])
+
+    # Bornes sur created_at plutôt que created_at__date : l'index reste utilisable
+    jour = parse_date(filtres.get('date') or '')
+    debut = parse_date(filtres.get('date_debut') or '') or jour
+    fin = parse_date(filtres.get('date_fin') or '') or jour
+    if debut:
+        commandes = commandes.filter(created_at__gte=debut_jour(debut))
+    if fin:
+        commandes = commandes.filter(created_at__lt=debut_jour(fin + timedelta(days=1)))
+    return commandes
+
+
+def lignes_export(commandes):
+    """Valeurs des COLONNES, commande par commande, par lots de TAILLE_LOT"""
+    prix_menu = MenuPlat.objects.filter(
+        menu_id=OuterRef('menu_id'), plat_id=OuterRef('plat_id')
+    ).values('prix')[:1]
+    statuts = dict(Commande.STATUT_CHOICES)
+    fuseau = timezone.get_current_timezone()
+    champs = [champ for _, champ in COLONNES]
+    lignes = commandes.annotate(
+        prix=Subquery(prix_menu, output_field=DecimalField(max_digits=10, decimal_places=2))
+    ).order_by('id').values_list(*champs)
+
+    for ligne in lignes.iterator(chunk_size=TAILLE_LOT):
+        ligne = list(ligne)
+        ligne[1] = ligne[1].astimezone(fuseau).replace(tzinfo=None)
+        ligne[2] = statuts.get(ligne[2], ligne[2])
+        yield ligne
+
+
+def _par_lots(lignes):
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) == TAILLE_LOT:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+# === CSV ===
+
+class _Echo:
+    """Pseudo-fichier : csv.writer renvoie directement la ligne écrite"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def _valeur_csv(valeur):
+    if valeur is None:
+        return ''
+    if isinstance(valeur, datetime):
+        return valeur.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valeur, str) and valeur[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        # Pas de formule exécutée à l'ouverture dans un tableur
+        return "'" + valeur
+    return valeur
+
+
+def flux_csv(lignes):
+    writer = csv.writer(_Echo())
+    # BOM : les tableurs reconnaissent l'UTF-8 (accents des noms)
+    yield '\ufeff' + writer.writerow([titre for titre, _ in COLONNES])
+    for lot in _par_lots(lignes):
+        yield ''.join(writer.writerow([_valeur_csv(valeur) for valeur in ligne]) for ligne in lot)
+
+
+# === XLSX ===
+
+_CARACTERES_INTERDITS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_ORIGINE_EXCEL = datetime(1899, 12, 30)
+_STYLE_DATE, _STYLE_DATE_HEURE = 1, 2
+
+_FICHIERS_XLSX = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Commandes" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+        '</Relationships>'
+    ),
+    # Styles de cellule : 0 standard, 1 date, 2 date et heure
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/>'
+        '<numFmt numFmtId="165" formatCode="dd/mm/yyyy hh:mm"/></numFmts>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+class _FluxSortie:
+    """Destination non positionnable de zipfile : accumule les octets jusqu'au prochain vider()"""
+
+    def __init__(self):
+        self.morceaux = []
+
+    def write(self, donnees):
+        self.morceaux.append(bytes(donnees))
+        return len(donnees)
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        donnees = b''.join(self.morceaux)
+        self.morceaux = []
+        return donnees
+
+
+def _cellule_xlsx(valeur):
+    if valeur is None or valeur == '':
+        return '<c/>'
+    if isinstance(valeur, datetime):
+        return f'<c s="{_STYLE_DATE_HEURE}"><v>{(valeur - _ORIGINE_EXCEL) / timedelta(days=1)!r}</v></c>'
+    if isinstance(valeur, date):
+        return f'<c s="{_STYLE_DATE}"><v>{(valeur - _ORIGINE_EXCEL.date()).days}</v></c>'
+    if isinstance(valeur, (int, float, Decimal)) and not isinstance(valeur, bool):
+        return f'<c><v>{valeur}</v></c>'
+    texte = escape(_CARACTERES_INTERDITS.sub('', str(valeur)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texte}</t></is></c>'
+
+
+def _ligne_xlsx(valeurs):
+    return '<row>' + ''.join(_cellule_xlsx(valeur) for valeur in valeurs) + '</row>'
+
+
+def flux_xlsx(lignes):
+    sortie = _FluxSortie()
+    with zipfile.ZipFile(sortie, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in _FICHIERS_XLSX.items():
+            archive.writestr(nom, contenu)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as feuille:
+            feuille.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _ligne_xlsx(titre for titre, _ in COLONNES)
+            ).encode())
+            for lot in _par_lots(lignes):
+                feuille.write(''.join(_ligne_xlsx(ligne) for ligne in lot).encode())
+                yield sortie.vider()
+            feuille.write(b'</sheetData></worksheet>')
+    yield sortie.vider()
+
+
+def flux_export(format_export, lignes):
+    return flux_csv(lignes) if format_export == 'csv' else flux_xlsx(lignes)
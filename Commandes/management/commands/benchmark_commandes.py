@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connections
+from django.utils import timezone
+from Commandes import services
+from Commandes.models import Commande, StatCommandeJour
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+
+
+def _commander(utilisateur_ids, menu_ids, plat_id, nb_threads):
+    """Commandes d'un processus, sur nb_threads threads ; retourne les erreurs"""
+    utilisateurs = Utilisateur.objects.in_bulk(utilisateur_ids)
+    erreurs = []
+
+    def commander(index):
+        try:
+            services.passer_commande(utilisateurs[utilisateur_ids[index]], menu_ids[index % len(menu_ids)], plat_id)
+        except (OperationalError, services.CommandeRefusee) as e:
+            erreurs.append(str(e))
+        finally:
+            # Comme en fin de requête : rend la connexion au pool ou la garde selon CONN_MAX_AGE
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+        list(executor.map(commander, range(len(utilisateur_ids))))
+    connections.close_all()
+    return erreurs
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit de passer_commande avec des requêtes concurrentes. "
+        "À lancer sur une base jetable, par exemple : "
+        "SAH_SQLITE_PATH=/tmp/bench.sqlite3 python manage.py migrate && "
+        "SAH_SQLITE_PATH=/tmp/bench.sqlite3 SAH_SQLITE_PROFILE=production "
+        "python manage.py benchmark_commandes ; "
+        "avec PostgreSQL : SAH_DB_ENGINE=postgresql python manage.py benchmark_commandes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commandes', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=16, help="Threads par processus")
+        parser.add_argument(
+            '--processus', type=int, default=1,
+            help="Processus (comme les workers d'un serveur d'application), chacun avec --threads threads"
+        )
+
+    def handle(self, *args, **options):
+        nb_commandes = options['commandes']
+        today = timezone.now().date()
+
+        plat = Plat.objects.create(nom='Plat benchmark', description='benchmark')
+        menus = []
+        for i in range(nb_commandes // 200 + 1):
+            menu = Menu.objects.create(
+                jour='lundi', date=today + timedelta(days=3650 + i), site='Danga', est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1),
+                max_commandes=0, titre='benchmark'
+            )
+            MenuPlat.objects.create(menu=menu, plat=plat)
+            menus.append(menu)
+        Utilisateur.objects.bulk_create(
+            Utilisateur(email=f'bench-{i}@benchmark.local', prenom='Bench', nom=str(i))
+            for i in range(nb_commandes)
+        )
+        utilisateur_ids = list(
+            Utilisateur.objects.filter(email__endswith='@benchmark.local').values_list('id', flat=True)
+        )
+        menu_ids = [menu.id for menu in menus]
+        nb_processus = options['processus']
+
+        debut = time.perf_counter()
+        if nb_processus > 1:
+            # Les processus ouvrent leurs propres connexions
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(nb_processus) as pool:
+                erreurs = sum(pool.starmap(_commander, [
+                    (utilisateur_ids[i::nb_processus], menu_ids, plat.id, options['threads'])
+                    for i in range(nb_processus)
+                ]), [])
+        else:
+            erreurs = _commander(utilisateur_ids, menu_ids, plat.id, options['threads'])
+        duree = time.perf_counter() - debut
+
+        enregistrees = Commande.objects.filter(plat=plat, is_deleted=False).count()
+        compteur = sum(MenuPlat.objects.filter(plat=plat).values_list('quantite_commandee', flat=True))
+
+        self.stdout.write(
+            f"Base : {settings.DB_ENGINE} (profil SQLite : {settings.SQLITE_PROFILE}) ; "
+            f"{nb_processus} processus x {options['threads']} threads"
+        )
+        self.stdout.write(f"{enregistrees} commandes en {duree:.2f}s ({enregistrees / duree:.0f} commandes/s)")
+        self.stdout.write(f"Compteur MenuPlat : {compteur} ; erreurs : {len(erreurs)}")
+        if erreurs:
+            self.stdout.write(f"Première erreur : {erreurs[0]}")
+
+        # Nettoyage des données du benchmark
+        Commande.objects.filter(plat=plat).delete()
+        StatCommandeJour.objects.filter(plat=plat).delete()
+        MenuPlat.objects.filter(plat=plat).delete()
+        Menu.objects.filter(id__in=[menu.id for menu in menus]).delete()
+        Utilisateur.objects.filter(email__endswith='@benchmark.local').delete()
+        plat.delete()
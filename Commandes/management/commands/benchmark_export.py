@@ -0,0 +1,114 @@
+import time
+import tracemalloc
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from Commandes import exports
+from Commandes.models import Commande
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+
+UTILISATEURS = 1000
+LOT = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la durée et la mémoire maximale des exports CSV et XLSX sur un grand volume "
+        "de commandes. À lancer sur une base jetable, par exemple : "
+        "SAH_SQLITE_PATH=/tmp/bench.sqlite3 python manage.py migrate && "
+        "SAH_SQLITE_PATH=/tmp/bench.sqlite3 python manage.py benchmark_export --commandes 1000000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commandes', type=int, default=100000)
+        parser.add_argument(
+            '--memoire', action='store_true',
+            help="Seconde passe sous tracemalloc (mémoire Python maximale, plusieurs fois plus lente)"
+        )
+
+    def handle(self, *args, **options):
+        nb_commandes = options['commandes']
+        debut = time.perf_counter()
+        plat, menus = self.creer_donnees(nb_commandes)
+        self.stdout.write(f"Base : {settings.DB_ENGINE} ; {nb_commandes} commandes créées en {time.perf_counter() - debut:.0f}s")
+
+        commandes = Commande.objects.filter(plat=plat, is_deleted=False)
+        try:
+            for format_export in exports.FORMATS:
+                self.mesurer(format_export, commandes)
+            if options['memoire']:
+                for format_export in exports.FORMATS:
+                    self.mesurer_memoire(format_export, commandes)
+        finally:
+            self.nettoyer(plat, menus)
+
+    def creer_donnees(self, nb_commandes):
+        today = timezone.now().date()
+        plat = Plat.objects.create(nom='Plat benchmark export', description='benchmark', prix=1500)
+        nb_menus = -(-nb_commandes // UTILISATEURS)
+        menus = Menu.objects.bulk_create(
+            Menu(
+                jour='lundi', date=today + timedelta(days=3650 + i), site='Danga', est_publie=True,
+                date_limite_commande=timezone.now(), titre='benchmark export'
+            )
+            for i in range(nb_menus)
+        )
+        menus = list(Menu.objects.filter(titre='benchmark export').order_by('id'))
+        MenuPlat.objects.bulk_create(MenuPlat(menu=menu, plat=plat, prix=1500) for menu in menus)
+        Utilisateur.objects.bulk_create(
+            Utilisateur(email=f'export-{i}@benchmark.local', prenom='Bench', nom=f'Export {i}')
+            for i in range(UTILISATEURS)
+        )
+        utilisateurs = list(Utilisateur.objects.filter(email__endswith='@benchmark.local').values_list('id', flat=True))
+
+        # Par lots : bulk_create matérialise sa liste d'objets
+        for debut in range(0, nb_commandes, LOT):
+            Commande.objects.bulk_create([
+                Commande(
+                    utilisateur_id=utilisateurs[i % UTILISATEURS],
+                    menu_id=menus[i // UTILISATEURS].id,
+                    plat=plat,
+                    statut='confirmee',
+                    notes_speciales='sans piment' if i % 7 == 0 else ''
+                )
+                for i in range(debut, min(debut + LOT, nb_commandes))
+            ])
+        return plat, menus
+
+    def exporter(self, format_export, commandes):
+        taille = 0
+        for morceau in exports.flux_export(format_export, exports.lignes_export(commandes)):
+            taille += len(morceau.encode() if isinstance(morceau, str) else morceau)
+        return taille
+
+    def mesurer(self, format_export, commandes):
+        debut = time.perf_counter()
+        taille = self.exporter(format_export, commandes)
+        duree = time.perf_counter() - debut
+        nombre = commandes.count()
+        self.stdout.write(
+            f"{format_export.upper()} : {nombre} lignes en {duree:.1f}s ({nombre / duree:.0f} lignes/s), "
+            f"{taille / 1e6:.1f} Mo"
+        )
+
+    def mesurer_memoire(self, format_export, commandes):
+        tracemalloc.start()
+        self.exporter(format_export, commandes)
+        _, pic = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{format_export.upper()} : mémoire Python maximale {pic / 1e6:.1f} Mo")
+
+    def nettoyer(self, plat, menus):
+        commandes = Commande.objects.filter(plat=plat)
+        while True:
+            ids = list(commandes.values_list('id', flat=True)[:LOT])
+            if not ids:
+                break
+            Commande.objects.filter(id__in=ids).delete()
+        MenuPlat.objects.filter(plat=plat).delete()
+        Menu.objects.filter(id__in=[menu.id for menu in menus]).delete()
+        Utilisateur.objects.filter(email__endswith='@benchmark.local').delete()
+        plat.delete()
@@ -0,0 +1,352 @@
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+from Commandes.models import Commande
+from Menus.models import Menu, MenuPlat
+from Utilisateurs.models import Utilisateur
+from .generer_donnees import DOMAINE
+
+PERCENTILES = (50, 95, 99)
+REDIRECTIONS_MAX = 5
+
+
+def percentile(durees_triees, p):
+    """Percentile au rang le plus proche d'une liste triée"""
+    return durees_triees[max(0, math.ceil(p / 100 * len(durees_triees)) - 1)]
+
+
+def nom_url(chemin):
+    try:
+        return resolve(urlsplit(chemin).path).view_name
+    except Resolver404:
+        return urlsplit(chemin).path
+
+
+class Mesures:
+    """Durées et erreurs par nom d'URL, alimentées par tous les threads"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.par_url = {}
+
+    def ajouter(self, nom, duree_ms, erreur):
+        with self.verrou:
+            durees, erreurs = self.par_url.setdefault(nom, ([], []))
+            durees.append(duree_ms)
+            if erreur:
+                erreurs.append(erreur)
+
+    @staticmethod
+    def resume(durees, erreurs):
+        durees = sorted(durees)
+        resume = {'requetes': len(durees), 'erreurs': len(erreurs)}
+        resume['taux_erreur'] = round(100 * len(erreurs) / len(durees), 2) if durees else 0
+        for p in PERCENTILES:
+            resume[f'p{p}_ms'] = round(percentile(durees, p), 1) if durees else None
+        resume['max_ms'] = round(durees[-1], 1) if durees else None
+        return resume
+
+    def rapport(self):
+        urls = {nom: self.resume(*valeurs) for nom, valeurs in sorted(self.par_url.items())}
+        toutes = [duree for durees, _ in self.par_url.values() for duree in durees]
+        erreurs = [erreur for _, erreurs in self.par_url.values() for erreur in erreurs]
+        premieres = {}
+        for nom, (_, erreurs_url) in self.par_url.items():
+            if erreurs_url:
+                premieres[nom] = erreurs_url[0]
+        return {'urls': urls, 'total': self.resume(toutes, erreurs), 'exemples_erreurs': premieres}
+
+
+class Session:
+    """Navigateur minimal : une connexion HTTP persistante, des cookies, le jeton CSRF"""
+
+    def __init__(self, base, mesures):
+        adresse = urlsplit(base)
+        classe = http.client.HTTPSConnection if adresse.scheme == 'https' else http.client.HTTPConnection
+        self.connexion = classe(adresse.hostname, adresse.port, timeout=30)
+        self.mesures = mesures
+        self.cookies = {}
+
+    def fermer(self):
+        self.connexion.close()
+
+    def _envoyer(self, methode, chemin, donnees):
+        entetes = {'Accept': 'text/html'}
+        if self.cookies:
+            entetes['Cookie'] = '; '.join(f'{nom}={valeur}' for nom, valeur in self.cookies.items())
+        corps = None
+        if donnees is not None:
+            corps = urlencode(donnees, doseq=True)
+            entetes['Content-Type'] = 'application/x-www-form-urlencoded'
+            entetes['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        try:
+            self.connexion.request(methode, chemin, body=corps, headers=entetes)
+        except (http.client.HTTPException, OSError):
+            # Connexion fermée par le serveur entre deux requêtes : une nouvelle tentative
+            self.connexion.close()
+            self.connexion.request(methode, chemin, body=corps, headers=entetes)
+        reponse = self.connexion.getresponse()
+        contenu = reponse.read()
+        for entete in reponse.headers.get_all('Set-Cookie') or []:
+            for nom, morsel in SimpleCookie(entete).items():
+                self.cookies[nom] = morsel.value
+        return reponse, contenu
+
+    def requete(self, methode, chemin, donnees=None, attendu=None):
+        """Envoie la requête et suit les redirections, chaque étape mesurée sous son nom d'URL.
+
+        Retourne le chemin final et le contenu, ou (None, None) en cas d'erreur.
+        attendu : nom d'URL où la première redirection doit mener (sinon erreur).
+        """
+        for etape in range(REDIRECTIONS_MAX):
+            nom = nom_url(chemin)
+            debut = time.perf_counter()
+            try:
+                reponse, contenu = self._envoyer(methode, chemin, donnees)
+            except (http.client.HTTPException, OSError) as e:
+                self.connexion.close()
+                self.mesures.ajouter(nom, (time.perf_counter() - debut) * 1000, f'{type(e).__name__}: {e}')
+                return None, None
+            duree = (time.perf_counter() - debut) * 1000
+
+            erreur = None
+            suivant = reponse.getheader('Location') if reponse.status in (301, 302, 303) else None
+            if reponse.status >= 400:
+                erreur = f'HTTP {reponse.status}'
+            elif etape == 0 and attendu and (not suivant or nom_url(suivant) != attendu):
+                erreur = f'HTTP {reponse.status} vers {suivant and nom_url(suivant)} au lieu de {attendu}'
+            self.mesures.ajouter(nom, duree, erreur)
+            if erreur:
+                return None, None
+            if not suivant:
+                return chemin, contenu
+            chemin, methode, donnees = urlsplit(suivant)._replace(scheme='', netloc='').geturl(), 'GET', None
+        return chemin, None
+
+    def connecter(self, utilisateur, mot_de_passe):
+        self.requete('GET', reverse('login'))
+        chemin, _ = self.requete(
+            'POST', reverse('login'), {'username': utilisateur.email, 'password': mot_de_passe},
+            attendu=utilisateur.get_dashboard_url()
+        )
+        return chemin is not None
+
+
+class Command(BaseCommand):
+    help = (
+        "Rejoue le rush de 11h30-12h contre un serveur local : commandes des collaborateurs, connexions "
+        "aux tableaux de bord et écrans cuisine rafraîchis. Affiche p50/p95/p99 et taux d'erreur par nom "
+        "d'URL ; --sortie enregistre les résultats, --comparer signale les régressions par rapport à une "
+        "référence (benchmarks/charge_midi.json). Données : python manage.py generer_donnees sur la même base "
+        "que le serveur, par exemple SAH_SQLITE_PATH=/tmp/charge.sqlite3 python manage.py runserver --noreload"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duree', type=float, default=60, help="Durée du rush rejoué, en secondes")
+        parser.add_argument('--commandes', type=int, default=300, help="Collaborateurs qui commandent")
+        parser.add_argument('--consultations', type=int, default=100, help="Connexions sans commande")
+        parser.add_argument('--cuisines', type=int, default=2, help="Écrans cuisine rafraîchis en continu")
+        parser.add_argument('--rafraichissement', type=float, default=5, help="Secondes entre deux rafraîchissements")
+        parser.add_argument('--threads', type=int, default=32, help="Navigateurs simultanés au plus")
+        parser.add_argument('--mot-de-passe', default='charge-midi')
+        parser.add_argument('--graine', type=int, default=1)
+        parser.add_argument('--sortie', help="Fichier JSON des résultats")
+        parser.add_argument('--comparer', help="Résultats de référence (JSON)")
+        parser.add_argument('--tolerance', type=float, default=25, help="Hausse de p95 tolérée, en %%")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.mesures = Mesures()
+        hasard = random.Random(options['graine'])
+        menus, commandeurs, consultants, cuisiniers = self.preparer(options, hasard)
+
+        # Arrivées : les commandes se concentrent vers la date limite, les consultations sont étalées
+        duree = options['duree']
+        arrivees = [
+            (hasard.betavariate(3, 1.6) * duree, self.parcours_commande, (utilisateur, menus[utilisateur.site]))
+            for utilisateur in commandeurs
+        ] + [
+            (hasard.uniform(0, duree), self.parcours_consultation, (utilisateur,))
+            for utilisateur in consultants
+        ]
+        arrivees.sort(key=lambda arrivee: arrivee[0])
+
+        debut = time.perf_counter()
+        fin = debut + duree
+        cuisines = [
+            threading.Thread(target=self.parcours_cuisine, args=(prestataire, menus[prestataire.site], fin))
+            for prestataire in cuisiniers
+        ]
+        for thread in cuisines:
+            thread.start()
+        retards = []
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            for instant, parcours, arguments in arrivees:
+                attente = debut + instant - time.perf_counter()
+                if attente > 0:
+                    time.sleep(attente)
+                executor.submit(self.executer, parcours, arguments, debut + instant, retards)
+        for thread in cuisines:
+            thread.join()
+        ecoule = time.perf_counter() - debut
+
+        resultats = self.mesures.rapport()
+        resultats['parametres'] = {
+            cle: options[cle] for cle in (
+                'duree', 'commandes', 'consultations', 'cuisines', 'rafraichissement', 'threads', 'graine'
+            )
+        }
+        resultats['environnement'] = {
+            'date': timezone.now().isoformat(timespec='seconds'),
+            'base': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            'processeurs': os.cpu_count(),
+            'utilisateurs': Utilisateur.objects.filter(email__endswith=f'@{DOMAINE}').count(),
+            'commandes': Commande.objects.count(),
+        }
+        resultats['total']['debit_rps'] = round(resultats['total']['requetes'] / ecoule, 1)
+        resultats['total']['retard_demarrage_p95_ms'] = (
+            round(percentile(sorted(retards), 95), 1) if retards else 0
+        )
+        self.afficher(resultats, ecoule)
+
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(resultats, fichier, ensure_ascii=False, indent=2)
+                fichier.write('\n')
+        if options['comparer']:
+            self.comparer(resultats, options['comparer'], options['tolerance'])
+
+    def preparer(self, options, hasard):
+        """Menus ouverts du prochain jour et comptes générés qui n'y ont pas encore commandé"""
+        limite = timezone.now() + timedelta(seconds=options['duree'] + 60)
+        ouverts = Menu.objects.filter(est_publie=True, is_deleted=False, date_limite_commande__gt=limite)
+        premier = ouverts.order_by('date').first()
+        if premier is None:
+            raise CommandError("Aucun menu ouvert : lancer generer_donnees sur la base du serveur.")
+        menus = {}
+        for menu in ouverts.filter(date=premier.date):
+            menu.plat_ids = list(MenuPlat.objects.filter(menu=menu).values_list('plat_id', flat=True))
+            menus[menu.site] = menu
+
+        comptes = Utilisateur.objects.filter(
+            email__endswith=f'@{DOMAINE}', is_active=True, is_deleted=False, site__in=menus
+        )
+        libres = list(comptes.filter(role='collaborateur').exclude(
+            Exists(Commande.objects.filter(
+                utilisateur=OuterRef('pk'), menu__date=premier.date, is_deleted=False
+            ))
+        ).order_by('id'))
+        hasard.shuffle(libres)
+        if len(libres) < options['commandes'] + options['consultations']:
+            raise CommandError(
+                f"Seulement {len(libres)} collaborateurs sans commande le {premier.date} : "
+                "réduire --commandes / --consultations ou régénérer les données."
+            )
+        commandeurs = libres[:options['commandes']]
+        consultants = libres[options['commandes']:options['commandes'] + options['consultations']]
+        # Quelques administrateurs et secrétaires consultent aussi leur tableau de bord
+        consultants += list(comptes.filter(role__in=['admin', 'secretaire']))
+        cuisiniers = list(comptes.filter(role='prestataire').order_by('id'))
+        cuisiniers = [cuisiniers[i % len(cuisiniers)] for i in range(options['cuisines'])] if cuisiniers else []
+        self.stdout.write(
+            f"Menus du {premier.date} ; {len(commandeurs)} commandes, {len(consultants)} consultations, "
+            f"{len(cuisiniers)} écrans cuisine sur {options['duree']:.0f}s"
+        )
+        return menus, commandeurs, consultants, cuisiniers
+
+    def executer(self, parcours, arguments, prevu, retards):
+        retards.append((time.perf_counter() - prevu) * 1000)
+        try:
+            parcours(*arguments)
+        except Exception as e:
+            self.mesures.ajouter(parcours.__name__, 0, f'{type(e).__name__}: {e}')
+
+    def parcours_commande(self, utilisateur, menu):
+        session = Session(self.options['url'], self.mesures)
+        try:
+            if not session.connecter(utilisateur, self.options['mot_de_passe']):
+                return
+            session.requete('GET', reverse('menus:menus_semaine'))
+            url_commande = reverse('menus:commander_menu', args=[menu.id])
+            session.requete('GET', url_commande)
+            # Les plats en tête de menu sont les plus choisis
+            plat_id = random.choices(menu.plat_ids, [1 / rang for rang in range(1, len(menu.plat_ids) + 1)])[0]
+            session.requete('POST', url_commande, {'plat_id': plat_id}, attendu='menus_semaine')
+        finally:
+            session.fermer()
+
+    def parcours_consultation(self, utilisateur):
+        session = Session(self.options['url'], self.mesures)
+        try:
+            if not session.connecter(utilisateur, self.options['mot_de_passe']):
+                return
+            if utilisateur.role == 'collaborateur':
+                session.requete('GET', reverse('commandes:mes_commandes'))
+                session.requete('GET', reverse('plats:liste_plats'))
+        finally:
+            session.fermer()
+
+    def parcours_cuisine(self, prestataire, menu, fin):
+        session = Session(self.options['url'], self.mesures)
+        parametres = urlencode({'site': menu.site, 'date': menu.date.isoformat()})
+        try:
+            if not session.connecter(prestataire, self.options['mot_de_passe']):
+                return
+            while True:
+                session.requete('GET', f"{reverse('commandes:commandes_prestataire')}?{parametres}")
+                session.requete('GET', reverse('commandes:preparation_commandes'))
+                if time.perf_counter() + self.options['rafraichissement'] >= fin:
+                    return
+                time.sleep(self.options['rafraichissement'])
+        finally:
+            session.fermer()
+
+    def afficher(self, resultats, ecoule):
+        entete = f"{'URL':<45} {'req':>6} {'err %':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+        self.stdout.write(entete)
+        self.stdout.write('-' * len(entete))
+        for nom, resume in [*resultats['urls'].items(), ('TOTAL', resultats['total'])]:
+            self.stdout.write(
+                f"{nom:<45} {resume['requetes']:>6} {resume['taux_erreur']:>6} "
+                + ' '.join(f"{resume[cle]:>8}" for cle in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+            )
+        total = resultats['total']
+        self.stdout.write(
+            f"{ecoule:.1f}s, {total['debit_rps']} requêtes/s, "
+            f"retard au démarrage p95 {total['retard_demarrage_p95_ms']} ms (threads saturés si élevé)"
+        )
+        for nom, erreur in resultats['exemples_erreurs'].items():
+            self.stdout.write(self.style.WARNING(f"{nom} : {erreur}"))
+
+    def comparer(self, resultats, chemin, tolerance):
+        """Signale les URL dont le p95 dépasse la référence de plus de tolerance %, ou qui échouent davantage"""
+        with open(chemin, encoding='utf-8') as fichier:
+            reference = json.load(fichier)
+        regressions = []
+        for nom, resume in resultats['urls'].items():
+            avant = reference['urls'].get(nom)
+            if not avant or not avant['p95_ms']:
+                continue
+            ecart = 100 * (resume['p95_ms'] - avant['p95_ms']) / avant['p95_ms']
+            # Quelques millisecondes d'écart ne sont pas significatives
+            if ecart > tolerance and resume['p95_ms'] - avant['p95_ms'] > 5:
+                regressions.append(f"{nom} : p95 {avant['p95_ms']} -> {resume['p95_ms']} ms (+{ecart:.0f} %)")
+            if resume['taux_erreur'] > avant['taux_erreur']:
+                regressions.append(f"{nom} : erreurs {avant['taux_erreur']} -> {resume['taux_erreur']} %")
+        if regressions:
+            raise CommandError("Régressions par rapport à la référence :\n" + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Aucune régression par rapport à {chemin}"))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from Commandes import services
+
+
+class Command(BaseCommand):
+    help = (
+        "Confirme les commandes en attente des menus dont la date limite est passée (un UPDATE par menu, "
+        "journalisé dans HistoriqueStatut). En service : python manage.py confirmer_commandes ; "
+        "depuis cron : python manage.py confirmer_commandes --une-fois"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Un seul passage puis arrêt")
+        parser.add_argument('--intervalle', type=float, default=60, help="Secondes entre deux passages")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.passage()
+                if options['une_fois']:
+                    return
+                close_old_connections()
+                time.sleep(options['intervalle'])
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt du worker.")
+
+    def passage(self):
+        confirmees = services.confirmer_commandes_echues()
+        for menu_id, nombre in confirmees.items():
+            self.stdout.write(f"Menu {menu_id} : {nombre} commande(s) confirmée(s)")
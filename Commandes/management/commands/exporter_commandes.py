@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from Commandes import exports
+from Commandes.models import Commande
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte l'historique des commandes (paie, prestataire) en CSV ou XLSX, en flux : "
+        "python manage.py exporter_commandes --format xlsx --date-debut 2026-09-01 "
+        "--date-fin 2026-09-30 --sortie commandes-septembre.xlsx"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--sortie', help="Fichier de sortie (sortie standard par défaut, CSV uniquement)")
+        parser.add_argument('--search', default='')
+        parser.add_argument('--status', default='')
+        parser.add_argument('--site', default='')
+        parser.add_argument('--date', default='')
+        parser.add_argument('--date-debut', dest='date_debut', default='')
+        parser.add_argument('--date-fin', dest='date_fin', default='')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'xlsx' and not options['sortie']:
+            raise CommandError("--sortie est obligatoire pour le format xlsx")
+
+        commandes = exports.filtrer_commandes(Commande.objects.filter(is_deleted=False), options)
+        flux = exports.flux_export(options['format'], exports.lignes_export(commandes))
+
+        if not options['sortie']:
+            for morceau in flux:
+                sys.stdout.write(morceau)
+            return
+        mode = 'w' if options['format'] == 'csv' else 'wb'
+        encodage = {'encoding': 'utf-8', 'newline': ''} if options['format'] == 'csv' else {}
+        with open(options['sortie'], mode, **encodage) as fichier:
+            for morceau in flux:
+                fichier.write(morceau)
+        self.stderr.write(self.style.SUCCESS(f"Export écrit dans {options['sortie']}"))
@@ -0,0 +1,245 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from Avis.models import Avis
+from Avis.services import recalculer_notes
+from Commandes import activite, statistiques
+from Commandes.models import Commande
+from Commandes.services import reconcilier_compteurs
+from Menus.models import Menu, MenuPlat
+from Plats.models import CategoriePlat, Plat
+from Plats.recherche import reindexer
+from Utilisateurs.models import DEPARTEMENT_CHOICES, SITE_CHOICES, Utilisateur
+
+# Domaine des comptes générés : charge_midi les retrouve, une seconde génération est refusée
+DOMAINE = 'charge.sah'
+
+PRENOMS = [
+    'Awa', 'Brice', 'Carine', 'Didier', 'Estelle', 'Fabrice', 'Grace', 'Hervé', 'Inès', 'Joël',
+    'Kevin', 'Laure', 'Marius', 'Nadège', 'Olivier', 'Patricia', 'Rodrigue', 'Sandrine', 'Thierry', 'Vanessa',
+]
+NOMS = [
+    'Atangana', 'Bekono', 'Essomba', 'Fouda', 'Kamga', 'Mbarga', 'Ngono', 'Nkoulou', 'Onana', 'Tchoua',
+    'Biya', 'Eto', 'Manga', 'Njoya', 'Owona', 'Simo', 'Tagne', 'Wandji', 'Yondo', 'Zambo',
+]
+CATEGORIES = {
+    'Plats traditionnels': ['Ndolé', 'Poulet DG', 'Eru', 'Koki', 'Okok', 'Mbongo tchobi', 'Sauce jaune', 'Achu'],
+    'Grillades': ['Poisson braisé', 'Soya', 'Brochettes de bœuf', 'Poulet braisé', 'Porc grillé'],
+    'Végétarien': ['Haricots rouges', 'Légumes sautés', 'Omelette aux légumes', 'Salade composée'],
+    'International': ['Riz cantonais', 'Spaghetti bolognaise', 'Couscous', 'Hachis parmentier'],
+}
+ACCOMPAGNEMENTS = ['', 'et plantains', 'et riz', 'et frites', 'et miondo', 'et bâton de manioc']
+ALLERGENES = ['', '', 'arachides', 'gluten', 'crustacés', 'lactose', 'œufs']
+COMMENTAIRES = {
+    1: ['Froid et sans goût.', 'Portion très insuffisante.'],
+    2: ['Trop salé.', 'Bof, déjà mieux réussi.'],
+    3: ['Correct.', 'Sans plus.', ''],
+    4: ['Bon plat.', 'Bien assaisonné.', ''],
+    5: ['Excellent !', 'Comme à la maison.', ''],
+}
+PLATS_PAR_MENU = 5
+# Part des commandes passées dans la dernière demi-heure avant la date limite (11h30-12h)
+PART_RUSH = 0.45
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données réaliste pour les tests de charge : utilisateurs répartis par site et "
+        "département, plats, menus de plusieurs semaines (jusqu'à la semaine prochaine), commandes et avis. "
+        "À lancer sur une base jetable, par exemple : "
+        "SAH_SQLITE_PATH=/tmp/charge.sqlite3 python manage.py migrate && "
+        "SAH_SQLITE_PATH=/tmp/charge.sqlite3 python manage.py generer_donnees --utilisateurs 20000 --semaines 52 "
+        "(environ 3,5 millions de commandes)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateurs', type=int, default=2000)
+        parser.add_argument('--plats', type=int, default=60)
+        parser.add_argument('--semaines', type=int, default=8, help="Semaines passées (avec commandes et avis)")
+        parser.add_argument('--mot-de-passe', default='charge-midi', help="Mot de passe de tous les comptes générés")
+        parser.add_argument('--graine', type=int, default=2024, help="Graine aléatoire : même graine, mêmes données")
+        parser.add_argument('--lot', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if Utilisateur.objects.filter(email__endswith=f'@{DOMAINE}').exists():
+            raise CommandError(f"Des comptes @{DOMAINE} existent déjà : utiliser une base vide.")
+        self.hasard = random.Random(options['graine'])
+        self.lot = options['lot']
+        debut = time.perf_counter()
+
+        with transaction.atomic():
+            utilisateurs = self.creer_utilisateurs(options['utilisateurs'], options['mot_de_passe'])
+            plats = self.creer_plats(options['plats'])
+            menus = self.creer_menus(options['semaines'], plats)
+        self.stdout.write(f"{len(utilisateurs)} utilisateurs, {len(plats)} plats, {len(menus)} menus")
+
+        nb_commandes, nb_avis = self.creer_commandes(utilisateurs, plats, menus)
+        self.stdout.write(f"{nb_commandes} commandes, {nb_avis} avis")
+
+        # Données dérivées, comme après un import
+        reconcilier_compteurs()
+        statistiques.reconstruire()
+        activite.reconstruire()
+        recalculer_notes()
+        reindexer()
+        self.stdout.write(f"Terminé en {time.perf_counter() - debut:.0f}s")
+
+    def creer_utilisateurs(self, nombre, mot_de_passe):
+        # Un seul hachage pour tous les comptes : la génération reste rapide
+        empreinte = make_password(mot_de_passe)
+        departements = [code for code, _ in DEPARTEMENT_CHOICES]
+        sites = [site for site, _ in SITE_CHOICES]
+        roles = ['admin'] + ['prestataire'] * 3 + ['secretaire'] * 2
+
+        def utilisateur(i):
+            role = roles[i] if i < len(roles) else 'collaborateur'
+            email = f'{role}{i}@{DOMAINE}'
+            return Utilisateur(
+                email=email,
+                username=email,
+                password=empreinte,
+                prenom=self.hasard.choice(PRENOMS),
+                nom=self.hasard.choice(NOMS),
+                role=role,
+                # Danga est le plus grand site
+                site=sites[0] if self.hasard.random() < 0.6 else sites[1],
+                departement=self.hasard.choice(departements),
+                is_staff=role == 'admin',
+            )
+
+        Utilisateur.objects.bulk_create((utilisateur(i) for i in range(nombre)), batch_size=self.lot)
+        return list(Utilisateur.objects.filter(email__endswith=f'@{DOMAINE}').values('id', 'role', 'site'))
+
+    def creer_plats(self, nombre):
+        categories = {nom: CategoriePlat.objects.create(nom=nom) for nom in CATEGORIES}
+        noms = [
+            (categorie, f'{base} {accompagnement}'.strip())
+            for accompagnement in ACCOMPAGNEMENTS
+            for categorie, bases in CATEGORIES.items()
+            for base in bases
+        ]
+        plats = [
+            Plat(
+                nom=nom if i < len(noms) else f'{nom} ({i // len(noms) + 1})',
+                description=f"{nom}, préparé le jour même par la cuisine du site.",
+                categorie=categories[categorie],
+                allergenes=self.hasard.choice(ALLERGENES),
+                prix=Decimal(self.hasard.choice([1000, 1500, 1500, 2000, 2500])),
+            )
+            for i, (categorie, nom) in enumerate(noms[j % len(noms)] for j in range(nombre))
+        ]
+        plats = Plat.objects.bulk_create(plats, batch_size=self.lot)
+        # Popularité en loi de Zipf et qualité propre à chaque plat (note moyenne)
+        rangs = list(range(1, len(plats) + 1))
+        self.hasard.shuffle(rangs)
+        for plat, rang in zip(plats, rangs):
+            plat.popularite = 1 / rang ** 0.8
+            plat.qualite = min(4.8, max(2.2, self.hasard.gauss(3.8, 0.5)))
+        return plats
+
+    def creer_menus(self, semaines, plats):
+        aujourdhui = timezone.localdate()
+        lundi = aujourdhui - timedelta(days=aujourdhui.weekday(), weeks=semaines)
+        fin = aujourdhui - timedelta(days=aujourdhui.weekday()) + timedelta(weeks=2)
+        sites = [site for site, _ in SITE_CHOICES]
+        jours = [jour for jour, _ in Menu.JOURS_SEMAINE]
+
+        menus = []
+        jour_menu = lundi
+        while jour_menu < fin:
+            if jour_menu.weekday() < len(jours):
+                for site in sites:
+                    menus.append(Menu(
+                        jour=jours[jour_menu.weekday()],
+                        date=jour_menu,
+                        site=site,
+                        titre=f"Menu du {jour_menu:%d/%m}",
+                        est_publie=True,
+                        date_limite_commande=timezone.make_aware(datetime.combine(jour_menu, datetime.min.time()))
+                        + timedelta(hours=12),
+                        # Pas de plafond : toute la population du site peut commander
+                        max_commandes=0,
+                    ))
+            jour_menu += timedelta(days=1)
+        menus = Menu.objects.bulk_create(menus, batch_size=self.lot)
+
+        poids = [plat.popularite for plat in plats]
+        menu_plats = []
+        for menu in menus:
+            choisis = set()
+            while len(choisis) < min(PLATS_PAR_MENU, len(plats)):
+                choisis.add(self.hasard.choices(range(len(plats)), poids)[0])
+            menu.plats_proposes = [plats[i] for i in sorted(choisis)]
+            menu_plats.extend(MenuPlat(menu=menu, plat=plat, prix=plat.prix) for plat in menu.plats_proposes)
+        MenuPlat.objects.bulk_create(menu_plats, batch_size=self.lot)
+        return menus
+
+    def heure_commande(self, menu):
+        """Heure de commande : rush de la dernière demi-heure, sinon étalée sur les jours précédents"""
+        if self.hasard.random() < PART_RUSH:
+            avance = timedelta(minutes=self.hasard.uniform(0, 30))
+        else:
+            avance = timedelta(hours=min(96, 0.5 + self.hasard.expovariate(1 / 20)))
+        return menu.date_limite_commande - avance
+
+    def creer_commandes(self, utilisateurs, plats, menus):
+        maintenant = timezone.now()
+        collaborateurs = {}
+        for utilisateur in utilisateurs:
+            if utilisateur['role'] == 'collaborateur':
+                # Assiduité propre à chaque collaborateur (en moyenne deux repas sur trois)
+                utilisateur['assiduite'] = self.hasard.betavariate(4, 2)
+                collaborateurs.setdefault(utilisateur['site'], []).append(utilisateur)
+
+        nb_commandes = nb_avis = 0
+        commandes = []
+        for menu in menus:
+            if menu.date_limite_commande >= maintenant:
+                continue
+            poids = [plat.popularite for plat in menu.plats_proposes]
+            for utilisateur in collaborateurs.get(menu.site, []):
+                if self.hasard.random() >= utilisateur['assiduite']:
+                    continue
+                plat = self.hasard.choices(menu.plats_proposes, poids)[0]
+                cree_le = self.heure_commande(menu)
+                annulee = self.hasard.random() < 0.03
+                commande = Commande(
+                    utilisateur_id=utilisateur['id'], menu=menu, plat=plat, created_at=cree_le,
+                    statut='annulee' if annulee else 'livree', is_deleted=annulee,
+                    deleted_at=cree_le + timedelta(minutes=10) if annulee else None,
+                    notes_speciales='Sans piment' if self.hasard.random() < 0.05 else '',
+                    created_by=utilisateur['id'],
+                )
+                commandes.append(commande)
+                if len(commandes) == self.lot:
+                    nb_avis += self.enregistrer(commandes)
+                    nb_commandes += len(commandes)
+                    commandes = []
+        nb_avis += self.enregistrer(commandes)
+        return nb_commandes + len(commandes), nb_avis
+
+    def enregistrer(self, commandes):
+        """Insère un lot de commandes puis les avis d'une partie des commandes livrées"""
+        with transaction.atomic():
+            Commande.objects.bulk_create(commandes)
+            avis = []
+            for commande in commandes:
+                if commande.is_deleted or self.hasard.random() >= 0.15:
+                    continue
+                note = min(5, max(1, round(self.hasard.gauss(commande.plat.qualite, 0.9))))
+                avis.append(Avis(
+                    utilisateur_id=commande.utilisateur_id, plat=commande.plat, commande=commande, note=note,
+                    commentaire=self.hasard.choice(COMMENTAIRES[note]),
+                    est_anonyme=self.hasard.random() < 0.1,
+                    est_approuve=self.hasard.random() < 0.92,
+                    created_at=commande.menu.date_limite_commande
+                    + timedelta(hours=1 + self.hasard.expovariate(1 / 20)),
+                    created_by=commande.utilisateur_id,
+                ))
+            Avis.objects.bulk_create(avis)
+        return len(avis)
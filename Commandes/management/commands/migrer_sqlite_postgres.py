@@ -0,0 +1,106 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.migrations.executor import MigrationExecutor
+from Plats.recherche import reindexer
+
+
+class Command(BaseCommand):
+    help = (
+        "Copie par lots la base SQLite (alias sqlite_source) dans la base PostgreSQL "
+        "par défaut, en conservant les clés primaires puis en recalant les séquences. "
+        "La base cible doit être migrée au préalable : "
+        "SAH_DB_ENGINE=postgresql python manage.py migrate && "
+        "SAH_DB_ENGINE=postgresql python manage.py migrer_sqlite_postgres"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='sqlite_source')
+        parser.add_argument('--cible', default='default')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        source, cible = options['source'], options['cible']
+        if source not in connections.settings:
+            raise CommandError(f"Alias de base inconnu : {source} (SAH_DB_ENGINE=postgresql ?)")
+        connexion_cible = connections[cible]
+        if connexion_cible.vendor != 'postgresql':
+            raise CommandError(f"La base cible '{cible}' n'est pas PostgreSQL.")
+        for alias in (source, cible):
+            executor = MigrationExecutor(connections[alias])
+            if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                raise CommandError(f"Migrations non appliquées sur '{alias}' : python manage.py migrate --database {alias}")
+
+        modeles = [
+            modele for modele in apps.get_models(include_auto_created=True)
+            if modele._meta.managed and not modele._meta.proxy
+            and router.allow_migrate_model(cible, modele)
+        ]
+        tables = [modele._meta.db_table for modele in modeles]
+
+        if options['interactive']:
+            reponse = input(
+                f"Les tables de '{cible}' ({len(tables)}) vont être vidées puis remplies "
+                f"depuis '{source}'. Continuer ? (oui/non) : "
+            )
+            if reponse != 'oui':
+                raise CommandError("Migration annulée.")
+
+        with transaction.atomic(using=cible):
+            with connexion_cible.cursor() as cursor:
+                # Les clés étrangères Django sont DEFERRABLE : l'ordre des tables est libre
+                cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+                for sql in connexion_cible.ops.sql_flush(no_style(), tables, allow_cascade=True):
+                    cursor.execute(sql)
+
+                for modele in modeles:
+                    nombre = self.copier_table(modele, source, cursor, connexion_cible, options['batch_size'])
+                    self.stdout.write(f"{modele._meta.label} : {nombre} lignes")
+
+                for sql in connexion_cible.ops.sequence_reset_sql(no_style(), modeles):
+                    cursor.execute(sql)
+
+            # L'index de recherche des plats n'est pas un modèle : reconstruit sur la cible
+            reindexer(connexion=connexion_cible)
+
+        self.verifier(modeles, source, cible)
+
+    def copier_table(self, modele, source, cursor, connexion_cible, batch_size):
+        """INSERT par lots des lignes brutes : pas de save() ni de auto_now"""
+        champs = modele._meta.concrete_fields
+        colonnes = ', '.join(connexion_cible.ops.quote_name(champ.column) for champ in champs)
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connexion_cible.ops.quote_name(modele._meta.db_table),
+            colonnes,
+            ', '.join(['%s'] * len(champs))
+        )
+        lignes = modele._base_manager.using(source).order_by('pk').values_list(
+            *[champ.attname for champ in champs]
+        ).iterator(chunk_size=batch_size)
+
+        nombre = 0
+        lot = []
+        for ligne in lignes:
+            lot.append([
+                champ.get_db_prep_save(valeur, connection=connexion_cible)
+                for champ, valeur in zip(champs, ligne)
+            ])
+            if len(lot) >= batch_size:
+                cursor.executemany(sql, lot)
+                nombre += len(lot)
+                lot = []
+        if lot:
+            cursor.executemany(sql, lot)
+            nombre += len(lot)
+        return nombre
+
+    def verifier(self, modeles, source, cible):
+        ecarts = [
+            modele._meta.label for modele in modeles
+            if modele._base_manager.using(source).count() != modele._base_manager.using(cible).count()
+        ]
+        if ecarts:
+            raise CommandError(f"Nombres de lignes différents pour : {', '.join(ecarts)}")
+        self.stdout.write(self.style.SUCCESS(f"{len(modeles)} tables copiées, nombres de lignes identiques."))
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from Commandes.services import reconcilier_compteurs
+from Menus.models import Menu
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule MenuPlat.quantite_commandee depuis les commandes actives et corrige les écarts "
+        "(écritures hors Commandes.services : shell, admin, loaddata). Sans option : semaine courante, "
+        "à lancer souvent depuis cron ; --tout reprend l'historique semaine par semaine, de nuit. "
+        "--verifier se contente de signaler les écarts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', help="Première date de menu (AAAA-MM-JJ)")
+        parser.add_argument('--fin', help="Dernière date de menu (AAAA-MM-JJ)")
+        parser.add_argument('--tout', action='store_true', help="Tout l'historique, une semaine par transaction")
+        parser.add_argument('--verifier', action='store_true', help="Signale les écarts sans les corriger")
+
+    def handle(self, *args, **options):
+        ecarts = []
+        for debut, fin in self.periodes(options):
+            ecarts += reconcilier_compteurs(debut, fin, corriger=not options['verifier'])
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("Compteurs des plats à jour."))
+            return
+        for menu_id, plat_id, enregistre, reel in ecarts:
+            self.stdout.write(f"Menu {menu_id}, plat {plat_id} : {enregistre} enregistré(s), {reel} commande(s)")
+        if options['verifier']:
+            self.stdout.write(self.style.WARNING(f"{len(ecarts)} compteur(s) en écart."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(ecarts)} compteur(s) corrigé(s)."))
+
+    def periodes(self, options):
+        if options['tout']:
+            bornes = Menu.objects.aggregate(debut=Min('date'), fin=Max('date'))
+            if bornes['debut'] is None:
+                return []
+            debut = bornes['debut'] - timedelta(days=bornes['debut'].weekday())
+            # Une transaction courte par semaine : les menus ouverts ne restent pas verrouillés
+            return [
+                (lundi, lundi + timedelta(days=6))
+                for lundi in (debut + timedelta(weeks=i) for i in range((bornes['fin'] - debut).days // 7 + 1))
+            ]
+
+        if options['debut'] or options['fin']:
+            debut = self.date(options['debut']) if options['debut'] else None
+            fin = self.date(options['fin']) if options['fin'] else None
+            return [(debut, fin)]
+
+        aujourdhui = timezone.localdate()
+        lundi = aujourdhui - timedelta(days=aujourdhui.weekday())
+        return [(lundi, lundi + timedelta(days=6))]
+
+    def date(self, valeur):
+        date = parse_date(valeur)
+        if date is None:
+            raise CommandError(f"Date invalide : {valeur} (format AAAA-MM-JJ)")
+        return date
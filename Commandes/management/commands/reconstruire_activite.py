@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Commandes import activite
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les résumés d'activité ActiviteUtilisateur à partir des commandes et des avis"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        nombre = activite.reconstruire(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} résumés d'activité reconstruits."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Commandes import statistiques
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table pré-agrégée StatCommandeJour à partir des commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        nombre = statistiques.reconstruire(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} lignes statistiques reconstruites."))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commandes', '0005_alter_commande_unique_together'),
+        ('Menus', '0003_menu_description_menu_titre_menuplat_prix_and_more'),
+        ('Plats', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCommandeJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('site', models.CharField(blank=True, max_length=100)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('confirmee', 'Confirmée'), ('prete', 'Prête'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('nombre', models.IntegerField(default=0)),
+                ('menu', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Menus.menu')),
+                ('plat', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Plats.plat')),
+            ],
+            options={
+                'ordering': ['date', 'site'],
+                'unique_together': {('date', 'site', 'menu', 'plat', 'statut')},
+            },
+        ),
+    ]
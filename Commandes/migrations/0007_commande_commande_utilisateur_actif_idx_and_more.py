@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commandes', '0006_statcommandejour'),
+        ('Menus', '0004_menu_menu_publie_date_site_idx_and_more'),
+        ('Plats', '0003_plat_plat_actif_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['utilisateur', '-created_at'], name='commande_utilisateur_actif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['menu', 'statut'], name='commande_menu_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at'], name='commande_created_actif_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commandes', '0007_commande_commande_utilisateur_actif_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoriqueStatut',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancien_statut', models.CharField(choices=[('en_attente', 'En attente'), ('confirmee', 'Confirmée'), ('prete', 'Prête'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('nouveau_statut', models.CharField(choices=[('en_attente', 'En attente'), ('confirmee', 'Confirmée'), ('prete', 'Prête'), ('livree', 'Livrée'), ('annulee', 'Annulée')], max_length=20)),
+                ('origine', models.CharField(choices=[('manuel', 'Manuel'), ('automatique', 'Automatique (date limite passée)')], default='manuel', max_length=20)),
+                ('change_le', models.DateTimeField(default=django.utils.timezone.now)),
+                ('change_par', models.IntegerField(blank=True, null=True)),
+                ('commande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historique_statuts', to='Commandes.commande')),
+            ],
+            options={
+                'ordering': ['change_le'],
+                'indexes': [models.Index(fields=['commande', 'change_le'], name='historique_statut_commande_idx')],
+            },
+        ),
+    ]
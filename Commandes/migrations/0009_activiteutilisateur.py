@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def calculer_activite(apps, schema_editor):
+    # Même calcul que Commandes.activite.calculer_activite, sur les modèles historiques
+    Commande = apps.get_model('Commandes', 'Commande')
+    Avis = apps.get_model('Avis', 'Avis')
+    ActiviteUtilisateur = apps.get_model('Commandes', 'ActiviteUtilisateur')
+    alias = schema_editor.connection.alias
+    resumes = {}
+
+    def resume(utilisateur_id):
+        return resumes.setdefault(utilisateur_id, ActiviteUtilisateur(
+            utilisateur_id=utilisateur_id, commandes_par_mois={}, commandes_par_statut={}, commandes_par_plat={}
+        ))
+
+    lignes = Commande.objects.using(alias).filter(is_deleted=False, utilisateur__isnull=False).annotate(
+        mois=TruncMonth('created_at')
+    ).values('utilisateur_id', 'mois', 'statut', 'plat_id').annotate(nombre=Count('id')).order_by()
+    for ligne in lignes.iterator():
+        activite = resume(ligne['utilisateur_id'])
+        for compteur, cle in (
+            (activite.commandes_par_mois, ligne['mois'].strftime('%Y-%m')),
+            (activite.commandes_par_statut, ligne['statut']),
+            (activite.commandes_par_plat, str(ligne['plat_id']) if ligne['plat_id'] is not None else None),
+        ):
+            if cle is not None:
+                compteur[cle] = compteur.get(cle, 0) + ligne['nombre']
+
+    lignes = Avis.objects.using(alias).filter(is_deleted=False, utilisateur__isnull=False).values(
+        'utilisateur_id'
+    ).annotate(nb=Count('id'), somme=Sum('note'), approuves=Count('id', filter=Q(est_approuve=True))).order_by()
+    for ligne in lignes:
+        activite = resume(ligne['utilisateur_id'])
+        activite.nb_avis, activite.somme_notes, activite.nb_avis_approuves = (
+            ligne['nb'], ligne['somme'], ligne['approuves']
+        )
+    ActiviteUtilisateur.objects.using(alias).bulk_create(resumes.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Avis', '0006_noteplat'),
+        ('Commandes', '0008_historiquestatut'),
+        ('Utilisateurs', '0003_utilisateur_nom_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiviteUtilisateur',
+            fields=[
+                ('utilisateur', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activite', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('commandes_par_mois', models.JSONField(default=dict)),
+                ('commandes_par_statut', models.JSONField(default=dict)),
+                ('commandes_par_plat', models.JSONField(default=dict)),
+                ('nb_avis', models.PositiveIntegerField(default=0)),
+                ('somme_notes', models.PositiveIntegerField(default=0)),
+                ('nb_avis_approuves', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(calculer_activite, migrations.RunPython.noop),
+    ]
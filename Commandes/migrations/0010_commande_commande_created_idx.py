@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Commandes', '0009_activiteutilisateur'),
+        ('Menus', '0004_menu_menu_publie_date_site_idx_and_more'),
+        ('Plats', '0004_plats_recherche'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['created_at', 'id'], name='commande_created_idx'),
+        ),
+    ]
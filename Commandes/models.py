@@ -27,8 +27,119 @@ class Commande(models.Model):
     deleted_by = models.IntegerField(null=True, blank=True)
     
     def __str__(self):
+        # Utilisateur supprimé (SET_NULL) : pas d'erreur dans l'admin et les journaux
+        if self.utilisateur is None:
+            return f"Commande #{self.id}"
         return f"Commande #{self.id} - {self.utilisateur.prenom} {self.utilisateur.nom}"
     
     class Meta:
         unique_together = ['utilisateur', 'menu', 'plat']
         ordering = ['-created_at']
+        # Index partiels : seules les commandes non supprimées sont lues par les vues
+        indexes = [
+            # Historique d'un collaborateur (mes commandes, dashboard, avis possibles)
+            models.Index(
+                fields=['utilisateur', '-created_at'],
+                condition=models.Q(is_deleted=False),
+                name='commande_utilisateur_actif_idx'
+            ),
+            # Consolidation cuisine et nombre de commandes par menu
+            models.Index(
+                fields=['menu', 'statut'],
+                condition=models.Q(is_deleted=False),
+                name='commande_menu_statut_idx'
+            ),
+            # Gestion admin et commandes récentes, triées par date
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_deleted=False),
+                name='commande_created_actif_idx'
+            ),
+            # Liste de l'admin Django, supprimées comprises : tri -created_at, -id seulement
+            models.Index(fields=['created_at', 'id'], name='commande_created_idx'),
+        ]
+
+
+class StatCommandeJour(models.Model):
+    """Nombre de commandes actives par jour, site, menu, plat et statut (pré-agrégé)"""
+    date = models.DateField()
+    site = models.CharField(max_length=100, blank=True)
+    menu = models.ForeignKey('Menus.Menu', on_delete=models.SET_NULL, null=True, blank=True)
+    plat = models.ForeignKey('Plats.Plat', on_delete=models.SET_NULL, null=True, blank=True)
+    statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    nombre = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.site} - {self.plat_id} ({self.statut}) : {self.nombre}"
+
+    class Meta:
+        unique_together = ['date', 'site', 'menu', 'plat', 'statut']
+        ordering = ['date', 'site']
+
+
+class HistoriqueStatut(models.Model):
+    """Journal des changements de statut d'une commande, manuels ou automatiques"""
+    ORIGINE_CHOICES = [
+        ('manuel', 'Manuel'),
+        ('automatique', 'Automatique (date limite passée)'),
+    ]
+
+    commande = models.ForeignKey(Commande, on_delete=models.CASCADE, related_name='historique_statuts')
+    ancien_statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    nouveau_statut = models.CharField(max_length=20, choices=Commande.STATUT_CHOICES)
+    origine = models.CharField(max_length=20, choices=ORIGINE_CHOICES, default='manuel')
+    change_le = models.DateTimeField(default=timezone.now)
+    change_par = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Commande #{self.commande_id} : {self.ancien_statut} -> {self.nouveau_statut}"
+
+    class Meta:
+        ordering = ['change_le']
+        indexes = [
+            models.Index(fields=['commande', 'change_le'], name='historique_statut_commande_idx'),
+        ]
+
+
+class ActiviteUtilisateur(models.Model):
+    """Résumé de l'activité d'un utilisateur (commandes actives, avis non supprimés), tenu à jour par
+    Commandes.activite : les tableaux de bord le lisent par clé primaire"""
+    utilisateur = models.OneToOneField(
+        'Utilisateurs.Utilisateur', on_delete=models.CASCADE, primary_key=True, related_name='activite'
+    )
+    # {'AAAA-MM': nombre} selon la date de commande, {statut: nombre}, {plat_id: nombre}
+    commandes_par_mois = models.JSONField(default=dict)
+    commandes_par_statut = models.JSONField(default=dict)
+    commandes_par_plat = models.JSONField(default=dict)
+    nb_avis = models.PositiveIntegerField(default=0)
+    somme_notes = models.PositiveIntegerField(default=0)
+    nb_avis_approuves = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Activité de {self.utilisateur_id} : {self.nb_commandes} commandes, {self.nb_avis} avis"
+
+    @property
+    def nb_commandes(self):
+        return sum(self.commandes_par_statut.values())
+
+    @property
+    def moyenne_avis(self):
+        return self.somme_notes / self.nb_avis if self.nb_avis else 0
+
+    def commandes_du_mois(self, jour):
+        return self.commandes_par_mois.get(jour.strftime('%Y-%m'), 0)
+
+    def commandes_statut(self, statut):
+        return self.commandes_par_statut.get(statut, 0)
+
+    def plats_favoris(self, nombre=3):
+        """[{'plat__nom', 'count'}] des plats les plus commandés (noms lus par clé primaire)"""
+        from Plats.models import Plat
+
+        favoris = sorted(self.commandes_par_plat.items(), key=lambda item: (-item[1], int(item[0])))[:nombre]
+        plats = Plat.objects.in_bulk([int(plat_id) for plat_id, _ in favoris])
+        return [
+            {'plat__nom': plats[int(plat_id)].nom, 'count': total}
+            for plat_id, total in favoris
+            if int(plat_id) in plats
+        ]
@@ -0,0 +1,508 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from .models import Commande, HistoriqueStatut
+from . import activite, evenements, statistiques
+from Menus.models import Menu, MenuPlat
+from Notifications.services import enfiler_confirmations
+
+
+class CommandeRefusee(Exception):
+    """Commande impossible : le message est destiné à l'utilisateur"""
+
+
+_verrou_ecriture = threading.Lock()
+
+
+@contextmanager
+def ecriture_commande():
+    """Transaction d'écriture des commandes, sérialisée dans le processus sur SQLite"""
+    # SQLite n'accepte qu'un écrivain à la fois : les threads font la queue sur
+    # un verrou plutôt que de dormir dans le busy handler du fichier. Ailleurs,
+    # le verrou de ligne du menu (select_for_update) suffit.
+    if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+        with _verrou_ecriture, transaction.atomic():
+            yield
+    else:
+        with transaction.atomic():
+            yield
+
+
+def _verrouiller_menu(menu_id, publie=True):
+    """Verrouille la ligne du menu pour sérialiser les commandes concurrentes"""
+    menus = Menu.objects.select_for_update().filter(id=menu_id, is_deleted=False)
+    if publie:
+        menus = menus.filter(est_publie=True)
+    menu = menus.first()
+    if menu is None:
+        raise CommandeRefusee("Ce menu n'est pas disponible.")
+    if timezone.now() >= menu.date_limite_commande:
+        raise CommandeRefusee("La période de commande pour ce menu est terminée.")
+    return menu
+
+
+def _incrementer(menu, plat_id, nombre=1):
+    """Incrément conditionnel de quantite_commandee en une seule requête UPDATE.
+
+    La date limite, quantite_max du plat et max_commandes du menu (somme des
+    compteurs de ses plats, relue dans la même requête) sont vérifiés par le
+    WHERE : deux processus ne peuvent pas dépasser ensemble une limite.
+    Retourne 1 si les `nombre` places ont été prises, 0 sinon.
+    """
+    lignes = MenuPlat.objects.filter(
+        menu=menu,
+        plat_id=plat_id,
+        plat__est_actif=True,
+        menu__date_limite_commande__gt=timezone.now()
+    ).filter(
+        Q(quantite_max=0) | Q(quantite_commandee__lte=F('quantite_max') - nombre)
+    )
+    if menu.max_commandes:
+        total_menu = MenuPlat.objects.filter(menu_id=menu.id).order_by().values('menu_id').annotate(
+            total=Sum('quantite_commandee')
+        ).values('total')
+        lignes = lignes.filter(menu__max_commandes__gte=Subquery(total_menu) + nombre)
+    return lignes.update(quantite_commandee=F('quantite_commandee') + nombre)
+
+
+def _incrementer_menu_plat(menu, plat_id):
+    """Prend une place sur le plat ; CommandeRefusee expliquant le refus sinon"""
+    if not _incrementer(menu, plat_id):
+        # Rien n'a été incrémenté : relecture pour expliquer le refus
+        if not MenuPlat.objects.filter(menu=menu, plat_id=plat_id, plat__est_actif=True).exists():
+            raise CommandeRefusee("Ce plat n'est pas proposé dans ce menu.")
+        if timezone.now() >= menu.date_limite_commande:
+            raise CommandeRefusee("La période de commande pour ce menu est terminée.")
+        total = MenuPlat.objects.filter(menu=menu).aggregate(total=Sum('quantite_commandee'))['total'] or 0
+        if menu.max_commandes and total >= menu.max_commandes:
+            raise CommandeRefusee("Le nombre maximum de commandes pour ce menu est atteint.")
+        raise CommandeRefusee("Ce plat est complet pour ce menu.")
+
+
+def _decrementer_menu_plat(menu_id, plat_id):
+    MenuPlat.objects.filter(
+        menu_id=menu_id,
+        plat_id=plat_id,
+        quantite_commandee__gt=0
+    ).update(quantite_commandee=F('quantite_commandee') - 1)
+
+
+class _Demande:
+    """Commande à écrire ; le thread qui écrit le lot y dépose la commande ou le refus"""
+    __slots__ = ('utilisateur', 'menu_id', 'plat_id', 'notes_speciales', 'commande', 'erreur', 'traitee')
+
+    def __init__(self, utilisateur, menu_id, plat_id, notes_speciales):
+        self.utilisateur = utilisateur
+        self.menu_id = int(menu_id)
+        self.plat_id = int(plat_id)
+        self.notes_speciales = notes_speciales
+        self.commande = None
+        self.erreur = None
+        self.traitee = False
+
+
+class _FileCommandes:
+    """Commandes en attente d'écriture dans le processus : un seul thread écrit à la fois,
+    pour tout le lot en file ; les autres attendent leur résultat"""
+
+    def __init__(self, taille_lot=64):
+        self.taille_lot = taille_lot
+        self.condition = threading.Condition()
+        self.demandes = []
+        self.ecriture_en_cours = False
+
+    def traiter(self, demande):
+        with self.condition:
+            self.demandes.append(demande)
+        # Un lot plein peut laisser la demande en file : le tour suivant la reprend
+        while True:
+            with self.condition:
+                while self.ecriture_en_cours and not demande.traitee:
+                    self.condition.wait()
+                if demande.traitee:
+                    return
+                self.ecriture_en_cours = True
+                lot = self.demandes[:self.taille_lot]
+                del self.demandes[:self.taille_lot]
+            try:
+                _enregistrer_lot(lot)
+            except Exception as e:
+                # Transaction annulée : aucune commande du lot n'est enregistrée
+                for autre in lot:
+                    autre.commande, autre.erreur = None, e
+            finally:
+                with self.condition:
+                    for autre in lot:
+                        autre.traitee = True
+                    self.ecriture_en_cours = False
+                    self.condition.notify_all()
+
+
+_file_commandes = _FileCommandes()
+
+
+def passer_commande(utilisateur, menu_id, plat_id, notes_speciales=''):
+    """Enregistre une commande et met à jour les compteurs dans une transaction courte.
+
+    Les commandes simultanées d'un même processus sont écrites ensemble : le
+    thread qui trouve l'écriture libre écrit toutes celles en file dans une
+    seule transaction (group commit), les autres reçoivent leur résultat.
+    Chaque commande du lot est acceptée ou refusée séparément.
+    """
+    demande = _Demande(utilisateur, menu_id, plat_id, notes_speciales)
+    if connection.in_atomic_block:
+        # Dans la transaction de l'appelant : écriture immédiate, sur sa connexion
+        _enregistrer_lot([demande])
+    else:
+        _file_commandes.traiter(demande)
+    if demande.erreur:
+        raise demande.erreur
+    return demande.commande
+
+
+def _enregistrer_lot(demandes):
+    """Écrit un lot de commandes dans une transaction, chaque étape en une requête pour tout le lot.
+
+    Les refus (menu fermé, doublon, plat complet) sont déposés dans la demande
+    concernée sans annuler les autres.
+    """
+    maintenant = timezone.now()
+    with ecriture_commande():
+        # Verrous pris dans l'ordre des id : deux lots ne s'interbloquent pas
+        menus = {
+            menu.id: menu for menu in Menu.objects.select_for_update().filter(
+                id__in={demande.menu_id for demande in demandes}, is_deleted=False, est_publie=True
+            ).order_by('id')
+        }
+        existantes = {}
+        for commande in Commande.objects.filter(
+            menu_id__in=menus, utilisateur__in={demande.utilisateur.id for demande in demandes}
+        ):
+            existantes.setdefault((commande.utilisateur_id, commande.menu_id), []).append(commande)
+
+        groupes = {}
+        deja_commande = set()
+        for demande in demandes:
+            menu = menus.get(demande.menu_id)
+            cle = (demande.utilisateur.id, demande.menu_id)
+            if menu is None:
+                demande.erreur = CommandeRefusee("Ce menu n'est pas disponible.")
+            elif maintenant >= menu.date_limite_commande:
+                demande.erreur = CommandeRefusee("La période de commande pour ce menu est terminée.")
+            elif cle in deja_commande or any(not commande.is_deleted for commande in existantes.get(cle, [])):
+                demande.erreur = CommandeRefusee("Vous avez déjà commandé pour ce menu.")
+            else:
+                deja_commande.add(cle)
+                groupes.setdefault((demande.menu_id, demande.plat_id), []).append(demande)
+
+        # Un UPDATE par plat pour tout le groupe ; s'il n'y a pas la place pour
+        # tous, les demandes du groupe sont reprises une à une
+        acceptees = []
+        for (menu_id, plat_id), groupe in groupes.items():
+            if len(groupe) > 1 and _incrementer(menus[menu_id], plat_id, len(groupe)):
+                acceptees.extend(groupe)
+                continue
+            for demande in groupe:
+                try:
+                    _incrementer_menu_plat(menus[menu_id], plat_id)
+                except CommandeRefusee as e:
+                    demande.erreur = e
+                else:
+                    acceptees.append(demande)
+
+        nouvelles = []
+        for demande in acceptees:
+            utilisateur = demande.utilisateur
+            # Une commande annulée sur le même plat occupe encore la contrainte
+            # unique (utilisateur, menu, plat) : on la réactive plutôt que d'en créer une
+            commande = next(
+                (commande for commande in existantes.get((utilisateur.id, demande.menu_id), [])
+                 if commande.plat_id == demande.plat_id),
+                None
+            )
+            if commande:
+                commande.created_at = timezone.now()
+                commande.statut = 'en_attente'
+                commande.notes_speciales = demande.notes_speciales
+                commande.is_deleted = False
+                commande.deleted_at = None
+                commande.deleted_by = None
+                commande.is_updated = True
+                commande.updated_by = utilisateur.id
+                commande.save()
+            else:
+                commande = Commande(
+                    utilisateur=utilisateur,
+                    plat_id=demande.plat_id,
+                    notes_speciales=demande.notes_speciales,
+                    statut='en_attente',
+                    created_by=utilisateur.id
+                )
+                nouvelles.append(commande)
+            commande.menu = menus[demande.menu_id]
+            demande.commande = commande
+        Commande.objects.bulk_create(nouvelles)
+
+        commandes = [demande.commande for demande in acceptees]
+        statistiques.ajuster_commandes(commandes, 1)
+        activite.ajuster_commandes(commandes, 1)
+        for commande in commandes:
+            evenements.publier_commande('created', commande, commande.menu)
+        # Emails envoyés par le worker : seules les lignes de file sont écrites ici
+        enfiler_confirmations(commandes)
+
+
+def modifier_commande(commande, plat_id, notes_speciales, utilisateur):
+    """Change le plat d'une commande en déplaçant le compteur de façon atomique"""
+    with ecriture_commande():
+        menu = _verrouiller_menu(commande.menu_id, publie=False)
+        ancien_plat_id = commande.plat_id
+
+        if commande.plat_id != int(plat_id):
+            # Unicité (utilisateur, menu, plat) : au plus une autre commande sur ce plat
+            autre_supprimee = Commande.objects.filter(
+                utilisateur=commande.utilisateur_id,
+                menu=menu,
+                plat_id=plat_id
+            ).exclude(id=commande.id).values_list('is_deleted', flat=True).first()
+            if autre_supprimee:
+                raise CommandeRefusee("Vous avez déjà une commande annulée pour ce plat.")
+            if autre_supprimee is not None:
+                raise CommandeRefusee("Vous avez déjà une commande pour ce plat.")
+            _decrementer_menu_plat(menu.id, commande.plat_id)
+            _incrementer_menu_plat(menu, plat_id)
+            commande.menu = menu
+            statistiques.ajuster_commande(commande, -1)
+            statistiques.ajuster_commande(commande, 1, plat_id=plat_id)
+            variations = {}
+            activite.variation_commande(
+                variations, commande.utilisateur_id, commande.created_at, commande.statut, commande.plat_id, -1
+            )
+            activite.variation_commande(
+                variations, commande.utilisateur_id, commande.created_at, commande.statut, int(plat_id), 1
+            )
+            activite.appliquer(variations)
+            commande.plat_id = plat_id
+
+        commande.notes_speciales = notes_speciales
+        commande.is_updated = True
+        commande.updated_by = utilisateur.id
+        commande.save()
+        evenements.publier_commande('modified', commande, menu, ancien_plat_id=ancien_plat_id)
+    return commande
+
+
+def annuler_commande(commande, utilisateur):
+    """Annule une commande et libère sa place dans le compteur du plat"""
+    with ecriture_commande():
+        commande.menu = _verrouiller_menu(commande.menu_id, publie=False)
+
+        # Une commande prête ou livrée reste comptée : la cuisine l'a déjà préparée
+        annulee = Commande.objects.filter(
+            id=commande.id, is_deleted=False, statut__in=('en_attente', 'confirmee')
+        ).update(
+            statut='annulee',
+            is_deleted=True,
+            deleted_at=timezone.now(),
+            deleted_by=utilisateur.id,
+            updated_at=timezone.now()
+        )
+        if not annulee:
+            raise CommandeRefusee("Cette commande ne peut plus être annulée.")
+        _decrementer_menu_plat(commande.menu_id, commande.plat_id)
+        statistiques.ajuster_commande(commande, -1)
+        activite.ajuster_commande(commande, -1)
+        evenements.publier_commande(
+            'cancelled', commande, commande.menu,
+            statut='annulee', ancien_statut=commande.statut
+        )
+    return annulee
+
+
+def changer_statut(commande, nouveau_statut, utilisateur):
+    """Change le statut d'une commande et déplace son compteur statistique"""
+    with ecriture_commande():
+        ancien_statut = commande.statut
+        commande.statut = nouveau_statut
+        commande.is_updated = True
+        commande.updated_by = utilisateur.id
+        commande.save(update_fields=['statut', 'is_updated', 'updated_by', 'updated_at'])
+        if ancien_statut != nouveau_statut:
+            HistoriqueStatut.objects.create(
+                commande=commande, ancien_statut=ancien_statut, nouveau_statut=nouveau_statut,
+                change_par=utilisateur.id
+            )
+        if not commande.is_deleted and ancien_statut != nouveau_statut:
+            statistiques.ajuster_commande(commande, -1, statut=ancien_statut)
+            statistiques.ajuster_commande(commande, 1)
+            variations = {}
+            activite.variation_statut(variations, commande.utilisateur_id, ancien_statut, nouveau_statut)
+            activite.appliquer(variations)
+        if commande.menu_id and ancien_statut != nouveau_statut:
+            if nouveau_statut in ['prete', 'livree']:
+                type_evenement = nouveau_statut
+            elif nouveau_statut == 'annulee':
+                type_evenement = 'cancelled'
+            else:
+                type_evenement = 'modified'
+            evenements.publier_commande(type_evenement, commande, commande.menu, ancien_statut=ancien_statut)
+    return ancien_statut
+
+
+# Statuts de départ admis pour chaque changement en masse (écrans cuisine et admin)
+TRANSITIONS_EN_MASSE = {
+    'confirmee': ['en_attente'],
+    'prete': ['confirmee'],
+    'livree': ['confirmee', 'prete'],
+}
+
+_CHAMPS_VERROUILLES = (
+    'id', 'statut', 'created_at', 'plat_id', 'menu_id', 'menu__site', 'menu__date', 'utilisateur_id'
+)
+
+
+def _verrouiller_commandes(commandes):
+    # of=('self',) : le menu est joint en LEFT JOIN, seules les commandes sont verrouillées
+    return list(commandes.select_for_update(of=('self',)).values_list(*_CHAMPS_VERROUILLES))
+
+
+def _appliquer_statut(lignes, nouveau_statut, origine, utilisateur_id=None, maintenant=None):
+    """Passe les commandes verrouillées au nouveau statut en un seul UPDATE ; journal, statistiques
+    et événements suivent par lots. Retourne le nombre de commandes modifiées."""
+    if not lignes:
+        return 0
+    maintenant = maintenant or timezone.now()
+    ids = [ligne[0] for ligne in lignes]
+    maj = {'statut': nouveau_statut, 'is_updated': True, 'updated_at': maintenant}
+    if utilisateur_id:
+        maj['updated_by'] = utilisateur_id
+    Commande.objects.filter(id__in=ids).update(**maj)
+
+    HistoriqueStatut.objects.bulk_create(
+        (
+            HistoriqueStatut(
+                commande_id=commande_id, ancien_statut=ancien_statut, nouveau_statut=nouveau_statut,
+                origine=origine, change_le=maintenant, change_par=utilisateur_id
+            )
+            for commande_id, ancien_statut, *_ in lignes
+        ),
+        batch_size=500
+    )
+
+    # Statistiques déplacées par groupe plutôt que commande par commande
+    groupes = Counter(
+        (timezone.localdate(created_at), site, menu_id, plat_id, ancien_statut)
+        for _, ancien_statut, created_at, plat_id, menu_id, site, *_ in lignes
+    )
+    for (jour, site, menu_id, plat_id, ancien_statut), nombre in groupes.items():
+        statistiques.ajuster(jour, site, menu_id, plat_id, ancien_statut, -nombre)
+        statistiques.ajuster(jour, site, menu_id, plat_id, nouveau_statut, nombre)
+
+    # Résumés d'activité : une lecture et une écriture pour tous les auteurs concernés
+    variations = {}
+    for _, ancien_statut, *_, utilisateur_concerne in lignes:
+        activite.variation_statut(variations, utilisateur_concerne, ancien_statut, nouveau_statut)
+    activite.appliquer(variations)
+
+    # Un événement par écran cuisine (site, date du menu)
+    canaux = {}
+    for commande_id, ancien_statut, _, plat_id, menu_id, site, date_menu, _ in lignes:
+        if menu_id:
+            canaux.setdefault((site, date_menu), []).append(
+                {'commande_id': commande_id, 'plat_id': plat_id, 'ancien_statut': ancien_statut}
+            )
+    for (site, date_menu), commandes in canaux.items():
+        evenements.publier_statuts(site, date_menu, nouveau_statut, commandes)
+    return len(lignes)
+
+
+def changer_statut_en_masse(commandes, nouveau_statut, utilisateur):
+    """Change le statut des commandes du queryset en un seul UPDATE.
+
+    Seules les commandes actives dont le statut permet la transition sont
+    modifiées (une commande déjà livrée ne redevient pas prête). Retourne leur nombre.
+    """
+    if nouveau_statut not in TRANSITIONS_EN_MASSE:
+        raise CommandeRefusee("Ce statut ne peut pas être appliqué en masse.")
+    with ecriture_commande():
+        lignes = _verrouiller_commandes(
+            commandes.filter(statut__in=TRANSITIONS_EN_MASSE[nouveau_statut], is_deleted=False).order_by('id')
+        )
+        return _appliquer_statut(lignes, nouveau_statut, 'manuel', utilisateur.id)
+
+
+def confirmer_menu(menu_id, maintenant=None):
+    """Confirme en un seul UPDATE les commandes en attente d'un menu dont la date limite est passée.
+
+    Idempotent : un second passage ne trouve plus rien. Retourne le nombre de commandes confirmées.
+    """
+    maintenant = maintenant or timezone.now()
+    with ecriture_commande():
+        # Le verrou du menu attend les commandes, modifications et annulations en cours
+        menu = Menu.objects.select_for_update().filter(
+            id=menu_id, est_publie=True, is_deleted=False, date_limite_commande__lte=maintenant
+        ).first()
+        if menu is None:
+            return 0
+        lignes = _verrouiller_commandes(
+            Commande.objects.filter(menu=menu, statut='en_attente', is_deleted=False).order_by('id')
+        )
+        return _appliquer_statut(lignes, 'confirmee', 'automatique', maintenant=maintenant)
+
+
+def confirmer_commandes_echues(maintenant=None):
+    """Confirme les commandes en attente de tous les menus dont la date limite est passée.
+
+    Une transaction par menu. Retourne {menu_id: nombre de commandes confirmées}.
+    """
+    maintenant = maintenant or timezone.now()
+    menus = Menu.objects.filter(
+        est_publie=True, is_deleted=False, date_limite_commande__lte=maintenant
+    ).filter(
+        Exists(Commande.objects.filter(menu=OuterRef('pk'), statut='en_attente', is_deleted=False))
+    ).order_by('date_limite_commande').values_list('id', flat=True)
+    confirmees = {}
+    for menu_id in list(menus):
+        nombre = confirmer_menu(menu_id, maintenant)
+        if nombre:
+            confirmees[menu_id] = nombre
+    return confirmees
+
+
+def reconcilier_compteurs(date_debut=None, date_fin=None, corriger=True):
+    """Compare quantite_commandee des menus de la période (dates incluses, sans borne : tout
+    l'historique) au nombre réel de commandes actives ; corrige les écarts sauf si corriger=False.
+
+    Une requête groupée sur les commandes, une lecture des MenuPlat, un bulk_update.
+    Retourne les écarts [(menu_id, plat_id, compteur enregistré, commandes réelles)].
+    """
+    periode = {}
+    if date_debut:
+        periode['date__gte'] = date_debut
+    if date_fin:
+        periode['date__lte'] = date_fin
+    menus = Menu.objects.filter(**periode)
+
+    with ecriture_commande():
+        # Verrou des menus : les commandes de la période attendent la fin de la comparaison
+        list(menus.select_for_update().values_list('id', flat=True))
+        comptes = Commande.objects.filter(menu__in=menus, is_deleted=False).values(
+            'menu_id', 'plat_id'
+        ).annotate(nombre=Count('id')).values_list('menu_id', 'plat_id', 'nombre').order_by()
+        reelles = {(menu_id, plat_id): nombre for menu_id, plat_id, nombre in comptes}
+        ecarts = []
+        a_corriger = []
+        for menu_plat in MenuPlat.objects.filter(menu__in=menus, plat__isnull=False).only(
+            'id', 'menu_id', 'plat_id', 'quantite_commandee'
+        ).order_by('menu_id', 'plat_id'):
+            nombre = reelles.get((menu_plat.menu_id, menu_plat.plat_id), 0)
+            if menu_plat.quantite_commandee != nombre:
+                ecarts.append((menu_plat.menu_id, menu_plat.plat_id, menu_plat.quantite_commandee, nombre))
+                menu_plat.quantite_commandee = nombre
+                a_corriger.append(menu_plat)
+        if corriger:
+            MenuPlat.objects.bulk_update(a_corriger, ['quantite_commandee'], batch_size=500)
+    return ecarts
@@ -0,0 +1,118 @@
+from collections import Counter
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Commande, StatCommandeJour
+
+
+def ajuster(date, site, menu_id, plat_id, statut, delta):
+    """Ajoute delta au compteur du jour (UPDATE atomique, INSERT si la ligne n'existe pas)"""
+    cle = {
+        'date': date,
+        'site': site or '',
+        'menu_id': menu_id,
+        'plat_id': plat_id,
+        'statut': statut,
+    }
+    if StatCommandeJour.objects.filter(**cle).update(nombre=F('nombre') + delta):
+        return
+    try:
+        with transaction.atomic():
+            StatCommandeJour.objects.create(nombre=delta, **cle)
+    except IntegrityError:
+        # Créée entre-temps par une requête concurrente
+        StatCommandeJour.objects.filter(**cle).update(nombre=F('nombre') + delta)
+
+
+def ajuster_commande(commande, delta, statut=None, plat_id=None):
+    """Répercute une commande active (+1) ou retirée (-1) sur les statistiques"""
+    ajuster(
+        timezone.localdate(commande.created_at),
+        commande.menu.site if commande.menu_id else '',
+        commande.menu_id,
+        plat_id or commande.plat_id,
+        statut or commande.statut,
+        delta
+    )
+
+
+def ajuster_commandes(commandes, delta):
+    """Répercute un lot de commandes : une requête par jour, menu, plat et statut"""
+    groupes = Counter(
+        (
+            timezone.localdate(commande.created_at),
+            commande.menu.site if commande.menu_id else '',
+            commande.menu_id,
+            commande.plat_id,
+            commande.statut,
+        )
+        for commande in commandes
+    )
+    for cle, nombre in groupes.items():
+        ajuster(*cle, delta * nombre)
+
+
+def reconstruire(batch_size=1000):
+    """Recalcule entièrement la table à partir des commandes non supprimées"""
+    lignes = Commande.objects.filter(is_deleted=False).annotate(
+        jour=TruncDate('created_at')
+    ).values('jour', 'menu__site', 'menu_id', 'plat_id', 'statut').annotate(
+        total=Count('id')
+    ).order_by()
+
+    with transaction.atomic():
+        StatCommandeJour.objects.all().delete()
+        StatCommandeJour.objects.bulk_create(
+            (
+                StatCommandeJour(
+                    date=ligne['jour'],
+                    site=ligne['menu__site'] or '',
+                    menu_id=ligne['menu_id'],
+                    plat_id=ligne['plat_id'],
+                    statut=ligne['statut'],
+                    nombre=ligne['total']
+                )
+                for ligne in lignes.iterator()
+            ),
+            batch_size=batch_size
+        )
+    return StatCommandeJour.objects.count()
+
+
+def stats_periode(date_debut, date_fin):
+    """Lignes pré-agrégées d'une période (bornes incluses)"""
+    return StatCommandeJour.objects.filter(date__gte=date_debut, date__lte=date_fin)
+
+
+def total_commandes(date_debut, date_fin):
+    return stats_periode(date_debut, date_fin).aggregate(total=Sum('nombre'))['total'] or 0
+
+
+def totaux_par_jour(date_debut, date_fin):
+    """{date: total} pour chaque jour de la période, jours sans commande à 0"""
+    totaux = dict(
+        stats_periode(date_debut, date_fin).values('date').annotate(
+            total=Sum('nombre')
+        ).values_list('date', 'total').order_by()
+    )
+    nb_jours = (date_fin - date_debut).days + 1
+    return {
+        date_debut + timedelta(days=i): totaux.get(date_debut + timedelta(days=i), 0)
+        for i in range(nb_jours)
+    }
+
+
+def stats_par_jour(date_debut, date_fin):
+    return stats_periode(date_debut, date_fin).values('date').annotate(
+        total=Sum('nombre'),
+        confirmees=Sum('nombre', filter=Q(statut='confirmee'), default=0),
+        livrees=Sum('nombre', filter=Q(statut='livree'), default=0)
+    ).order_by('date')
+
+
+def top_plats(date_debut, date_fin, limite=10):
+    return stats_periode(date_debut, date_fin).values('plat__nom').annotate(
+        count=Sum('nombre')
+    ).order_by('-count')[:limite]
@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from xml.etree import ElementTree
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from Avis.models import Avis
+from Avis.services import recalculer_notes, suivi_notes
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+from . import activite, consolidation, evenements, services, statistiques
+from .models import ActiviteUtilisateur, Commande, HistoriqueStatut, StatCommandeJour
 
-# Create your tests here.
+
+class PassageCommandeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru')]
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.localdate(), site='Danga', est_publie=True, max_commandes=2,
+            date_limite_commande=timezone.now() + timedelta(hours=1)
+        )
+        for plat in cls.plats:
+            MenuPlat.objects.create(menu=cls.menu, plat=plat)
+        cls.collaborateurs = [
+            Utilisateur.objects.create_user(email=f'passage{i}@sah.test', prenom='P', nom=f'Passage{i}')
+            for i in range(3)
+        ]
+
+    def compteurs(self):
+        return dict(MenuPlat.objects.filter(menu=self.menu).values_list('plat_id', 'quantite_commandee'))
+
+    def test_plafond_du_menu(self):
+        services.passer_commande(self.collaborateurs[0], self.menu.id, self.plats[0].id)
+        services.passer_commande(self.collaborateurs[1], self.menu.id, self.plats[1].id)
+        with self.assertRaisesMessage(services.CommandeRefusee, "Le nombre maximum de commandes"):
+            services.passer_commande(self.collaborateurs[2], self.menu.id, self.plats[0].id)
+        self.assertEqual(self.compteurs(), {self.plats[0].id: 1, self.plats[1].id: 1})
+
+    def test_modification_vers_un_plat_deja_commande(self):
+        utilisateur = self.collaborateurs[0]
+        commande = services.passer_commande(utilisateur, self.menu.id, self.plats[0].id)
+        # Doublon actif laissé par une saisie hors service
+        Commande.objects.create(utilisateur=utilisateur, menu=self.menu, plat=self.plats[1])
+        with self.assertRaisesMessage(services.CommandeRefusee, "Vous avez déjà une commande pour ce plat."):
+            services.modifier_commande(commande, self.plats[1].id, '', utilisateur)
+
+        Commande.objects.filter(plat=self.plats[1]).update(is_deleted=True, statut='annulee')
+        with self.assertRaisesMessage(services.CommandeRefusee, "Vous avez déjà une commande annulée pour ce plat."):
+            services.modifier_commande(commande, self.plats[1].id, '', utilisateur)
+
+    def test_annulation_selon_statut(self):
+        utilisateur = self.collaborateurs[0]
+        commande = services.passer_commande(utilisateur, self.menu.id, self.plats[0].id)
+        services.changer_statut(commande, 'prete', self.collaborateurs[1])
+        with self.assertRaisesMessage(services.CommandeRefusee, "Cette commande ne peut plus être annulée."):
+            services.annuler_commande(commande, utilisateur)
+        commande.refresh_from_db()
+        self.assertEqual((commande.statut, commande.is_deleted), ('prete', False))
+        self.assertEqual(self.compteurs()[self.plats[0].id], 1)
+
+        services.changer_statut(commande, 'confirmee', self.collaborateurs[1])
+        self.assertEqual(services.annuler_commande(commande, utilisateur), 1)
+        self.assertEqual(self.compteurs()[self.plats[0].id], 0)
+        with self.assertRaises(services.CommandeRefusee):
+            services.annuler_commande(commande, utilisateur)
+
+
+class LotCommandesTest(TestCase):
+    """Commandes simultanées écrites en un lot : chacune acceptée ou refusée comme seule"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru')]
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.localdate(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(hours=1)
+        )
+        MenuPlat.objects.create(menu=cls.menu, plat=cls.plats[0], quantite_max=2)
+        MenuPlat.objects.create(menu=cls.menu, plat=cls.plats[1])
+        cls.menu_ferme = Menu.objects.create(
+            jour='mardi', date=timezone.localdate(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() - timedelta(hours=1)
+        )
+        cls.collaborateurs = [
+            Utilisateur.objects.create_user(email=f'lot{i}@sah.test', prenom='L', nom=f'Lot{i}')
+            for i in range(5)
+        ]
+
+    def test_lot_mixte(self):
+        from Notifications.models import EnvoiEmail
+
+        u0, u1, u2, u3, u4 = self.collaborateurs
+        ndole, eru = self.plats
+        annulee = services.passer_commande(u4, self.menu.id, eru.id)
+        services.annuler_commande(annulee, u4)
+
+        demandes = [
+            services._Demande(u0, self.menu.id, ndole.id, ''),
+            services._Demande(u1, self.menu.id, ndole.id, ''),
+            services._Demande(u2, self.menu.id, ndole.id, ''),
+            services._Demande(u3, self.menu.id, eru.id, 'Sans piment'),
+            services._Demande(u3, self.menu.id, eru.id, ''),
+            services._Demande(u4, self.menu.id, eru.id, ''),
+            services._Demande(u0, self.menu_ferme.id, eru.id, ''),
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            services._enregistrer_lot(demandes)
+
+        self.assertEqual([str(demande.erreur) if demande.erreur else 'ok' for demande in demandes], [
+            'ok', 'ok', "Ce plat est complet pour ce menu.",
+            'ok', "Vous avez déjà commandé pour ce menu.",
+            'ok', "La période de commande pour ce menu est terminée.",
+        ])
+        self.assertEqual(demandes[5].commande.id, annulee.id)
+        self.assertEqual(Commande.objects.get(utilisateur=u3).notes_speciales, 'Sans piment')
+        self.assertEqual(
+            dict(MenuPlat.objects.filter(menu=self.menu).values_list('plat_id', 'quantite_commandee')),
+            {ndole.id: 2, eru.id: 2}
+        )
+        self.assertEqual(Commande.objects.filter(is_deleted=False).count(), 4)
+        self.assertEqual(len(callbacks), 4)
+        self.assertEqual(EnvoiEmail.objects.filter(type_notification='confirmation_commande').count(), 4)
+
+        lignes = sorted(StatCommandeJour.objects.exclude(nombre=0).values_list('menu_id', 'plat_id', 'statut', 'nombre'))
+        statistiques.reconstruire()
+        self.assertEqual(
+            lignes, sorted(StatCommandeJour.objects.exclude(nombre=0).values_list('menu_id', 'plat_id', 'statut', 'nombre'))
+        )
+        champs = [*activite.COMPTEURS, *activite.TOTAUX]
+        self.assertEqual(
+            {
+                resume.pk: {champ: getattr(resume, champ) for champ in champs}
+                for resume in ActiviteUtilisateur.objects.all()
+                if any(getattr(resume, champ) for champ in champs)
+            },
+            activite.calculer_activite()
+        )
+
+    def test_plafond_du_menu_dans_un_lot(self):
+        menu = Menu.objects.create(
+            jour='mercredi', date=timezone.localdate(), site='Danga', est_publie=True, max_commandes=3,
+            date_limite_commande=timezone.now() + timedelta(hours=1)
+        )
+        MenuPlat.objects.create(menu=menu, plat=self.plats[1])
+        demandes = [services._Demande(u, menu.id, self.plats[1].id, '') for u in self.collaborateurs[:4]]
+        services._enregistrer_lot(demandes)
+        self.assertEqual(
+            [str(demande.erreur) if demande.erreur else 'ok' for demande in demandes],
+            ['ok', 'ok', 'ok', "Le nombre maximum de commandes pour ce menu est atteint."]
+        )
+        self.assertEqual(MenuPlat.objects.get(menu=menu).quantite_commandee, 3)
+
+
+def _commander_dans_un_processus(base, depart, resultats, commandes):
+    """Processus enfant : nouvelles connexions (sur la copie fichier de la base SQLite), puis
+    commandes passées par plusieurs threads, écrites en lots par le processus"""
+    if base:
+        # Profil SQLite de production : transactions IMMEDIATE, attente du verrou ; les
+        # threads ouvrent leur connexion avec ces mêmes réglages
+        connection.connection = None
+        connection.settings_dict.update(NAME=base, OPTIONS={'timeout': 20, 'transaction_mode': 'IMMEDIATE'})
+
+    def commander(commande):
+        utilisateur_id, menu_id, plat_id = commande
+        try:
+            services.passer_commande(Utilisateur.objects.get(pk=utilisateur_id), menu_id, plat_id)
+            return 'ok'
+        except services.CommandeRefusee as e:
+            return str(e)
+        except Exception as e:
+            return f'erreur : {e!r}'
+        finally:
+            connection.close()
+
+    depart.wait()
+    with ThreadPoolExecutor(max_workers=len(commandes)) as executor:
+        resultats.put(list(executor.map(commander, commandes)))
+
+
+class CommandesConcurrentesTest(TransactionTestCase):
+    """Plusieurs processus (workers) de plusieurs threads commandent en même temps sur un menu plafonné"""
+
+    NB_PROCESSUS = 4
+
+    def test_limites_respectees_entre_processus(self):
+        plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru')]
+        menu = Menu.objects.create(
+            jour='lundi', date=timezone.localdate(), site='Danga', est_publie=True, max_commandes=5,
+            date_limite_commande=timezone.now() + timedelta(hours=1)
+        )
+        MenuPlat.objects.create(menu=menu, plat=plats[0])
+        MenuPlat.objects.create(menu=menu, plat=plats[1], quantite_max=2)
+        commandes = [
+            (Utilisateur.objects.create_user(email=f'rush{i}@sah.test', prenom='R', nom=f'Rush{i}').id,
+             menu.id, plats[i % 2].id)
+            for i in range(12)
+        ]
+
+        base = None
+        with tempfile.TemporaryDirectory() as dossier:
+            if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+                # La base de test en mémoire n'est pas visible des autres processus : copie dans un fichier
+                base = os.path.join(dossier, 'rush.sqlite3')
+                with sqlite3.connect(base) as copie:
+                    connection.connection.backup(copie)
+            else:
+                # Ne pas partager la connexion du test avec les processus enfants
+                connection.close()
+
+            contexte = multiprocessing.get_context('fork')
+            depart = contexte.Barrier(self.NB_PROCESSUS)
+            resultats = contexte.Queue()
+            processus = [
+                contexte.Process(
+                    target=_commander_dans_un_processus,
+                    args=(base, depart, resultats, commandes[i::self.NB_PROCESSUS])
+                )
+                for i in range(self.NB_PROCESSUS)
+            ]
+            for enfant in processus:
+                enfant.start()
+            issues = [issue for _ in processus for issue in resultats.get(timeout=60)]
+            for enfant in processus:
+                enfant.join()
+
+            if base:
+                with sqlite3.connect(base) as copie:
+                    copie.backup(connection.connection)
+
+        self.assertEqual(issues.count('ok'), 5, issues)
+        self.assertFalse([issue for issue in issues if issue.startswith('erreur')])
+        actives = Commande.objects.filter(menu=menu, is_deleted=False)
+        self.assertEqual(actives.count(), 5)
+        self.assertLessEqual(actives.filter(plat=plats[1]).count(), 2)
+        self.assertEqual(services.reconcilier_compteurs(corriger=False), [])
+
+
+class StatistiquesCommandesTest(TestCase):
+    """StatCommandeJour suit les écritures des services comme un recalcul complet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru', 'Koki')]
+        cls.menus = []
+        for site in ('Danga', 'Campus'):
+            menu = Menu.objects.create(
+                jour='lundi', date=timezone.localdate(), site=site, est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1)
+            )
+            for plat in cls.plats:
+                MenuPlat.objects.create(menu=menu, plat=plat)
+            cls.menus.append(menu)
+        cls.collaborateurs = [
+            Utilisateur.objects.create_user(email=f'stats{i}@sah.test', prenom='S', nom=f'Stats{i}')
+            for i in range(4)
+        ]
+        cls.admin = Utilisateur.objects.create_user(
+            email='admin.stats@sah.test', prenom='Ada', nom='Stats', role='admin', is_staff=True
+        )
+
+    def lignes(self):
+        return sorted(StatCommandeJour.objects.exclude(nombre=0).values_list(
+            'date', 'site', 'menu_id', 'plat_id', 'statut', 'nombre'
+        ))
+
+    def assertStatsAJour(self):
+        lignes = self.lignes()
+        statistiques.reconstruire()
+        self.assertEqual(lignes, self.lignes())
+
+    def test_suivi_incremental(self):
+        premier, second, troisieme, quatrieme = self.collaborateurs
+        commande = services.passer_commande(premier, self.menus[0].id, self.plats[0].id)
+        services.passer_commande(second, self.menus[0].id, self.plats[0].id)
+        services.passer_commande(troisieme, self.menus[1].id, self.plats[1].id)
+        self.assertStatsAJour()
+
+        services.modifier_commande(commande, self.plats[2].id, '', premier)
+        self.assertStatsAJour()
+        services.changer_statut(commande, 'confirmee', self.admin)
+        self.assertStatsAJour()
+        services.changer_statut_en_masse(Commande.objects.filter(menu=self.menus[0]), 'confirmee', self.admin)
+        self.assertStatsAJour()
+
+        services.annuler_commande(commande, premier)
+        self.assertStatsAJour()
+        # Réactivation de la commande annulée
+        services.passer_commande(premier, self.menus[0].id, self.plats[2].id)
+        services.passer_commande(quatrieme, self.menus[1].id, self.plats[1].id)
+        self.assertStatsAJour()
+        self.assertEqual(statistiques.total_commandes(timezone.localdate(), timezone.localdate()), 4)
+
+    def test_commande_reconstruire(self):
+        for i, collaborateur in enumerate(self.collaborateurs):
+            services.passer_commande(collaborateur, self.menus[i % 2].id, self.plats[i % 3].id)
+        attendues = self.lignes()
+        StatCommandeJour.objects.update(nombre=42)
+        StatCommandeJour.objects.create(date=timezone.localdate(), site='Danga', statut='livree', nombre=3)
+
+        sortie = io.StringIO()
+        call_command('reconstruire_stats_commandes', stdout=sortie)
+        self.assertIn('4 lignes statistiques reconstruites', sortie.getvalue())
+        self.assertEqual(self.lignes(), attendues)
+
+    def test_api_memes_chiffres(self):
+        for i, collaborateur in enumerate(self.collaborateurs):
+            commande = services.passer_commande(collaborateur, self.menus[i % 2].id, self.plats[i % 2].id)
+        services.changer_statut(commande, 'livree', self.admin)
+        self.client.force_login(self.admin)
+        donnees = self.client.get(reverse('commandes:api_statistiques_commandes')).json()
+
+        aujourdhui = timezone.localdate().isoformat()
+        self.assertEqual(donnees['stats_par_jour'], [
+            {'date': aujourdhui, 'total': 4, 'confirmees': 0, 'livrees': 1}
+        ])
+        self.assertEqual(
+            {ligne['plat__nom']: ligne['count'] for ligne in donnees['stats_par_plat']},
+            {ligne['plat__nom']: ligne['count'] for ligne in Commande.objects.filter(is_deleted=False).values(
+                'plat__nom'
+            ).annotate(count=Count('id'))}
+        )
+
+
+class ConsolidationCuisineTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom='Poulet DG', description=f'Recette {i}') for i in range(2)]
+        cls.plats.append(Plat.objects.create(nom='Eru', description='-'))
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.localdate(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() - timedelta(hours=1)
+        )
+        for i, plat in enumerate([0, 0, 1, 2, 2, 2]):
+            utilisateur = Utilisateur.objects.create_user(email=f'cuisine{i}@sah.test', prenom='C', nom=f'Cuisine{i}')
+            Commande.objects.create(utilisateur=utilisateur, menu=cls.menu, plat=cls.plats[plat], statut='confirmee')
+        cls.prestataire = Utilisateur.objects.create_user(
+            email='chef.cuisine@sah.test', prenom='Chef', nom='Cuisine', role='prestataire'
+        )
+
+    def test_plats_homonymes_et_supprimes(self):
+        self.plats[2].delete()
+        plats = consolidation.consolider(timezone.localdate(), ['Danga'])['Danga']['plats_quantites']
+        self.assertEqual(
+            [(plat_id, ligne['nom'], ligne['quantite']) for plat_id, ligne in plats.items()],
+            [(None, '', 3), (self.plats[0].id, 'Poulet DG', 2), (self.plats[1].id, 'Poulet DG', 1)]
+        )
+
+        self.client.force_login(self.prestataire)
+        response = self.client.get(reverse('commandes:commandes_prestataire'), {'site': 'Danga'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'data-plat-id="{self.plats[1].id}"')
+
+    def test_carte_plat_supprime(self):
+        """« Marquer comme prêt » sur la carte d'un plat supprimé ne touche que les commandes sans plat"""
+        self.plats[2].delete()
+        self.client.force_login(self.prestataire)
+        response = self.client.get(reverse('commandes:commandes_prestataire'), {'site': 'Danga'})
+        self.assertContains(response, 'name="plat_id" value="vide"', count=1)
+
+        donnees = {'site': 'Danga', 'date': timezone.localdate().isoformat(), 'statut': 'prete'}
+        self.client.post(reverse('commandes:changer_statut_commandes'), dict(donnees, plat_id='vide'))
+        self.assertEqual(
+            dict(Commande.objects.values_list('plat_id').annotate(n=Count('id', filter=Q(statut='prete')))),
+            {None: 3, self.plats[0].id: 0, self.plats[1].id: 0}
+        )
+
+        # plat_id illisible (vide, ancienne page) : rien n'est modifié
+        self.client.post(reverse('commandes:changer_statut_commandes'), dict(donnees, plat_id=''))
+        self.assertEqual(Commande.objects.filter(statut='prete').count(), 3)
+
+
+class EvenementsCuisineTest(TestCase):
+    """Événements SSE des écrans cuisine : publiés après validation, par site et par date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plat = Plat.objects.create(nom='Ndolé', description='-')
+        cls.aujourdhui = timezone.localdate()
+        cls.menus = {}
+        for site in ('Danga', 'Campus'):
+            cls.menus[site] = Menu.objects.create(
+                jour='lundi', date=cls.aujourdhui, site=site, est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1)
+            )
+            MenuPlat.objects.create(menu=cls.menus[site], plat=cls.plat)
+        cls.collaborateur = Utilisateur.objects.create_user(
+            email='flux@sah.test', prenom='F', nom='Flux', site='Danga'
+        )
+        cls.prestataire = Utilisateur.objects.create_user(
+            email='chef.flux@sah.test', prenom='Chef', nom='Flux', role='prestataire'
+        )
+
+    def canal(self, site, date_menu=None):
+        return evenements.canal(site, date_menu or self.aujourdhui)
+
+    def recevoir(self, callbacks, canaux):
+        """Abonne les canaux, exécute les callbacks on_commit, retourne les événements reçus par canal"""
+        async def scenario():
+            bus = evenements.get_bus()
+            abonnements = {nom: bus.abonner(nom) for nom in canaux}
+            try:
+                recus = {nom: [] for nom in canaux}
+                # Rien n'est publié avant la validation de la transaction
+                for nom, abonnement in abonnements.items():
+                    self.assertIsNone(await abonnement.prochain(timeout=0.01))
+                for callback in callbacks:
+                    callback()
+                for nom, abonnement in abonnements.items():
+                    while (evenement := await abonnement.prochain(timeout=0.05)) is not None:
+                        recus[nom].append(evenement)
+                return recus
+            finally:
+                for abonnement in abonnements.values():
+                    abonnement.fermer()
+        return asyncio.run(scenario())
+
+    def test_publication_a_la_validation(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            commande = services.passer_commande(self.collaborateur, self.menus['Danga'].id, self.plat.id)
+            services.changer_statut(commande, 'prete', self.prestataire)
+        recus = self.recevoir(callbacks, [
+            self.canal('Danga'), self.canal('Campus'), self.canal('Danga', self.aujourdhui + timedelta(days=1))
+        ])
+
+        danga = recus[self.canal('Danga')]
+        self.assertEqual([evenement['type'] for evenement in danga], ['created', 'prete'])
+        self.assertEqual(
+            {cle: danga[0][cle] for cle in ('commande_id', 'plat_id', 'statut')},
+            {'commande_id': commande.id, 'plat_id': self.plat.id, 'statut': 'en_attente'}
+        )
+        self.assertEqual(danga[1]['ancien_statut'], 'en_attente')
+        self.assertLess(danga[0]['id'], danga[1]['id'])
+        self.assertEqual(recus[self.canal('Campus')], [])
+        self.assertEqual(recus[self.canal('Danga', self.aujourdhui + timedelta(days=1))], [])
+
+    def test_format_sse(self):
+        evenement = {'id': 7, 'type': 'cancelled', 'commande_id': 3, 'notes_speciales': 'sans piment\nmerci'}
+        self.assertEqual(
+            evenements.format_sse(evenement),
+            'id: 7\nevent: cancelled\ndata: ' + json.dumps(evenement) + '\n\n'
+        )
+        # Une seule ligne data : un retour à la ligne dans les notes ne coupe pas l'événement
+        self.assertEqual(evenements.format_sse(evenement).count('\n'), 4)
+
+    def test_acces_reserve_aux_prestataires(self):
+        url = reverse('commandes:flux_commandes_prestataire')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.collaborateur)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    async def test_flux_du_site_et_de_la_date(self):
+        await self.async_client.aforce_login(self.prestataire)
+        response = await self.async_client.get(
+            reverse('commandes:flux_commandes_prestataire'), {'site': 'Campus', 'date': self.aujourdhui.isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        flux = aiter(response.streaming_content)
+        self.assertEqual(await anext(flux), b'retry: 5000\n\n')
+        bus = evenements.get_bus()
+        bus.publier(self.canal('Danga'), {'type': 'created', 'commande_id': 1})
+        bus.publier(self.canal('Campus', self.aujourdhui + timedelta(days=1)), {'type': 'created', 'commande_id': 2})
+        bus.publier(self.canal('Campus'), {'type': 'created', 'commande_id': 3})
+        fragment = (await asyncio.wait_for(anext(flux), timeout=2)).decode()
+        self.assertRegex(fragment, r'^id: \d+\nevent: created\ndata: .*"commande_id": 3')
+        await flux.aclose()
+
+
+class IndexRequetesTest(TestCase):
+    """Chaque requête fréquente des vues doit être servie par un index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = Utilisateur.objects.create_user(
+            email='index@test.local', password='x', prenom='Index', nom='Test'
+        )
+        cls.plat = Plat.objects.create(nom='Plat index', description='-')
+        cls.today = timezone.now().date()
+
+    def assertUtiliseIndex(self, queryset, index):
+        if connection.vendor == 'postgresql':
+            # Sur des tables presque vides PostgreSQL préfère un parcours séquentiel
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+        else:
+            plan = queryset.explain()
+        self.assertIn(index, plan, msg=f"\n{queryset.query}\n{plan}")
+
+    def test_commandes_utilisateur(self):
+        self.assertUtiliseIndex(
+            Commande.objects.filter(utilisateur=self.utilisateur, is_deleted=False).order_by('-created_at'),
+            'commande_utilisateur_actif_idx'
+        )
+
+    def test_commandes_cuisine_par_menu(self):
+        self.assertUtiliseIndex(
+            consolidation.commandes_cuisine(self.today).values('menu__site', 'plat_id').order_by(),
+            'commande_menu_statut_idx'
+        )
+
+    def test_commandes_recentes(self):
+        self.assertUtiliseIndex(
+            Commande.objects.filter(is_deleted=False).order_by('-created_at')[:20],
+            'commande_created_actif_idx'
+        )
+
+    def test_avis_plat(self):
+        self.assertUtiliseIndex(
+            Avis.objects.filter(plat=self.plat, est_approuve=True, is_deleted=False).order_by('-created_at'),
+            'avis_plat_publie_idx'
+        )
+
+    def test_avis_publies(self):
+        self.assertUtiliseIndex(
+            Avis.objects.filter(est_approuve=True, is_deleted=False).order_by('-created_at')[:50],
+            'avis_created_actif_idx'
+        )
+
+    def test_avis_a_moderer(self):
+        self.assertUtiliseIndex(
+            Avis.objects.filter(est_approuve=False, is_deleted=False).order_by('-created_at'),
+            'avis_created_actif_idx'
+        )
+
+    def test_avis_recents(self):
+        self.assertUtiliseIndex(
+            Avis.objects.filter(is_deleted=False).order_by('-created_at')[:5],
+            'avis_created_actif_idx'
+        )
+
+    def test_menus_publies_semaine(self):
+        self.assertUtiliseIndex(
+            Menu.objects.filter(
+                date__gte=self.today, date__lte=self.today + timedelta(days=6), site='Danga', est_publie=True
+            ),
+            'menu_publie_date_site_idx'
+        )
+
+    def test_menus_date_limite(self):
+        maintenant = timezone.now()
+        self.assertUtiliseIndex(
+            Menu.objects.filter(
+                est_publie=True,
+                date_limite_commande__lte=maintenant + timedelta(hours=24),
+                date_limite_commande__gte=maintenant
+            ),
+            'menu_publie_limite_idx'
+        )
+
+    def test_plats_actifs(self):
+        self.assertUtiliseIndex(
+            Plat.objects.filter(est_actif=True, is_deleted=False),
+            'plat_actif_idx'
+        )
+
+
+class ExportCommandesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            email='admin@export.test', prenom='Ada', nom='Admin', role='admin'
+        )
+        plat = Plat.objects.create(nom='Poulet DG', description='-')
+        menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now()
+        )
+        MenuPlat.objects.create(menu=menu, plat=plat, prix=1500)
+        for i, statut in enumerate(['confirmee', 'livree', 'annulee']):
+            utilisateur = Utilisateur.objects.create_user(
+                email=f'export{i}@sah.test', prenom='Émile', nom=f'Export{i}', site='Danga'
+            )
+            Commande.objects.create(
+                utilisateur=utilisateur, menu=menu, plat=plat, statut=statut, notes_speciales='=1+1'
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def exporter(self, format_export, **filtres):
+        response = self.client.get(reverse('commandes:export_commandes', args=[format_export]), filtres)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        lignes = list(csv.reader(io.StringIO(self.exporter('csv', status='livree').decode('utf-8-sig'))))
+        self.assertEqual(lignes[0][:3], ['Commande', 'Date de commande', 'Statut'])
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual(lignes[1][2], 'Livrée')
+        self.assertEqual(lignes[1][6], 'Émile')
+        self.assertEqual(Decimal(lignes[1][10]), 1500)
+        self.assertEqual(lignes[1][11], "'=1+1")
+
+    def test_xlsx(self):
+        with zipfile.ZipFile(io.BytesIO(self.exporter('xlsx', search='poulet'))) as archive:
+            self.assertIsNone(archive.testzip())
+            feuille = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        espace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        lignes = feuille.findall(f'{espace}sheetData/{espace}row')
+        self.assertEqual(len(lignes), 4)
+        cellules = lignes[1].findall(f'{espace}c')
+        self.assertEqual(cellules[1].get('s'), '2')  # date et heure
+        self.assertEqual(cellules[9].find(f'{espace}is/{espace}t').text, 'Poulet DG')
+        self.assertEqual(Decimal(cellules[10].find(f'{espace}v').text), 1500)
+
+    def test_reserve_admin_et_format(self):
+        self.assertEqual(self.client.get(reverse('commandes:export_commandes', args=['pdf'])).status_code, 404)
+        self.client.force_login(Utilisateur.objects.get(email='export0@sah.test'))
+        self.assertEqual(self.client.get(reverse('commandes:export_commandes', args=['csv'])).status_code, 302)
+
+    def test_commande_et_page_admin(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'commandes.csv')
+            call_command('exporter_commandes', '--status', 'annulee', '--sortie', chemin, stderr=io.StringIO())
+            with open(chemin, encoding='utf-8-sig') as fichier:
+                self.assertEqual(len(fichier.read().splitlines()), 2)
+
+        response = self.client.get(reverse('admin_orders'), {'status': 'confirmee'})
+        self.assertContains(response, 'status=confirmee')
+        self.assertEqual(response.context['stats_commandes']['total'], 1)
+
+    def test_export_identique_a_l_ecran(self):
+        """Le site filtré est celui du menu, à l'écran comme dans le fichier exporté"""
+        plat = Plat.objects.get(nom='Poulet DG')
+        menu_campus = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Campus', est_publie=True,
+            date_limite_commande=timezone.now()
+        )
+        # Collaborateur de Danga qui commande au Campus
+        commande = Commande.objects.create(
+            utilisateur=Utilisateur.objects.get(email='export0@sah.test'), menu=menu_campus, plat=plat,
+            statut='confirmee'
+        )
+        for site in ['Campus', 'Danga']:
+            response = self.client.get(reverse('commandes:gestion_commandes_admin'), {'site': site})
+            affichees = sorted(ligne.id for ligne in response.context['page_obj'])
+            self.assertIn(f"site={site}", response.context['export_query'])
+            export = self.client.get(
+                reverse('commandes:export_commandes', args=['csv']) + '?' + response.context['export_query']
+            )
+            lignes = list(csv.reader(io.StringIO(b''.join(export.streaming_content).decode('utf-8-sig'))))[1:]
+            self.assertEqual(sorted(int(ligne[0]) for ligne in lignes), affichees)
+        self.assertEqual(affichees, sorted(
+            Commande.objects.filter(menu__site='Danga', is_deleted=False).exclude(id=commande.id).values_list('id', flat=True)
+        ))
+
+
+class ConfirmationAutomatiqueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plat = Plat.objects.create(nom='Ndolé', description='-')
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(hours=1)
+        )
+        MenuPlat.objects.create(menu=cls.menu, plat=cls.plat)
+        cls.commandes = [
+            services.passer_commande(
+                Utilisateur.objects.create_user(email=f'auto{i}@sah.test', prenom='A', nom=f'Auto{i}'),
+                cls.menu.id, cls.plat.id
+            )
+            for i in range(4)
+        ]
+        services.annuler_commande(cls.commandes[3], cls.commandes[3].utilisateur)
+        Menu.objects.filter(id=cls.menu.id).update(date_limite_commande=timezone.now() - timedelta(minutes=1))
+
+    def nombre_stat(self, statut):
+        return sum(StatCommandeJour.objects.filter(menu=self.menu, statut=statut).values_list('nombre', flat=True))
+
+    def test_confirme_en_bloc_et_journalise(self):
+        services.changer_statut(self.commandes[0], 'prete', self.commandes[0].utilisateur)
+        self.assertEqual(services.confirmer_commandes_echues(), {self.menu.id: 2})
+
+        statuts = dict(Commande.objects.filter(menu=self.menu).values_list('id', 'statut'))
+        self.assertEqual(
+            [statuts[commande.id] for commande in self.commandes], ['prete', 'confirmee', 'confirmee', 'annulee']
+        )
+        self.assertEqual(HistoriqueStatut.objects.filter(origine='automatique').count(), 2)
+        self.assertEqual(HistoriqueStatut.objects.filter(origine='manuel').count(), 1)
+        self.assertEqual((self.nombre_stat('en_attente'), self.nombre_stat('confirmee')), (0, 2))
+
+        # Idempotent : rien de plus au passage suivant
+        call_command('confirmer_commandes', '--une-fois', stdout=io.StringIO())
+        self.assertEqual(HistoriqueStatut.objects.count(), 3)
+
+    def test_attend_la_date_limite(self):
+        Menu.objects.filter(id=self.menu.id).update(date_limite_commande=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(services.confirmer_commandes_echues(), {})
+        self.assertEqual(Commande.objects.filter(statut='en_attente').count(), 3)
+
+
+class StatutEnMasseTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.prestataire = Utilisateur.objects.create_user(
+            email='cuisine@sah.test', prenom='Chef', nom='Cuisine', role='prestataire'
+        )
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Eru', 'Koki')]
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now()
+        )
+        cls.commandes = []
+        for i, (plat, statut) in enumerate([
+            (0, 'confirmee'), (0, 'confirmee'), (0, 'livree'), (0, 'en_attente'), (1, 'confirmee')
+        ]):
+            utilisateur = Utilisateur.objects.create_user(email=f'masse{i}@sah.test', prenom='M', nom=f'Masse{i}')
+            cls.commandes.append(Commande.objects.create(
+                utilisateur=utilisateur, menu=cls.menu, plat=cls.plats[plat], statut=statut
+            ))
+
+    def setUp(self):
+        self.client.force_login(self.prestataire)
+
+    def statuts(self):
+        return list(Commande.objects.order_by('id').values_list('statut', flat=True))
+
+    def test_plat_du_jour_en_un_update(self):
+        url = reverse('commandes:changer_statut_commandes')
+        donnees = {
+            'statut': 'prete', 'plat_id': self.plats[0].id, 'site': 'Danga',
+            'date': self.menu.date.isoformat(), 'next': '/commandes/prestataire/jour/'
+        }
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.post(url, donnees)
+        self.assertRedirects(response, '/commandes/prestataire/jour/', fetch_redirect_response=False)
+        mises_a_jour = [q['sql'] for q in requetes.captured_queries if q['sql'].startswith('UPDATE "Commandes_commande"')]
+        self.assertEqual(len(mises_a_jour), 1)
+
+        # Livrée et en attente ne peuvent pas devenir prêtes ; l'autre plat n'est pas visé
+        self.assertEqual(self.statuts(), ['prete', 'prete', 'livree', 'en_attente', 'confirmee'])
+        self.assertEqual(
+            set(Commande.objects.filter(statut='prete').values_list('updated_by', 'is_updated')),
+            {(self.prestataire.id, True)}
+        )
+        self.assertEqual(HistoriqueStatut.objects.filter(nouveau_statut='prete', change_par=self.prestataire.id).count(), 2)
+        self.assertEqual(StatCommandeJour.objects.get(plat=self.plats[0], statut='prete').nombre, 2)
+
+    def test_selection_et_statut_refuse(self):
+        url = reverse('commandes:changer_statut_commandes')
+        ids = [self.commandes[3].id, self.commandes[4].id]
+        self.client.post(url, {'statut': 'livree', 'commande_ids': ids})
+        self.assertEqual(self.statuts(), ['confirmee', 'confirmee', 'livree', 'en_attente', 'livree'])
+
+        self.client.post(url, {'statut': 'annulee', 'commande_ids': ids})
+        self.client.post(url, {'statut': 'prete'})
+        self.assertEqual(self.statuts(), ['confirmee', 'confirmee', 'livree', 'en_attente', 'livree'])
+
+        self.client.force_login(Utilisateur.objects.get(email='masse0@sah.test'))
+        self.assertEqual(self.client.post(url, {'statut': 'livree', 'commande_ids': ids}).status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_ecrans_cuisine(self):
+        response = self.client.get(
+            reverse('commandes:commandes_prestataire'), {'date': self.menu.date.isoformat(), 'plat': self.plats[0].id}
+        )
+        self.assertContains(response, reverse('commandes:changer_statut_commandes'))
+        self.assertContains(response, 'form="form-selection">', count=2)
+        response = self.client.get(reverse('commandes:preparation_commandes'))
+        self.assertContains(response, 'name="statut" value="prete"')
+
+
+class ReconciliationCompteursTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Poulet DG', 'Okok')]
+        aujourdhui = timezone.localdate()
+        cls.menus = [
+            Menu.objects.create(
+                jour='lundi', date=date_menu, site='Danga', est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1)
+            )
+            for date_menu in (aujourdhui, aujourdhui - timedelta(weeks=3))
+        ]
+        for menu in cls.menus:
+            for plat in cls.plats:
+                MenuPlat.objects.create(menu=menu, plat=plat)
+        for i, plat in enumerate([0, 0, 1]):
+            utilisateur = Utilisateur.objects.create_user(email=f'compteur{i}@sah.test', prenom='C', nom=f'Compteur{i}')
+            for menu in cls.menus:
+                services.passer_commande(utilisateur, menu.id, cls.plats[plat].id)
+
+    def compteurs(self):
+        return list(MenuPlat.objects.order_by('menu__date', 'plat__nom').values_list('quantite_commandee', flat=True))
+
+    def test_ecarts_signales_puis_corriges(self):
+        self.assertEqual(services.reconcilier_compteurs(), [])
+        # Écritures hors services : compteur modifié à la main, commande supprimée en base
+        MenuPlat.objects.filter(menu=self.menus[0], plat=self.plats[0]).update(quantite_commandee=7)
+        Commande.objects.filter(menu=self.menus[1], plat=self.plats[1]).delete()
+        self.assertEqual(self.compteurs(), [1, 2, 1, 7])
+
+        ecarts = services.reconcilier_compteurs(corriger=False)
+        self.assertEqual(ecarts, [
+            (self.menus[0].id, self.plats[0].id, 7, 2),
+            (self.menus[1].id, self.plats[1].id, 1, 0),
+        ])
+        self.assertEqual(self.compteurs(), [1, 2, 1, 7])
+
+        # Une requête groupée sur les commandes, quelle que soit la taille de la période
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(services.reconcilier_compteurs(), ecarts)
+        self.assertEqual(sum('"Commandes_commande"' in requete['sql'] for requete in requetes.captured_queries), 1)
+        self.assertEqual(self.compteurs(), [0, 2, 1, 2])
+
+    def test_semaine_courante_par_defaut(self):
+        MenuPlat.objects.update(quantite_commandee=0)
+        sortie = io.StringIO()
+        call_command('reconcilier_compteurs', stdout=sortie)
+        self.assertIn('2 compteur(s) corrigé(s)', sortie.getvalue())
+        self.assertEqual(self.compteurs(), [0, 0, 1, 2])
+
+        call_command('reconcilier_compteurs', '--tout', '--verifier', stdout=sortie)
+        self.assertEqual(self.compteurs(), [0, 0, 1, 2])
+        call_command('reconcilier_compteurs', '--tout', stdout=io.StringIO())
+        self.assertEqual(self.compteurs(), [1, 2, 1, 2])
+
+
+class ActiviteUtilisateurTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru', 'Koki')]
+        aujourdhui = timezone.localdate()
+        cls.menus = []
+        for i in range(3):
+            menu = Menu.objects.create(
+                jour='lundi', date=aujourdhui + timedelta(days=i), site='Danga', est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1)
+            )
+            for plat in cls.plats:
+                MenuPlat.objects.create(menu=menu, plat=plat)
+            cls.menus.append(menu)
+        cls.collaborateurs = [
+            Utilisateur.objects.create_user(email=f'activite{i}@sah.test', prenom='A', nom=f'Activite{i}', site='Danga')
+            for i in range(2)
+        ]
+        cls.prestataire = Utilisateur.objects.create_user(
+            email='chef.activite@sah.test', prenom='Chef', nom='Activite', role='prestataire'
+        )
+
+    def resumes(self):
+        champs = [*activite.COMPTEURS, *activite.TOTAUX]
+        return {
+            resume.pk: {champ: getattr(resume, champ) for champ in champs}
+            for resume in ActiviteUtilisateur.objects.all()
+            if any(getattr(resume, champ) for champ in champs)
+        }
+
+    def assertResumesAJour(self):
+        self.assertEqual(self.resumes(), activite.calculer_activite())
+
+    def donner_avis(self, avis, **valeurs):
+        for champ, valeur in valeurs.items():
+            setattr(avis, champ, valeur)
+        with suivi_notes(avis):
+            avis.save()
+        return avis
+
+    def test_suivi_incremental(self):
+        premier, second = self.collaborateurs
+        commandes = [
+            services.passer_commande(premier, self.menus[0].id, self.plats[0].id),
+            services.passer_commande(premier, self.menus[1].id, self.plats[0].id),
+            services.passer_commande(second, self.menus[0].id, self.plats[1].id),
+        ]
+        self.assertResumesAJour()
+        resume = activite.activite(premier)
+        self.assertEqual((resume.nb_commandes, resume.commandes_du_mois(timezone.localdate())), (2, 2))
+
+        services.modifier_commande(commandes[1], self.plats[2].id, '', premier)
+        self.assertResumesAJour()
+        services.changer_statut(commandes[0], 'confirmee', self.prestataire)
+        self.assertResumesAJour()
+        services.annuler_commande(commandes[1], premier)
+        self.assertResumesAJour()
+        # Commande annulée réactivée sur le même plat
+        services.passer_commande(premier, self.menus[1].id, self.plats[2].id)
+        self.assertResumesAJour()
+
+        # Changement en masse : une lecture et une écriture des résumés pour tous les auteurs
+        with CaptureQueriesContext(connection) as requetes:
+            services.changer_statut_en_masse(Commande.objects.filter(menu=self.menus[0]), 'livree', self.prestataire)
+        self.assertEqual(
+            sum('"Commandes_activiteutilisateur"' in requete['sql'] for requete in requetes.captured_queries), 2
+        )
+        self.assertResumesAJour()
+        self.assertEqual(activite.activite(premier).commandes_statut('livree'), 1)
+
+        avis = self.donner_avis(Avis(utilisateur=premier, plat=self.plats[0], commande=commandes[0]), note=4)
+        self.donner_avis(Avis(utilisateur=second, plat=self.plats[1], commande=commandes[2]), note=2)
+        self.assertResumesAJour()
+        self.donner_avis(avis, est_approuve=True, note=5)
+        self.assertResumesAJour()
+        resume = activite.activite(premier)
+        self.assertEqual((resume.nb_avis, resume.moyenne_avis, resume.nb_avis_approuves), (1, 5, 1))
+        self.assertEqual(resume.plats_favoris(), [{'plat__nom': 'Ndolé', 'count': 1}, {'plat__nom': 'Koki', 'count': 1}])
+
+        self.donner_avis(avis, is_deleted=True)
+        self.assertResumesAJour()
+        self.assertEqual(activite.activite(premier).nb_avis, 0)
+
+        # Écriture hors services : la commande de reconstruction remet les résumés d'aplomb
+        Commande.objects.filter(utilisateur=second).delete()
+        call_command('reconstruire_activite', stdout=io.StringIO())
+        self.assertResumesAJour()
+
+    def test_en_tetes_en_une_lecture(self):
+        premier = self.collaborateurs[0]
+        commande = services.passer_commande(premier, self.menus[0].id, self.plats[0].id)
+        services.passer_commande(premier, self.menus[1].id, self.plats[1].id)
+        services.changer_statut(commande, 'confirmee', self.prestataire)
+        self.donner_avis(Avis(utilisateur=premier, plat=self.plats[0], commande=commande), note=3)
+        self.client.force_login(premier)
+
+        # session + utilisateur + résumé + page de commandes
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('commandes:mes_commandes'))
+        self.assertEqual(
+            [response.context[cle] for cle in ('total_commandes', 'commandes_en_attente', 'commandes_confirmees')],
+            [2, 1, 1]
+        )
+        # session + utilisateur + résumé + page d'avis
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('mes_avis'))
+        self.assertEqual(
+            response.context['stats_perso'],
+            {'total_avis': 1, 'moyenne_perso': 3, 'avis_approuves': 0, 'avis_en_attente': 1}
+        )
+        response = self.client.get(reverse('collaborateur_dashboard'))
+        self.assertEqual((response.context['stats']['commandes_mois'], response.context['stats']['nombre_avis']), (2, 1))
+
+        # Profil : résumé lu par clé primaire, noms des plats favoris en une requête
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'Ndolé (1), Eru (1)')
+
+
+class AdminChangelistTest(TestCase):
+
+    CHANGELISTS = [
+        'admin:Commandes_commande_changelist', 'admin:Avis_avis_changelist', 'admin:Menus_menuplat_changelist',
+        'admin:Utilisateurs_utilisateur_changelist', 'admin:Menus_menu_changelist',
+        'admin:Commandes_historiquestatut_changelist',
+        'admin:Commandes_activiteutilisateur_changelist', 'admin:Notifications_envoiemail_changelist',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_superuser(
+            email='root@sah.test', password='x', prenom='Root', nom='Admin'
+        )
+        cls.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Eru', 'Koki')]
+        cls.numero = 0
+        cls.creer_semaine(timezone.localdate())
+
+    @classmethod
+    def creer_semaine(cls, lundi):
+        for jour in range(3):
+            menu = Menu.objects.create(
+                jour='lundi', date=lundi + timedelta(days=jour), site='Danga', est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(days=1)
+            )
+            for plat in cls.plats:
+                MenuPlat.objects.create(menu=menu, plat=plat)
+            for plat in cls.plats * 2:
+                cls.numero += 1
+                utilisateur = Utilisateur.objects.create_user(
+                    email=f'admin{cls.numero}@sah.test', prenom='P', nom=f'Nom{cls.numero}'
+                )
+                commande = services.passer_commande(utilisateur, menu.id, plat.id)
+                avis = Avis(utilisateur=utilisateur, plat=plat, commande=commande, note=cls.numero % 5 + 1)
+                with suivi_notes(avis):
+                    avis.save()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def requetes(self, url, **parametres):
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(url, parametres)
+        self.assertEqual(response.status_code, 200, url)
+        return [requete['sql'] for requete in requetes.captured_queries]
+
+    def test_requetes_bornees(self):
+        avant = {nom: len(self.requetes(reverse(nom))) for nom in self.CHANGELISTS}
+        self.creer_semaine(timezone.localdate() - timedelta(weeks=1))
+        for nom in self.CHANGELISTS:
+            requetes = self.requetes(reverse(nom))
+            self.assertEqual(len(requetes), avant[nom], nom)
+            # Aucun COUNT sur toute la table : sous-requête limitée
+            self.assertFalse([sql for sql in requetes if 'COUNT(' in sql and 'LIMIT' not in sql], nom)
+
+        url = reverse('admin:Commandes_commande_changelist')
+        self.assertEqual(len(self.requetes(url, statut='en_attente', q='Nom1')), avant['admin:Commandes_commande_changelist'])
+        self.requetes(reverse('admin:Avis_avis_changelist'), note='3')
+        self.assertIn('Commande #', str(Commande(id=1)))
+        self.assertIn('anonyme', str(Avis(note=3)))
+
+    def test_actions_en_masse(self):
+        url = reverse('admin:Commandes_commande_changelist')
+        ids = list(Commande.objects.order_by('id').values_list('id', flat=True)[:3])
+        self.client.post(url, {'action': 'passer_confirmee', '_selected_action': ids[:2]})
+        response = self.client.post(url, {'action': 'passer_prete', '_selected_action': ids}, follow=True)
+        self.assertContains(response, '1 commande(s) ignorée(s)')
+        self.assertEqual(list(Commande.objects.filter(id__in=ids).order_by('id').values_list('statut', flat=True)),
+                         ['prete', 'prete', 'en_attente'])
+        commande = Commande.objects.get(id=ids[0])
+        self.assertEqual(StatCommandeJour.objects.get(menu=commande.menu, plat=commande.plat, statut='prete').nombre, 1)
+        actions = [nom for nom, _ in self.client.get(url).context['action_form'].fields['action'].choices]
+        self.assertNotIn('delete_selected', actions)
+
+        url = reverse('admin:Avis_avis_changelist')
+        avis = Avis.objects.order_by('id')[0]
+        self.client.post(url, {'action': 'approuver', '_selected_action': [avis.id]})
+        self.assertEqual(avis.plat.notes.nb_avis, 1)
+        self.assertEqual(activite.activite(avis.utilisateur).nb_avis_approuves, 1)
+        self.assertEqual(recalculer_notes(corriger=False), [])
+        self.assertEqual(self.client.get(reverse('admin:Commandes_commande_add')).status_code, 403)
+
+
+# La base SQLite en mémoire est partagée entre les threads du serveur de test :
+# le profilage y compterait les requêtes de plusieurs navigateurs à la fois
+@override_settings(PROFILAGE_BUDGETS_STRICTS=False)
+class ChargeMidiTest(LiveServerTestCase):
+    """Jeu de données généré puis rush rejoué en miniature contre le serveur de test"""
+
+    def test_generation_et_rush(self):
+        call_command('generer_donnees', '--utilisateurs', 40, '--plats', 8, '--semaines', 1, stdout=io.StringIO())
+        commandes_actives = Commande.objects.filter(is_deleted=False)
+        self.assertGreater(commandes_actives.count(), 0)
+        self.assertEqual(
+            sum(MenuPlat.objects.values_list('quantite_commandee', flat=True)), commandes_actives.count()
+        )
+        self.assertEqual(recalculer_notes(corriger=False), [])
+
+        debut = timezone.now()
+        # Un seul navigateur à la fois : avec la base SQLite de test en mémoire, les threads
+        # du serveur de test partagent une connexion et deux transactions s'y heurteraient
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'charge.json')
+            call_command(
+                'charge_midi', '--url', self.live_server_url, '--duree', 1, '--commandes', 3,
+                '--consultations', 1, '--cuisines', 1, '--threads', 1, '--sortie', chemin, stdout=io.StringIO()
+            )
+            with open(chemin, encoding='utf-8') as fichier:
+                resultats = json.load(fichier)
+            call_command('charge_midi', '--url', self.live_server_url, '--duree', 1, '--commandes', 3,
+                         '--consultations', 0, '--cuisines', 0, '--threads', 1, '--comparer', chemin,
+                         '--tolerance', 10000, stdout=io.StringIO())
+
+        self.assertEqual(resultats['urls']['menus:commander_menu']['requetes'], 6)
+        self.assertEqual(resultats['urls']['menus:commander_menu']['erreurs'], 0)
+        self.assertEqual(resultats['urls']['commandes:commandes_prestataire']['erreurs'], 0)
+        self.assertTrue({'p50_ms', 'p95_ms', 'p99_ms', 'taux_erreur'} <= set(resultats['total']))
+        self.assertEqual(commandes_actives.filter(created_at__gte=debut).count(), 6)
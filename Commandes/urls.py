@@ -14,8 +14,11 @@ urlpatterns = [
     path('admin/gestion/', views.gestion_commandes_admin, name='gestion_commandes_admin'),
     path('admin/modifier-statut/<int:commande_id>/', views.modifier_statut_commande, name='modifier_statut_commande'),
     path('admin/api/stats/', views.api_statistiques_commandes, name='api_statistiques_commandes'),
+    path('admin/export/<str:format_export>/', views.export_commandes, name='export_commandes'),
     
     # Vues pour prestataire
     path('prestataire/jour/', views.commandes_prestataire, name='commandes_prestataire'),
     path('prestataire/preparation/', views.preparation_commandes, name='preparation_commandes'),
+    path('prestataire/flux/', views.flux_commandes_prestataire, name='flux_commandes_prestataire'),
+    path('statut-en-masse/', views.changer_statut_commandes, name='changer_statut_commandes'),
 ]
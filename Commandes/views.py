@@ -1,14 +1,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.db.models import Q, Count, Sum
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+from django.urls import reverse
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 from .models import Commande
+from . import consolidation, evenements, exports, services, statistiques
+from .activite import activite
 from Menus.models import Menu
 from Plats.models import Plat
+from main.pagination import paginer
 
 def is_admin(user):
     """Vérifie si l'utilisateur est un administrateur"""
@@ -31,17 +38,22 @@ def mes_commandes(request):
     commandes = Commande.objects.filter(
         utilisateur=request.user,
         is_deleted=False
-    ).select_related('menu', 'plat').order_by('-created_at')
-    
-    # Pagination
-    paginator = Paginator(commandes, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    ).select_related('menu', 'plat')
+
+    # Statistiques : résumé d'activité lu par clé primaire
+    resume = activite(request.user)
+    en_attente = resume.commandes_statut('en_attente')
+    confirmees = resume.commandes_statut('confirmee')
+
+    # Pagination par curseur : pas d'OFFSET
+    page_obj = paginer(request, commandes, ('-created_at', '-id'), 10)
+
     context = {
         'page_obj': page_obj,
-        'commandes_en_attente': commandes.filter(statut='en_attente').count(),
-        'commandes_confirmees': commandes.filter(statut='confirmee').count(),
+        'total_commandes': resume.nb_commandes,
+        'commandes_en_attente': en_attente,
+        'commandes_confirmees': confirmees,
+        'commandes_autres': resume.nb_commandes - en_attente - confirmees,
     }
     return render(request, 'commandes/collaborateur/mes_commandes.html', context)
 
@@ -73,23 +85,13 @@ def commander_plat(request, menu_id):
         
         if plat_id:
             plat = get_object_or_404(Plat, id=plat_id, est_actif=True)
-            
-        
-            commande = Commande.objects.create(
-                utilisateur=request.user,
-                menu=menu,
-                plat=plat,
-                notes_speciales=notes_speciales,
-                statut='en_attente',
-                created_by=request.user.id
-            )
-            
-            # Mettre à jour le compteur de commandes dans MenuPlat
-            menu_plat = menu.menuplat_set.filter(plat=plat).first()
-            if menu_plat:
-                menu_plat.quantite_commandee += 1
-                menu_plat.save()
-            
+
+            try:
+                services.passer_commande(request.user, menu.id, plat.id, notes_speciales)
+            except services.CommandeRefusee as e:
+                messages.error(request, str(e))
+                return redirect('commandes:commander_plat', menu_id=menu.id)
+
             messages.success(request, f"Votre commande pour {plat.nom} a été enregistrée avec succès.")
             return redirect('mes_commandes')
     
@@ -122,27 +124,12 @@ def modifier_commande(request, commande_id):
         
         if plat_id:
             nouveau_plat = get_object_or_404(Plat, id=plat_id, est_actif=True)
-            
-            # Mettre à jour les compteurs de commandes
-            if commande.plat != nouveau_plat:
-                # Décrémenter l'ancien plat
-                ancien_menu_plat = commande.menu.menuplat_set.filter(plat=commande.plat).first()
-                if ancien_menu_plat:
-                    ancien_menu_plat.quantite_commandee -= 1
-                    ancien_menu_plat.save()
-                
-                # Incrémenter le nouveau plat
-                nouveau_menu_plat = commande.menu.menuplat_set.filter(plat=nouveau_plat).first()
-                if nouveau_menu_plat:
-                    nouveau_menu_plat.quantite_commandee += 1
-                    nouveau_menu_plat.save()
-            
-            # Mettre à jour la commande
-            commande.plat = nouveau_plat
-            commande.notes_speciales = notes_speciales
-            commande.is_updated = True
-            commande.updated_by = request.user.id
-            commande.save()
+
+            try:
+                services.modifier_commande(commande, nouveau_plat.id, notes_speciales, request.user)
+            except services.CommandeRefusee as e:
+                messages.error(request, str(e))
+                return redirect('mes_commandes')
             
             messages.success(request, "Votre commande a été modifiée avec succès.")
             return redirect('mes_commandes')
@@ -164,18 +151,11 @@ def annuler_commande(request, commande_id):
         return redirect('mes_commandes')
     
     if request.method == 'POST':
-        # Décrémenter le compteur de commandes
-        menu_plat = commande.menu.menuplat_set.filter(plat=commande.plat).first()
-        if menu_plat:
-            menu_plat.quantite_commandee -= 1
-            menu_plat.save()
-        
-        # Marquer la commande comme annulée
-        commande.statut = 'annulee'
-        commande.is_deleted = True
-        commande.deleted_at = timezone.now()
-        commande.deleted_by = request.user.id
-        commande.save()
+        try:
+            services.annuler_commande(commande, request.user)
+        except services.CommandeRefusee as e:
+            messages.error(request, str(e))
+            return redirect('mes_commandes')
         
         messages.success(request, "Votre commande a été annulée avec succès.")
         return redirect('mes_commandes')
@@ -193,38 +173,27 @@ def gestion_commandes_admin(request):
     date_debut = request.GET.get('date_debut', '')
     date_fin = request.GET.get('date_fin', '')
     site = request.GET.get('site', '')
-    
-    commandes = Commande.objects.filter(is_deleted=False).select_related(
-        'utilisateur', 'menu', 'plat'
+
+    # Mêmes filtres que l'export : le fichier contient les lignes affichées
+    filtres = {'status': statut, 'date_debut': date_debut, 'date_fin': date_fin, 'site': site}
+    commandes = exports.filtrer_commandes(
+        Commande.objects.filter(is_deleted=False).select_related('utilisateur', 'menu', 'plat'),
+        filtres
     )
     
-    # Filtres
-    if statut:
-        commandes = commandes.filter(statut=statut)
-    
-    if date_debut:
-        commandes = commandes.filter(created_at__date__gte=date_debut)
-    
-    if date_fin:
-        commandes = commandes.filter(created_at__date__lte=date_fin)
-    
-    if site:
-        commandes = commandes.filter(menu__site=site)
-    
     # Statistiques
     stats_commandes = commandes.aggregate(
         total=Count('id'),
         en_attente=Count('id', filter=Q(statut='en_attente')),
         confirmees=Count('id', filter=Q(statut='confirmee')),
         pretes=Count('id', filter=Q(statut='prete')),
-        livrees=Count('id', filter=Q(statut='livree'))
+        livrees=Count('id', filter=Q(statut='livree')),
+        annulees=Count('id', filter=Q(statut='annulee'))
     )
     
-    # Pagination
-    paginator = Paginator(commandes, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    # Pagination par curseur : pas d'OFFSET
+    page_obj = paginer(request, commandes, ('-created_at', '-id'), 10)
+
     context = {
         'page_obj': page_obj,
         'stats_commandes': stats_commandes,
@@ -232,29 +201,42 @@ def gestion_commandes_admin(request):
         'date_debut': date_debut,
         'date_fin': date_fin,
         'site_selected': site,
-        'sites': ['Danga', 'Campus']
+        'sites': ['Danga', 'Campus'],
+        'export_query': urlencode(filtres)
     }
     return render(request, 'commandes/admin/gestion_commandes.html', context)
 
+@login_required
+@user_passes_test(is_admin)
+def export_commandes(request, format_export):
+    """Historique complet des commandes en CSV ou XLSX, produit en flux (filtres d'admin_orders)"""
+    if format_export not in exports.FORMATS:
+        raise Http404
+    commandes = exports.filtrer_commandes(Commande.objects.filter(is_deleted=False), request.GET)
+    response = StreamingHttpResponse(
+        exports.flux_export(format_export, exports.lignes_export(commandes)),
+        content_type=exports.FORMATS[format_export]
+    )
+    nom_fichier = f"commandes-{timezone.localdate():%Y%m%d}.{format_export}"
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 @user_passes_test(is_admin)
 def modifier_statut_commande(request, commande_id):
     """Modifier le statut d'une commande (admin)"""
-    commande = get_object_or_404(Commande, id=commande_id)
+    commande = get_object_or_404(Commande.objects.select_related('menu'), id=commande_id)
     
     if request.method == 'POST':
         nouveau_statut = request.POST.get('statut')
         
         if nouveau_statut in dict(Commande.STATUT_CHOICES):
-            ancien_statut = commande.statut
-            commande.statut = nouveau_statut
-            commande.is_updated = True
-            commande.updated_by = request.user.id
-            commande.save()
+            ancien_statut = services.changer_statut(commande, nouveau_statut, request.user)
             
             messages.success(request, f"Statut de la commande #{commande.id} modifié de '{ancien_statut}' à '{nouveau_statut}'.")
         
-        return redirect('gestion_commandes_admin')
+        return redirect('commandes:gestion_commandes_admin')
     
     context = {
         'commande': commande,
@@ -262,60 +244,98 @@ def modifier_statut_commande(request, commande_id):
     }
     return render(request, 'commandes/admin/modifier_statut.html', context)
 
+def is_admin_ou_prestataire(user):
+    return is_admin(user) or is_prestataire(user)
+
+
+# Valeur de plat_id pour la carte des plats supprimés (commandes sans plat)
+PLAT_VIDE = 'vide'
+
+
+def _selection_commandes(donnees):
+    """Commandes visées par un changement en masse : liste d'identifiants, menu, plat, site et jour.
+
+    plat_id='vide' vise les commandes dont le plat a été supprimé. None si la sélection n'est
+    bornée ni par des identifiants, ni par un menu, ni par une date, ou si plat_id est invalide.
+    """
+    commandes = Commande.objects.all()
+    ids = [commande_id for commande_id in donnees.getlist('commande_ids') if commande_id.isdigit()]
+    menu_id = donnees.get('menu_id', '')
+    date_menu = parse_date(donnees.get('date', ''))
+    if not (ids or menu_id.isdigit() or date_menu):
+        return None
+    if ids:
+        commandes = commandes.filter(id__in=ids)
+    if menu_id.isdigit():
+        commandes = commandes.filter(menu_id=menu_id)
+    if date_menu:
+        commandes = commandes.filter(menu__date=date_menu)
+    if donnees.get('site'):
+        commandes = commandes.filter(menu__site=donnees['site'])
+    if 'plat_id' in donnees:
+        plat_id = donnees['plat_id']
+        if plat_id.isdigit():
+            commandes = commandes.filter(plat_id=plat_id)
+        elif plat_id == PLAT_VIDE:
+            commandes = commandes.filter(plat__isnull=True)
+        else:
+            # Un plat_id illisible ne doit pas élargir la sélection à tout le site
+            return None
+    return commandes
+
+
+@login_required
+@user_passes_test(is_admin_ou_prestataire)
+@require_POST
+def changer_statut_commandes(request):
+    """Statut prête / livrée / confirmée appliqué en une fois à une sélection de commandes"""
+    statut = request.POST.get('statut', '')
+    commandes = _selection_commandes(request.POST)
+    if commandes is None:
+        messages.error(request, "Aucune commande sélectionnée.")
+    else:
+        try:
+            nombre = services.changer_statut_en_masse(commandes, statut, request.user)
+        except services.CommandeRefusee as e:
+            messages.error(request, str(e))
+        else:
+            libelle = dict(Commande.STATUT_CHOICES)[statut].lower()
+            messages.success(request, f"{nombre} commande(s) passée(s) au statut « {libelle} ».")
+
+    suivante = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(suivante, {request.get_host()}, request.is_secure()):
+        suivante = reverse('commandes:commandes_prestataire' if is_prestataire(request.user) else 'admin_orders')
+    return redirect(suivante)
+
 # === VUES PRESTATAIRE ===
 
 @login_required
 @user_passes_test(is_prestataire)
 def commandes_prestataire(request):
     """Vue des commandes pour le prestataire"""
-    date_cible = request.GET.get('date', timezone.now().date())
+    date_cible = parse_date(request.GET.get('date', '')) or timezone.now().date()
     site = request.GET.get('site', 'Danga')
     
-    commandes = Commande.objects.filter(
-        menu__date=date_cible,
-        menu__site=site,
-        statut__in=['confirmee', 'prete'],
-        is_deleted=False
-    ).select_related('utilisateur', 'menu', 'plat').order_by('plat__nom')
+    # Consolidation par plat calculée en SQL
+    consolidation_site = consolidation.consolider(date_cible, [site])[site]
     
-    # Consolidation par plat
-    consolidation_plats = {}
-    for commande in commandes:
-        plat_nom = commande.plat.nom
-        if plat_nom not in consolidation_plats:
-            consolidation_plats[plat_nom] = {
-                'plat': commande.plat,
-                'quantite': 0,
-                'commandes': [],
-                'notes_speciales': []
-            }
-        
-        consolidation_plats[plat_nom]['quantite'] += 1
-        consolidation_plats[plat_nom]['commandes'].append(commande)
-        if commande.notes_speciales:
-            consolidation_plats[plat_nom]['notes_speciales'].append(commande.notes_speciales)
-    
-    # Préparation pour livraison
-    if request.method == 'POST':
-        commande_id = request.POST.get('commande_id')
-        action = request.POST.get('action')
-        
-        if commande_id and action:
-            commande = get_object_or_404(Commande, id=commande_id)
-            if action == 'prete':
-                commande.statut = 'prete'
-                commande.save()
-            elif action == 'livree':
-                commande.statut = 'livree'
-                commande.save()
+    # Les commandes individuelles ne sont chargées que pour le plat déplié
+    plat_deplie = request.GET.get('plat')
+    commandes = []
+    if plat_deplie and plat_deplie.isdigit():
+        commandes = consolidation.commandes_plat(date_cible, site, int(plat_deplie))
     
     context = {
         'commandes': commandes,
-        'consolidation_plats': consolidation_plats,
+        'plat_deplie': int(plat_deplie) if plat_deplie and plat_deplie.isdigit() else None,
+        'consolidation_plats': consolidation_site['plats_quantites'],
         'date_cible': date_cible,
+        'jour_precedent': date_cible - timedelta(days=1),
+        'jour_suivant': date_cible + timedelta(days=1),
         'site_selected': site,
         'sites': ['Danga', 'Campus'],
-        'total_commandes': commandes.count()
+        'total_commandes': consolidation_site['total_commandes'],
+        'a_preparer': sum(data['statut_confirmee'] for data in consolidation_site['plats_quantites'].values())
     }
     return render(request, 'commandes/prestataire/commandes_jour.html', context)
 
@@ -326,37 +346,8 @@ def preparation_commandes(request):
     aujourdhui = timezone.now().date()
     sites = ['Danga', 'Campus']
     
-    preparation_data = {}
-    for site in sites:
-        commandes_site = Commande.objects.filter(
-            menu__date=aujourdhui,
-            menu__site=site,
-            statut__in=['confirmee', 'prete'],
-            is_deleted=False
-        ).select_related('plat')
-        
-        # Regroupement par plat
-        plats_quantites = {}
-        for commande in commandes_site:
-            plat_key = f"{commande.plat.nom}"
-            if plat_key not in plats_quantites:
-                plats_quantites[plat_key] = {
-                    'plat': commande.plat,
-                    'quantite': 0,
-                    'statut_prete': 0,
-                    'statut_confirmee': 0
-                }
-            
-            plats_quantites[plat_key]['quantite'] += 1
-            if commande.statut == 'prete':
-                plats_quantites[plat_key]['statut_prete'] += 1
-            else:
-                plats_quantites[plat_key]['statut_confirmee'] += 1
-        
-        preparation_data[site] = {
-            'plats_quantites': plats_quantites,
-            'total_commandes': commandes_site.count()
-        }
+    # Une seule requête groupée pour tous les sites
+    preparation_data = consolidation.consolider(aujourdhui, sites)
     
     context = {
         'preparation_data': preparation_data,
@@ -364,33 +355,45 @@ def preparation_commandes(request):
     }
     return render(request, 'commandes/prestataire/preparation.html', context)
 
+@login_required
+@user_passes_test(is_prestataire)
+async def flux_commandes_prestataire(request):
+    """Flux SSE des événements de commandes d'un site et d'une date (servi par main.asgi)"""
+    date_cible = parse_date(request.GET.get('date', '')) or timezone.now().date()
+    site = request.GET.get('site', 'Danga')
+    nom_canal = evenements.canal(site, date_cible)
+
+    async def flux():
+        abonnement = evenements.get_bus().abonner(nom_canal)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                evenement = await abonnement.prochain(timeout=15)
+                if evenement is None:
+                    # Commentaire SSE pour garder la connexion ouverte
+                    yield ": ping\n\n"
+                else:
+                    yield evenements.format_sse(evenement)
+        finally:
+            abonnement.fermer()
+
+    response = StreamingHttpResponse(flux(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # === API POUR STATISTIQUES ===
 
 @login_required
 @user_passes_test(is_admin)
 def api_statistiques_commandes(request):
     """API pour les statistiques des commandes"""
-    date_debut = request.GET.get('date_debut', (timezone.now() - timedelta(days=30)).date())
-    date_fin = request.GET.get('date_fin', timezone.now().date())
-    
-    commandes = Commande.objects.filter(
-        created_at__date__range=[date_debut, date_fin],
-        is_deleted=False
-    )
-    
-    # Statistiques par jour
-    stats_par_jour = commandes.extra(
-        {'date': "DATE(created_at)"}
-    ).values('date').annotate(
-        total=Count('id'),
-        confirmees=Count('id', filter=Q(statut='confirmee')),
-        livrees=Count('id', filter=Q(statut='livree'))
-    ).order_by('date')
+    date_debut = parse_date(request.GET.get('date_debut', '')) or (timezone.now() - timedelta(days=30)).date()
+    date_fin = parse_date(request.GET.get('date_fin', '')) or timezone.now().date()
     
-    # Statistiques par plat
-    stats_par_plat = commandes.values('plat__nom').annotate(
-        total=Count('id')
-    ).order_by('-total')[:10]
+    # Lecture dans la table pré-agrégée StatCommandeJour
+    stats_par_jour = statistiques.stats_par_jour(date_debut, date_fin)
+    stats_par_plat = statistiques.top_plats(date_debut, date_fin)
     
     return JsonResponse({
         'stats_par_jour': list(stats_par_jour),
@@ -1,19 +1,35 @@
 from django.contrib import admin
+from main.pagination import PaginateurPlafonne
 from .models import Menu, MenuPlat
 
 class MenuPlatInline(admin.TabularInline):
     model = MenuPlat
     extra = 1
+    # Autocomplétion : pas de liste complète des plats chargée pour chaque ligne
+    autocomplete_fields = ('plat',)
+    # Tenu par les commandes (Commandes.services) et par reconcilier_compteurs
+    readonly_fields = ('quantite_commandee',)
 
 @admin.register(Menu)
 class MenuAdmin(admin.ModelAdmin):
     list_display = ('date', 'jour', 'site', 'est_publie', 'date_limite_commande')
-    list_filter = ('site', 'est_publie', 'date')
+    list_filter = ('site', 'est_publie')
     search_fields = ('jour', 'site')
+    date_hierarchy = 'date'
     inlines = [MenuPlatInline]
     list_editable = ('est_publie',)
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
 
 @admin.register(MenuPlat)
 class MenuPlatAdmin(admin.ModelAdmin):
     list_display = ('menu', 'plat', 'quantite_prevue', 'quantite_commandee')
-    list_filter = ('menu__site', 'menu__date')
\ No newline at end of file
+    list_filter = ('menu__site',)
+    list_select_related = ('menu', 'plat')
+    search_fields = ('plat__nom',)
+    date_hierarchy = 'menu__date'
+    raw_id_fields = ('menu',)
+    autocomplete_fields = ('plat',)
+    readonly_fields = ('quantite_commandee',)
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
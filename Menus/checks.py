@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register()
+def cache_partage_entre_workers(app_configs, **kwargs):
+    """La version des menus doit être partagée : un cache locmem par processus garde des snapshots périmés"""
+    workers = getattr(settings, 'SAH_WORKERS', 1)
+    if workers > 1 and settings.CACHES['default']['BACKEND'] == LOCMEM:
+        return [Warning(
+            f"Cache locmem avec {workers} workers : invalider_menus() ne touche que le "
+            "processus qui modifie le menu, les autres servent l'ancien snapshot.",
+            hint="Utiliser SAH_CACHE=file (SAH_CACHE_DIR) ou un cache partagé.",
+            id='menus.W001',
+        )]
+    return []
@@ -1,6 +1,9 @@
 from django import forms
-from django.forms import modelformset_factory
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.forms import BaseInlineFormSet, inlineformset_factory
 from .models import Menu, MenuPlat
+from .services import invalider_menus, plats_actifs
 from Plats.models import Plat
 
 class MenuForm(forms.ModelForm):
@@ -26,8 +29,26 @@ class MenuForm(forms.ModelForm):
             })
         }
 
+class ChoixCharge(forms.ModelChoiceField):
+    """ModelChoiceField validé sur des objets déjà chargés par le formset, sans requête par formulaire"""
+
+    def __init__(self, queryset, objets=None, **kwargs):
+        super().__init__(queryset, **kwargs)
+        self.objets = objets
+
+    def to_python(self, value):
+        if self.objets is None:
+            return super().to_python(value)
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objets[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+
 class MenuPlatForm(forms.ModelForm):
-    plat = forms.ModelChoiceField(
+    plat = ChoixCharge(
         queryset=Plat.objects.filter(est_actif=True, is_deleted=False),
         widget=forms.Select(attrs={'class': 'form-control'}),
         label="Plat"
@@ -48,9 +69,94 @@ class MenuPlatForm(forms.ModelForm):
             })
         }
 
-MenuPlatFormSet = modelformset_factory(
+    def _get_validation_exclusions(self):
+        # Plat déjà validé par ChoixCharge : full_clean ne revérifie pas la clé étrangère (une requête par ligne)
+        exclusions = super()._get_validation_exclusions()
+        exclusions.add('plat')
+        return exclusions
+
+
+class BaseMenuPlatFormSet(BaseInlineFormSet):
+    """Plats d'un seul menu. Le nombre de requêtes ne dépend ni du nombre de
+    plats affichés ni de l'historique : lignes du menu (1), plats actifs (cache),
+    plats soumis (1) ; l'enregistrement n'écrit que les lignes modifiées, par lots."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plats_disponibles = plats_actifs()
+        self._choix_plats = [('', '---------')] + [(plat['id'], plat['nom']) for plat in self.plats_disponibles]
+        self._plats_soumis = None
+        self._lignes = None
+
+    def lignes(self):
+        """{id: MenuPlat} des lignes du menu, lues une fois pour l'affichage et la validation"""
+        if self._lignes is None:
+            self._lignes = {ligne.pk: ligne for ligne in self.get_queryset()}
+        return self._lignes
+
+    def plats_soumis(self):
+        """{id: Plat} des plats choisis dans les données soumises, en une requête"""
+        if self._plats_soumis is None:
+            prefixe = self.prefix + '-'
+            ids = {
+                int(valeur) for cle, valeur in self.data.items()
+                if cle.startswith(prefixe) and cle.endswith('-plat') and str(valeur).isdigit()
+            }
+            self._plats_soumis = Plat.objects.filter(est_actif=True, is_deleted=False).in_bulk(ids) if ids else {}
+        return self._plats_soumis
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # Lignes existantes retrouvées parmi celles du menu, déjà lues pour l'affichage
+        champ_id = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = ChoixCharge(
+            champ_id.queryset, objets=self.lignes(),
+            initial=champ_id.initial, required=False, widget=champ_id.widget
+        )
+        champ_plat = form.fields['plat']
+        champ_plat.choices = self._choix_plats
+        if self.is_bound:
+            champ_plat.objets = self.plats_soumis()
+
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit=False)
+
+        supprimes = [form.instance for form in self.deleted_forms if form.instance.pk is not None]
+        modifies, nouveaux = [], []
+        self.changed_objects = []
+        for form in self.initial_forms:
+            if form.instance.pk is not None and form not in self.deleted_forms and form.has_changed():
+                modifies.append(form.save(commit=False))
+                self.changed_objects.append((form.instance, form.changed_data))
+        for form in self.extra_forms:
+            if form.has_changed() and form not in self.deleted_forms:
+                menu_plat = form.save(commit=False)
+                # Menu créé par le même formulaire : enregistré après la construction du formset
+                menu_plat.menu = self.instance
+                nouveaux.append(menu_plat)
+
+        if supprimes or modifies or nouveaux:
+            with transaction.atomic():
+                if supprimes:
+                    MenuPlat.objects.filter(menu=self.instance, pk__in=[ligne.pk for ligne in supprimes]).delete()
+                if modifies:
+                    # quantite_commandee n'est pas réécrit : les commandes en cours le mettent à jour
+                    MenuPlat.objects.bulk_update(modifies, self.form._meta.fields)
+                if nouveaux:
+                    MenuPlat.objects.bulk_create(nouveaux)
+                # bulk_update et bulk_create n'envoient pas de signal aux snapshots
+                transaction.on_commit(invalider_menus)
+        self.deleted_objects = supprimes
+        self.new_objects = nouveaux
+        return modifies + nouveaux
+
+
+MenuPlatFormSet = inlineformset_factory(
+    Menu,
     MenuPlat,
     form=MenuPlatForm,
+    formset=BaseMenuPlatFormSet,
     extra=1,
     can_delete=True
 )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from Menus.services import preparer_semaines
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée les menus squelettes (non publiés) des semaines à venir pour chaque site. "
+        "À planifier, par exemple chaque vendredi : python manage.py preparer_menus_semaine --semaines 2"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', help="Un jour de la première semaine (AAAA-MM-JJ), semaine courante par défaut")
+        parser.add_argument('--semaines', type=int, default=1)
+
+    def handle(self, *args, **options):
+        date_debut = None
+        if options['debut']:
+            date_debut = parse_date(options['debut'])
+            if date_debut is None:
+                raise CommandError("Date invalide, format attendu : AAAA-MM-JJ")
+        nombre = preparer_semaines(date_debut, nb_semaines=options['semaines'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} menus créés."))
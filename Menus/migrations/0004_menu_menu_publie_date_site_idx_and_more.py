@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Menus', '0003_menu_description_menu_titre_menuplat_prix_and_more'),
+        ('Plats', '0003_plat_plat_actif_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('est_publie', True)), fields=['date', 'site'], name='menu_publie_date_site_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('est_publie', True)), fields=['date_limite_commande'], name='menu_publie_limite_idx'),
+        ),
+    ]
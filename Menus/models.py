@@ -42,6 +42,20 @@ class Menu(models.Model):
     class Meta:
         unique_together = ['date', 'site', 'jour']
         ordering = ['date', 'site']
+        indexes = [
+            # Menus publiés d'une semaine / d'un site
+            models.Index(
+                fields=['date', 'site'],
+                condition=models.Q(est_publie=True),
+                name='menu_publie_date_site_idx'
+            ),
+            # Menus publiés dont la date limite approche
+            models.Index(
+                fields=['date_limite_commande'],
+                condition=models.Q(est_publie=True),
+                name='menu_publie_limite_idx'
+            ),
+        ]
 
 class MenuPlat(models.Model):
     menu = models.ForeignKey(Menu, on_delete=models.SET_NULL, null=True, blank=True)
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+from .models import Menu, MenuPlat
+
+
+def charger_menus_semaine(date_debut, date_fin, utilisateur=None, site=None):
+    """Menus publiés de la période avec leurs plats, en deux requêtes.
+
+    Avec un utilisateur, chaque menu porte commande_existante (commande active
+    sur ce menu) et avis_donne (avis laissé sur une commande de ce menu).
+    """
+    from Avis.models import Avis
+    from Commandes.models import Commande
+
+    menus = Menu.objects.filter(
+        date__gte=date_debut,
+        date__lte=date_fin,
+        est_publie=True
+    ).prefetch_related(
+        Prefetch('menuplat_set', queryset=MenuPlat.objects.select_related('plat').order_by('plat__nom'))
+    ).order_by('date', 'site')
+
+    if site:
+        menus = menus.filter(site=site)
+    if utilisateur is not None:
+        menus = menus.annotate(
+            commande_existante=Exists(Commande.objects.filter(
+                utilisateur=utilisateur, menu=OuterRef('pk'), is_deleted=False
+            )),
+            avis_donne=Exists(Avis.objects.filter(
+                utilisateur=utilisateur, commande__menu=OuterRef('pk'), is_deleted=False
+            ))
+        )
+
+    maintenant = timezone.now()
+    menus = list(menus)
+    for menu in menus:
+        menu.commandes_ouvertes = maintenant < menu.date_limite_commande
+    return menus
+
+
+CLE_VERSION_MENUS = 'menus:version'
+DUREE_SNAPSHOT = 60 * 60 * 24 * 7
+
+
+def version_menus():
+    """Horodatage (ms) de la dernière modification d'un menu, d'un plat ou d'une composition"""
+    version = cache.get(CLE_VERSION_MENUS)
+    if version is None:
+        # Cache vide (redémarrage) : nouvelle version, les anciens ETag ne correspondent plus
+        version = int(time.time() * 1000)
+        cache.add(CLE_VERSION_MENUS, version, None)
+        version = cache.get(CLE_VERSION_MENUS, version)
+    return version
+
+
+def invalider_menus():
+    """Passe à une nouvelle version : les snapshots de l'ancienne ne sont plus lus"""
+    version = max(int(time.time() * 1000), version_menus() + 1)
+    cache.set(CLE_VERSION_MENUS, version, None)
+    return version
+
+
+def _menu_snapshot(menu):
+    return {
+        'id': menu.id,
+        'jour': menu.jour,
+        'date': menu.date,
+        'site': menu.site,
+        'titre': menu.titre,
+        'description': menu.description,
+        'date_limite_commande': menu.date_limite_commande,
+        'max_commandes': menu.max_commandes,
+        'plats': [
+            {
+                'id': menu_plat.plat.id,
+                'nom': menu_plat.plat.nom,
+                'description': menu_plat.plat.description,
+                'allergenes': menu_plat.plat.allergenes,
+                'image': menu_plat.plat.image.url if menu_plat.plat.image else '',
+                'prix': menu_plat.prix,
+            }
+            for menu_plat in menu.menuplat_set.all()
+            if menu_plat.plat is not None
+        ],
+    }
+
+
+def snapshot_semaine(date_debut, date_fin, site=None):
+    """Menus publiés de la période sous forme de dicts (templates et JSON), mis en cache par version"""
+    version = version_menus()
+    cle = f'menus:snapshot:{version}:{site or "tous"}:{date_debut.isoformat()}:{date_fin.isoformat()}'
+    snapshot = cache.get(cle)
+    if snapshot is None:
+        snapshot = {
+            'version': version,
+            'modifie_le': datetime.fromtimestamp(version / 1000, tz=dt_timezone.utc),
+            'site': site or '',
+            'date_debut': date_debut,
+            'date_fin': date_fin,
+            'menus': [_menu_snapshot(menu) for menu in charger_menus_semaine(date_debut, date_fin, site=site)],
+        }
+        cache.set(cle, snapshot, DUREE_SNAPSHOT)
+    return snapshot
+
+
+def plats_actifs():
+    """[{'id', 'nom'}] des plats proposables dans un menu, mis en cache par version
+    (toute modification d'un plat change la version)"""
+    from Plats.models import Plat
+
+    cle = f'menus:plats_actifs:{version_menus()}'
+    plats = cache.get(cle)
+    if plats is None:
+        plats = list(Plat.objects.filter(est_actif=True, is_deleted=False).order_by('nom', 'id').values('id', 'nom'))
+        cache.set(cle, plats, DUREE_SNAPSHOT)
+    return plats
+
+
+def menus_utilisateur(snapshot, utilisateur):
+    """Copies des menus du snapshot avec commande_existante et commandes_ouvertes (1 requête)"""
+    from Commandes.models import Commande
+
+    ids = [menu['id'] for menu in snapshot['menus']]
+    commandes = set(Commande.objects.filter(
+        utilisateur=utilisateur, menu_id__in=ids, is_deleted=False
+    ).values_list('menu_id', flat=True)) if ids else set()
+
+    maintenant = timezone.now()
+    return [
+        dict(
+            menu,
+            commande_existante=menu['id'] in commandes,
+            commandes_ouvertes=maintenant < menu['date_limite_commande']
+        )
+        for menu in snapshot['menus']
+    ]
+
+
+# Stock restant : relu au plus toutes les DUREE_STOCK secondes par période et par
+# site, quel que soit le nombre de collaborateurs qui interrogent la page
+DUREE_STOCK = 2
+
+
+def _restant(limite, commandees):
+    # None : pas de limite
+    return max(limite - commandees, 0) if limite else None
+
+
+def _plus_petit(*restants):
+    limites = [restant for restant in restants if restant is not None]
+    return min(limites) if limites else None
+
+
+def calculer_stock(date_debut, date_fin, site=None):
+    """Places restantes par menu et par plat, en une requête sur MenuPlat (sans lire les commandes).
+
+    Le restant d'un plat est borné par celui du menu (max_commandes) ; None
+    signifie sans limite.
+    """
+    lignes = MenuPlat.objects.filter(
+        menu__date__gte=date_debut,
+        menu__date__lte=date_fin,
+        menu__est_publie=True,
+        menu__is_deleted=False,
+        plat__isnull=False
+    )
+    if site:
+        lignes = lignes.filter(menu__site=site)
+
+    menus = {}
+    for menu_id, max_commandes, plat_id, quantite_max, quantite_commandee in lignes.values_list(
+        'menu_id', 'menu__max_commandes', 'plat_id', 'quantite_max', 'quantite_commandee'
+    ):
+        menu = menus.setdefault(menu_id, {'max_commandes': max_commandes, 'commandees': 0, 'plats': {}})
+        menu['commandees'] += quantite_commandee
+        menu['plats'][plat_id] = _restant(quantite_max, quantite_commandee)
+
+    stock = {}
+    for menu_id, menu in menus.items():
+        restant_menu = _restant(menu['max_commandes'], menu['commandees'])
+        stock[str(menu_id)] = {
+            'restant': restant_menu,
+            'plats': {
+                str(plat_id): _plus_petit(restant, restant_menu)
+                for plat_id, restant in menu['plats'].items()
+            },
+        }
+    return stock
+
+
+def stock_semaine(date_debut, date_fin, site=None):
+    """Stock de la période (calculer_stock) avec une version dérivée du contenu, gardé DUREE_STOCK secondes"""
+    cle = f'menus:stock:{site or "tous"}:{date_debut.isoformat()}:{date_fin.isoformat()}'
+    stock = cache.get(cle)
+    if stock is None:
+        menus = calculer_stock(date_debut, date_fin, site=site)
+        version = hashlib.md5(json.dumps(menus, sort_keys=True).encode()).hexdigest()[:16]
+        stock = {'version': version, 'menus': menus}
+        cache.set(cle, stock, DUREE_STOCK)
+    return stock
+
+
+def avec_stock(menus, stock):
+    """Copies des menus (dicts de menus_utilisateur) portant le restant du menu et de chaque plat"""
+    resultat = []
+    for menu in menus:
+        stock_menu = stock.get(str(menu['id']), {'restant': None, 'plats': {}})
+        plats = [dict(plat, restant=stock_menu['plats'].get(str(plat['id']))) for plat in menu['plats']]
+        resultat.append(dict(
+            menu,
+            restant=stock_menu['restant'],
+            plats=plats,
+            # Complet aussi quand chaque plat a atteint sa propre limite
+            complet=stock_menu['restant'] == 0 or bool(plats) and all(plat['restant'] == 0 for plat in plats)
+        ))
+    return resultat
+
+
+def preparer_semaines(date_debut=None, nb_semaines=1, cree_par=None):
+    """Crée les menus squelettes (non publiés) du lundi au vendredi pour chaque site.
+
+    Un SELECT des menus existants puis un seul bulk_create ; ignore_conflicts
+    couvre une préparation concurrente (unicité date / site / jour).
+    Retourne le nombre de menus réellement insérés, relus par leur created_at
+    commun : les lignes ignorées au profit d'une préparation concurrente ne
+    sont pas comptées.
+    """
+    from Utilisateurs.models import SITE_CHOICES
+
+    date_debut = date_debut or timezone.localdate()
+    lundi = date_debut - timedelta(days=date_debut.weekday())
+    dates = [
+        lundi + timedelta(weeks=semaine, days=jour)
+        for semaine in range(nb_semaines)
+        for jour in range(len(Menu.JOURS_SEMAINE))
+    ]
+    sites = [site for site, _ in SITE_CHOICES]
+    menus_periode = Menu.objects.filter(date__gte=dates[0], date__lte=dates[-1], site__in=sites)
+
+    existants = set(menus_periode.values_list('date', 'site'))
+    maintenant = timezone.now()
+
+    nouveaux = [
+        Menu(
+            date=date_menu,
+            site=site,
+            jour=Menu.JOURS_SEMAINE[date_menu.weekday()][0],
+            date_limite_commande=timezone.make_aware(
+                datetime.combine(date_menu, datetime.min.time())
+            ) + timedelta(hours=12),
+            created_at=maintenant,
+            created_by=cree_par.id if cree_par else None
+        )
+        for date_menu in dates
+        for site in sites
+        if (date_menu, site) not in existants
+    ]
+    if not nouveaux:
+        return 0
+    Menu.objects.bulk_create(nouveaux, ignore_conflicts=True)
+    return menus_periode.filter(created_at=maintenant).count()
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from Plats.models import Plat
+from .models import Menu, MenuPlat
+from .services import invalider_menus
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=MenuPlat)
+@receiver(post_delete, sender=MenuPlat)
+@receiver(post_save, sender=Plat)
+@receiver(post_delete, sender=Plat)
+def invalider_snapshot_menus(sender, **kwargs):
+    """Toute modification (dont publication / dépublication) change la version des snapshots"""
+    update_fields = kwargs.get('update_fields')
+    if sender is MenuPlat and update_fields and set(update_fields) <= {'quantite_commandee'}:
+        return
+    # Après validation : un snapshot reconstruit entre-temps lirait encore l'ancien état
+    transaction.on_commit(invalider_menus)
@@ -1,3 +1,310 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from Commandes.services import CommandeRefusee, passer_commande
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+from .checks import cache_partage_entre_workers
+from .models import Menu, MenuPlat
+from .services import plats_actifs, preparer_semaines, snapshot_semaine, stock_semaine, version_menus
+
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+FICHIER = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/sah'}}
+
+
+class CacheWorkersCheckTest(SimpleTestCase):
+    """Plusieurs workers sur un cache locmem : chacun garderait sa propre version des menus"""
+
+    @override_settings(SAH_WORKERS=4, CACHES=LOCMEM)
+    def test_locmem_avec_plusieurs_workers(self):
+        self.assertEqual([w.id for w in cache_partage_entre_workers(None)], ['menus.W001'])
+
+    @override_settings(SAH_WORKERS=1, CACHES=LOCMEM)
+    def test_locmem_un_seul_worker(self):
+        self.assertEqual(cache_partage_entre_workers(None), [])
+
+    @override_settings(SAH_WORKERS=4, CACHES=FICHIER)
+    def test_cache_partage(self):
+        self.assertEqual(cache_partage_entre_workers(None), [])
+
+
+class SnapshotMenusTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        today = timezone.localdate()
+        self.lundi = today - timedelta(days=today.weekday())
+        self.vendredi = self.lundi + timedelta(days=4)
+        self.menu = Menu.objects.create(
+            jour='lundi', date=self.lundi, site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(days=1)
+        )
+        self.plat = Plat.objects.create(nom='Yassa', description='-')
+        MenuPlat.objects.create(menu=self.menu, plat=self.plat, prix=2500)
+
+    def test_snapshot_en_cache(self):
+        snapshot = snapshot_semaine(self.lundi, self.vendredi, site='Danga')
+        self.assertEqual(snapshot['menus'][0]['plats'][0]['nom'], 'Yassa')
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshot_semaine(self.lundi, self.vendredi, site='Danga'), snapshot)
+
+    def test_invalidation_modification_plat(self):
+        snapshot_semaine(self.lundi, self.vendredi)
+        version = version_menus()
+        self.plat.nom = 'Yassa poulet'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plat.save()
+        self.assertGreater(version_menus(), version)
+        self.assertEqual(snapshot_semaine(self.lundi, self.vendredi)['menus'][0]['plats'][0]['nom'], 'Yassa poulet')
+
+    def test_invalidation_depublication(self):
+        snapshot_semaine(self.lundi, self.vendredi)
+        self.menu.est_publie = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu.save()
+        self.assertEqual(snapshot_semaine(self.lundi, self.vendredi)['menus'], [])
+
+    def test_api_revalidation(self):
+        utilisateur = Utilisateur.objects.create_user(email='collab@sah.test', prenom='C', nom='L')
+        self.client.force_login(utilisateur)
+        url = reverse('menus:api_menus_semaine') + '?site=Danga'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['menus'][0]['plats'][0]['prix'], '2500.00')
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # session + utilisateur seulement : ni snapshot ni sérialisation
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class PreparationSemaineTest(TestCase):
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.lundi = today - timedelta(days=today.weekday())
+
+    def test_preparer_semaines_en_un_bulk_create(self):
+        # SELECT des existants, bulk_create, puis relecture des menus insérés
+        with self.assertNumQueries(3):
+            self.assertEqual(preparer_semaines(self.lundi + timedelta(days=2), nb_semaines=2), 20)
+        self.assertEqual(Menu.objects.filter(date=self.lundi, jour='lundi', est_publie=False).count(), 2)
+        self.assertEqual(Menu.objects.filter(date=self.lundi + timedelta(days=11), jour='vendredi').count(), 2)
+        # Les menus existants sont conservés
+        with self.assertNumQueries(1):
+            self.assertEqual(preparer_semaines(self.lundi, nb_semaines=2), 0)
+        self.assertEqual(Menu.objects.count(), 20)
+
+    def test_preparation_concurrente_non_comptee(self):
+        """Un menu inséré entre le SELECT et le bulk_create n'est pas compté comme créé"""
+        concurrent = []
+
+        def preparation_concurrente(execute, sql, params, many, context):
+            if sql.startswith('INSERT') and not concurrent:
+                concurrent.append(sql)
+                Menu.objects.create(date=self.lundi, site='Danga', jour='lundi', date_limite_commande=timezone.now())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(preparation_concurrente):
+            self.assertEqual(preparer_semaines(self.lundi), 9)
+        self.assertEqual(Menu.objects.count(), 10)
+
+    def test_commande_planifiee(self):
+        call_command('preparer_menus_semaine', '--semaines', '3', stdout=StringIO())
+        self.assertEqual(Menu.objects.count(), 30)
+
+    def test_page_de_gestion_sans_ecriture(self):
+        prestataire = Utilisateur.objects.create_user(
+            email='presta@sah.test', prenom='P', nom='Resta', role='prestataire'
+        )
+        self.client.force_login(prestataire)
+        url = reverse('menus:prestataire_gerer_menus_semaine')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Menu.objects.count(), 0)
+        self.assertContains(response, 'preparer_semaine')
+
+        self.client.post(url, {'action': 'preparer_semaine'})
+        self.assertEqual(Menu.objects.filter(created_by=prestataire.id).count(), 10)
+
+
+class StockMenusTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        today = timezone.localdate()
+        self.lundi = today - timedelta(days=today.weekday())
+        self.vendredi = self.lundi + timedelta(days=4)
+        self.menu = Menu.objects.create(
+            jour='lundi', date=self.lundi, site='Danga', est_publie=True, max_commandes=3,
+            date_limite_commande=timezone.now() + timedelta(days=1)
+        )
+        self.yassa = Plat.objects.create(nom='Yassa', description='-')
+        self.mafe = Plat.objects.create(nom='Mafé', description='-')
+        MenuPlat.objects.create(menu=self.menu, plat=self.yassa, prix=2500, quantite_max=1)
+        MenuPlat.objects.create(menu=self.menu, plat=self.mafe, prix=2000)
+        self.collaborateurs = [
+            Utilisateur.objects.create_user(email=f'collab{i}@sah.test', prenom='C', nom=str(i), site='Danga')
+            for i in range(4)
+        ]
+
+    def _stock(self):
+        cache.clear()
+        return stock_semaine(self.lundi, self.vendredi)['menus'][str(self.menu.id)]
+
+    def test_restant_borne_par_le_menu(self):
+        self.assertEqual(self._stock(), {'restant': 3, 'plats': {str(self.yassa.id): 1, str(self.mafe.id): 3}})
+
+        passer_commande(self.collaborateurs[0], self.menu.id, self.yassa.id)
+        self.assertEqual(self._stock(), {'restant': 2, 'plats': {str(self.yassa.id): 0, str(self.mafe.id): 2}})
+        with self.assertRaisesMessage(CommandeRefusee, 'complet'):
+            passer_commande(self.collaborateurs[1], self.menu.id, self.yassa.id)
+
+        passer_commande(self.collaborateurs[1], self.menu.id, self.mafe.id)
+        passer_commande(self.collaborateurs[2], self.menu.id, self.mafe.id)
+        self.assertEqual(self._stock()['restant'], 0)
+        with self.assertRaisesMessage(CommandeRefusee, 'maximum'):
+            passer_commande(self.collaborateurs[3], self.menu.id, self.mafe.id)
+
+    def test_api_sans_lecture_des_commandes(self):
+        passer_commande(self.collaborateurs[0], self.menu.id, self.yassa.id)
+        cache.clear()
+        self.client.force_login(self.collaborateurs[1])
+        url = reverse('menus:api_stock_semaine') + '?site=Danga'
+
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['menus'][str(self.menu.id)]['plats'][str(self.yassa.id)], 0)
+        self.assertFalse([requete for requete in requetes if 'commandes_commande' in requete['sql'].lower()])
+
+        # Stock inchangé : 304, et le stock en cache n'est pas relu
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_menu_complet_affiche(self):
+        for collaborateur, plat in zip(self.collaborateurs, [self.yassa, self.mafe, self.mafe]):
+            passer_commande(collaborateur, self.menu.id, plat.id)
+        cache.clear()
+        self.client.force_login(self.collaborateurs[3])
+
+        response = self.client.get(reverse('menus:menus_semaine'))
+        self.assertContains(response, f'data-stock-url="{reverse("menus:api_stock_semaine")}')
+        self.assertContains(response, f'data-complet-menu="{self.menu.id}"')
+        self.assertTrue(response.context['menus_semaine'][0]['complet'])
+
+        response = self.client.get(reverse('menus:commander_menu', args=[self.menu.id]))
+        self.assertTrue(response.context['menu_complet'])
+        self.assertContains(response, 'id="submitBtn" disabled')
+
+
+class EditeurPlatsMenuTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = Utilisateur.objects.create_user(email='admin@sah.test', prenom='A', nom='Admin', role='admin')
+        self.plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Eru', 'Koki', 'Ndolé', 'Okok')]
+        self.lundi = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+        self.menu = self.creer_menu(self.lundi, self.plats[:2])
+        self.lignes = list(MenuPlat.objects.filter(menu=self.menu).order_by('id'))
+        self.client.force_login(self.admin)
+        self.url = reverse('menus:modifier_menu', args=[self.menu.id])
+
+    def creer_menu(self, date_menu, plats, site='Danga'):
+        menu = Menu.objects.create(
+            jour='lundi', date=date_menu, site=site, est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(days=1)
+        )
+        MenuPlat.objects.bulk_create([MenuPlat(menu=menu, plat=plat, prix=1000) for plat in plats])
+        return menu
+
+    def creer_historique(self, semaines):
+        for semaine in range(1, semaines + 1):
+            self.creer_menu(self.lundi - timedelta(weeks=semaine), self.plats)
+
+    def donnees(self, lignes, nouvelle=None):
+        donnees = {
+            'titre': 'Menu', 'description': '', 'est_publie': 'on',
+            'date_limite_commande': timezone.localtime(self.menu.date_limite_commande).strftime('%Y-%m-%dT%H:%M'),
+            'menuplat_set-TOTAL_FORMS': len(lignes) + 1, 'menuplat_set-INITIAL_FORMS': len(lignes),
+            'menuplat_set-MIN_NUM_FORMS': 0, 'menuplat_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, ligne in enumerate(lignes + [nouvelle or {}]):
+            for champ, valeur in ligne.items():
+                donnees[f'menuplat_set-{i}-{champ}'] = valeur
+        return donnees
+
+    def test_affichage_limite_au_menu(self):
+        # Premier affichage : la liste des plats est mise en cache
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as avant:
+            response = self.client.get(self.url)
+        self.creer_historique(10)
+        # session + utilisateur + menu + lignes du menu, quel que soit l'historique
+        with self.assertNumQueries(len(avant)):
+            response = self.client.get(self.url)
+        self.assertEqual(len(avant), 4)
+        formset = response.context['formset']
+        self.assertEqual([form.instance.id for form in formset.initial_forms], [ligne.id for ligne in self.lignes])
+        self.assertEqual(len(formset.forms), 3)
+        self.assertContains(response, 'name="menuplat_set-0-plat"')
+        self.assertEqual([plat['nom'] for plat in response.context['plats_disponibles']], ['Eru', 'Koki', 'Ndolé', 'Okok'])
+
+    def test_enregistrement_par_lots(self):
+        self.creer_historique(3)
+        lignes = [
+            {'id': self.lignes[0].id, 'menu': self.menu.id, 'plat': self.plats[0].id, 'prix': '1500', 'quantite_max': '10'},
+            {'id': self.lignes[1].id, 'menu': self.menu.id, 'plat': self.plats[1].id, 'prix': '1000', 'quantite_max': '0',
+             'DELETE': 'on'},
+        ]
+        nouvelle = {'plat': self.plats[2].id, 'prix': '2000', 'quantite_max': '5'}
+        version = version_menus()
+        plats_actifs()
+        with CaptureQueriesContext(connection) as requetes, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.donnees(lignes, nouvelle))
+        self.assertRedirects(response, reverse('menus:gerer_menus_semaine'), fetch_redirect_response=False)
+
+        self.assertEqual(
+            list(MenuPlat.objects.filter(menu=self.menu).order_by('plat__nom').values_list('plat__nom', 'prix', 'quantite_max')),
+            [('Eru', 1500, 10), ('Ndolé', 2000, 5)]
+        )
+        self.assertEqual(MenuPlat.objects.count(), 3 * 4 + 2)
+        ecritures = [
+            requete['sql'].split()[0] for requete in requetes.captured_queries
+            if '"Menus_menuplat"' in requete['sql'].split('WHERE')[0] and not requete['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(sorted(ecritures), ['DELETE', 'INSERT', 'UPDATE'])
+        # Plats soumis validés en une seule requête
+        self.assertEqual(sum(requete['sql'].startswith('SELECT') and 'FROM "Plats_plat"' in requete['sql']
+                             for requete in requetes.captured_queries), 1)
+        self.assertGreater(version_menus(), version)
+
+    def test_ligne_inchangee_non_reecrite(self):
+        lignes = [
+            {'id': ligne.id, 'menu': self.menu.id, 'plat': ligne.plat_id, 'prix': '1000.00', 'quantite_max': '0'}
+            for ligne in self.lignes
+        ]
+        with CaptureQueriesContext(connection) as requetes:
+            self.client.post(self.url, self.donnees(lignes))
+        self.assertFalse([requete for requete in requetes.captured_queries
+                          if requete['sql'].startswith(('UPDATE "Menus_menuplat"', 'INSERT INTO "Menus_menuplat"'))])
+
+        # Plat inactif refusé
+        self.plats[3].est_actif = False
+        self.plats[3].save()
+        lignes[0]['plat'] = self.plats[3].id
+        response = self.client.post(self.url, self.donnees(lignes))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['formset'].forms[0].errors['plat'])
@@ -23,4 +23,6 @@ urlpatterns = [
     # API
     path('api/menus-a-publier/', views.api_menus_a_publicr, name='api_menus_a_publier'),
     path('api/commandes-limite/', views.api_commandes_limite, name='api_commandes_limite'),
+    path('api/semaine/', views.api_menus_semaine, name='api_menus_semaine'),
+    path('api/stock/', views.api_stock_semaine, name='api_stock_semaine'),
 ]
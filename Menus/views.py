@@ -5,10 +5,17 @@ from django.core.paginator import Paginator
 from django.db.models import Q, Count, Sum
 from django.utils import timezone
 from django.http import JsonResponse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import condition
 from .models import Menu, MenuPlat
 from .forms import MenuForm, MenuPlatFormSet
-from Plats.models import Plat
+from Commandes.services import passer_commande, CommandeRefusee
+from .services import (
+    snapshot_semaine, menus_utilisateur, version_menus, preparer_semaines, stock_semaine, avec_stock
+)
+from Utilisateurs.models import SITE_CHOICES
 
 # === FONCTIONS UTILITAIRES ===
 
@@ -59,27 +66,17 @@ def dashboard_admin(request):
 def gerer_menus_semaine(request):
     """Gestion des menus de la semaine"""
     dates_semaine = get_semaine_courante()
-    sites = ['Danga', 'Campus']
-    for date_obj in dates_semaine:
-        for site in sites:
-            Menu.objects.get_or_create(
-                date=date_obj,
-                site=site,
-                defaults={
-                    'jour': date_obj.strftime('%A').lower(),
-                    'date_limite_commande': timezone.make_aware(
-                        datetime.combine(date_obj, datetime.min.time())
-                    ) + timedelta(hours=12) 
-                }
-            )
-    
-    menus_semaine = Menu.objects.filter(date__in=dates_semaine)
-    
+    sites = [site for site, _ in SITE_CHOICES]
+
     if request.method == 'POST':
         # Gestion de la publication des menus
         menu_id = request.POST.get('menu_id')
         action = request.POST.get('action')
-        
+
+        if action == 'preparer_semaine':
+            nombre = preparer_semaines(dates_semaine[0])
+            messages.success(request, f"{nombre} menus créés pour la semaine.")
+            return redirect('menus:gerer_menus_semaine')
         if menu_id and action:
             menu = get_object_or_404(Menu, id=menu_id)
             if action == 'publier':
@@ -90,7 +87,9 @@ def gerer_menus_semaine(request):
                 menu.est_publie = False
                 menu.save()
                 messages.success(request, f"Menu du {menu.date} ({menu.site}) dépublié.")
-    
+
+    menus_semaine = Menu.objects.filter(date__in=dates_semaine).prefetch_related('menuplat_set__plat')
+
     context = {
         'menus_semaine': menus_semaine,
         'dates_semaine': dates_semaine,
@@ -103,8 +102,7 @@ def gerer_menus_semaine(request):
 def modifier_menu(request, menu_id):
     """Modification d'un menu spécifique"""
     menu = get_object_or_404(Menu, id=menu_id)
-    plats_disponibles = Plat.objects.filter(est_actif=True, is_deleted=False)
-    
+
     if request.method == 'POST':
         form = MenuForm(request.POST, instance=menu)
         formset = MenuPlatFormSet(request.POST, instance=menu)
@@ -113,7 +111,7 @@ def modifier_menu(request, menu_id):
             form.save()
             formset.save()
             messages.success(request, f"Menu du {menu.date} ({menu.site}) modifié avec succès.")
-            return redirect('gerer_menus_semaine')
+            return redirect('menus:gerer_menus_semaine')
     else:
         form = MenuForm(instance=menu)
         formset = MenuPlatFormSet(instance=menu)
@@ -122,7 +120,7 @@ def modifier_menu(request, menu_id):
         'menu': menu,
         'form': form,
         'formset': formset,
-        'plats_disponibles': plats_disponibles
+        'plats_disponibles': formset.plats_disponibles
     }
     return render(request, 'menus/admin/modifier_menu.html', context)
 
@@ -217,30 +215,17 @@ def consolidation_commandes(request):
 def prestataire_gerer_menus_semaine(request):
     """Gestion des menus de la semaine pour prestataire"""
     dates_semaine = get_semaine_courante()
-    sites = ['Danga', 'Campus']
-
-    # Créer les menus squelettes s'ils n'existent pas
-    for date_obj in dates_semaine:
-        for site in sites:
-            Menu.objects.get_or_create(
-                date=date_obj,
-                site=site,
-                defaults={
-                    'jour': date_obj.strftime('%A').lower(),
-                    'date_limite_commande': timezone.make_aware(
-                        datetime.combine(date_obj, datetime.min.time())
-                    ) + timedelta(hours=12),
-                    'created_by': request.user.id
-                }
-            )
-
-    menus_semaine = Menu.objects.filter(date__in=dates_semaine)
+    sites = [site for site, _ in SITE_CHOICES]
 
     if request.method == 'POST':
         # Gestion de la publication des menus
         menu_id = request.POST.get('menu_id')
         action = request.POST.get('action')
 
+        if action == 'preparer_semaine':
+            nombre = preparer_semaines(dates_semaine[0], cree_par=request.user)
+            messages.success(request, f"{nombre} menus créés pour la semaine.")
+            return redirect('menus:prestataire_gerer_menus_semaine')
         if menu_id and action:
             menu = get_object_or_404(Menu, id=menu_id)
             if action == 'publier':
@@ -254,6 +239,8 @@ def prestataire_gerer_menus_semaine(request):
                 menu.save()
                 messages.success(request, f"Menu du {menu.date} ({menu.site}) dépublié.")
 
+    menus_semaine = Menu.objects.filter(date__in=dates_semaine).prefetch_related('menuplat_set__plat')
+
     context = {
         'menus_semaine': menus_semaine,
         'dates_semaine': dates_semaine,
@@ -272,8 +259,6 @@ def create_or_edit_menu_prestataire(request, menu_id=None):
         menu = None
         is_editing = False
 
-    plats_disponibles = Plat.objects.filter(est_actif=True, is_deleted=False)
-
     if request.method == 'POST':
         form = MenuForm(request.POST, instance=menu)
         formset = MenuPlatFormSet(request.POST, instance=menu)
@@ -286,9 +271,10 @@ def create_or_edit_menu_prestataire(request, menu_id=None):
                 menu_instance.updated_by = request.user.id
             menu_instance.save()
 
+            formset.instance = menu_instance
             formset.save()
             messages.success(request, f"Menu {'modifié' if is_editing else 'créé'} avec succès.")
-            return redirect('prestataire_gerer_menus_semaine')
+            return redirect('menus:prestataire_gerer_menus_semaine')
     else:
         form = MenuForm(instance=menu)
         formset = MenuPlatFormSet(instance=menu)
@@ -297,7 +283,7 @@ def create_or_edit_menu_prestataire(request, menu_id=None):
         'menu': menu,
         'form': form,
         'formset': formset,
-        'plats_disponibles': plats_disponibles,
+        'plats_disponibles': formset.plats_disponibles,
         'is_editing': is_editing
     }
     return render(request, 'menus/prestataire/create_menu.html', context)
@@ -308,16 +294,10 @@ def create_or_edit_menu_prestataire(request, menu_id=None):
 def menus_semaine(request):
  
     dates_semaine = get_semaine_courante()
-    menus_semaine = Menu.objects.filter(
-        date__in=dates_semaine,
-        est_publie=True
-    ).prefetch_related('menuplat_set__plat')
-    
+    snapshot = snapshot_semaine(dates_semaine[0], dates_semaine[-1])
+    stock = stock_semaine(dates_semaine[0], dates_semaine[-1])
+    menus_semaine = avec_stock(menus_utilisateur(snapshot, request.user), stock['menus'])
 
-    maintenant = timezone.now()
-    for menu in menus_semaine:
-        menu.commandes_ouvertes = maintenant < menu.date_limite_commande
-    
     context = {
         'menus_semaine': menus_semaine,
         'dates_semaine': dates_semaine,
@@ -340,16 +320,24 @@ def commander_menu(request, menu_id):
         plat_id = request.POST.get('plat_id')
         if plat_id:
 
-            menu_plat = get_object_or_404(MenuPlat, id=plat_id, menu=menu)
-            menu_plat.quantite_commandee += 1
-            menu_plat.save()
+            menu_plat = get_object_or_404(MenuPlat.objects.select_related('plat'), plat_id=plat_id, menu=menu)
+            try:
+                passer_commande(request.user, menu.id, menu_plat.plat_id, request.POST.get('notes_speciales', ''))
+            except CommandeRefusee as e:
+                messages.error(request, str(e))
+                return redirect('menus:commander_menu', menu_id=menu.id)
             
             messages.success(request, f"Votre commande pour {menu_plat.plat.nom} a été enregistrée.")
             return redirect('menus_semaine')
     
+    # Compteurs déjà chargés avec les plats : pas de requête sur les commandes
+    plats_disponibles = list(plats_disponibles)
+    commandees = sum(menu_plat.quantite_commandee for menu_plat in plats_disponibles)
     context = {
         'menu': menu,
-        'plats_disponibles': plats_disponibles
+        'plats_disponibles': plats_disponibles,
+        'menu_complet': bool(menu.max_commandes) and commandees >= menu.max_commandes,
+        'places_restantes': max(menu.max_commandes - commandees, 0) if menu.max_commandes else None,
     }
     return render(request, 'menus/collaborateur/commander_menu.html', context)
 
@@ -373,4 +361,51 @@ def api_commandes_limite(request):
         date_limite_commande__gte=timezone.now()
     ).count()
     
-    return JsonResponse({'menus_limite': menus_limite})
\ No newline at end of file
+    return JsonResponse({'menus_limite': menus_limite})
+
+def _etag_menus(request):
+    return f'menus-{version_menus()}'
+
+
+def _derniere_modification_menus(request):
+    return datetime.fromtimestamp(version_menus() // 1000, tz=dt_timezone.utc)
+
+
+@login_required
+@condition(etag_func=_etag_menus, last_modified_func=_derniere_modification_menus)
+def api_menus_semaine(request):
+    """Snapshot JSON des menus publiés de la semaine (?semaine=AAAA-MM-JJ, ?site=...),
+    revalidé par ETag / Last-Modified : une réponse 304 ne coûte aucune requête SQL"""
+    jour = parse_date(request.GET.get('semaine', '')) or timezone.localdate()
+    debut = jour - timedelta(days=jour.weekday())
+    site = request.GET.get('site') or None
+
+    snapshot = snapshot_semaine(debut, debut + timedelta(days=4), site=site)
+    response = JsonResponse(snapshot)
+    # Le navigateur garde la réponse mais la revalide à chaque affichage
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _stock_demande(request):
+    # Lu une fois par requête : l'ETag et la réponse portent sur le même stock
+    if not hasattr(request, '_stock_menus'):
+        jour = parse_date(request.GET.get('semaine', '')) or timezone.localdate()
+        debut = jour - timedelta(days=jour.weekday())
+        request._stock_menus = stock_semaine(debut, debut + timedelta(days=4), site=request.GET.get('site') or None)
+    return request._stock_menus
+
+
+def _etag_stock(request):
+    return f'stock-{_stock_demande(request)["version"]}'
+
+
+@login_required
+@condition(etag_func=_etag_stock)
+def api_stock_semaine(request):
+    """Places restantes par menu et par plat de la semaine (?semaine=AAAA-MM-JJ, ?site=...),
+    interrogé toutes les quelques secondes par menus_semaine : lu sur MenuPlat, jamais sur
+    les commandes, et mis en cache DUREE_STOCK secondes"""
+    response = JsonResponse(_stock_demande(request))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
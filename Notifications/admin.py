@@ -0,0 +1,13 @@
+from django.contrib import admin
+from main.pagination import PaginateurPlafonne
+from .models import EnvoiEmail
+
+
+@admin.register(EnvoiEmail)
+class EnvoiEmailAdmin(admin.ModelAdmin):
+    list_display = ('type_notification', 'utilisateur', 'menu', 'statut', 'tentatives', 'prochain_essai', 'envoye_le')
+    list_filter = ('type_notification', 'statut')
+    list_select_related = ('utilisateur', 'menu')
+    raw_id_fields = ('utilisateur', 'menu')
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from Notifications import services
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la file d'emails : planifie les rappels de date limite et envoie les emails dus "
+        "par lots sur une connexion SMTP. En service : python manage.py envoyer_emails ; "
+        "depuis cron : python manage.py envoyer_emails --une-fois"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Un seul passage puis arrêt")
+        parser.add_argument('--intervalle', type=float, default=10, help="Secondes entre deux passages")
+        parser.add_argument('--lot', type=int, default=services.TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.passage(options['lot'])
+                if options['une_fois']:
+                    return
+                # Comme en fin de requête : connexion rendue au pool ou fermée si trop ancienne
+                close_old_connections()
+                time.sleep(options['intervalle'])
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt du worker.")
+
+    def passage(self, taille_lot):
+        services.planifier_rappels()
+        envoyes, annules, echecs = services.traiter_file(taille_lot)
+        if envoyes or annules or echecs:
+            self.stdout.write(f"{envoyes} envoyés, {annules} annulés, {echecs} en échec")
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('Menus', '0004_menu_menu_publie_date_site_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvoiEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_notification', models.CharField(choices=[('confirmation_commande', 'Confirmation de commande'), ('rappel_limite', 'Rappel avant la date limite')], max_length=30)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('annule', 'Annulé'), ('echec', 'Échec')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('envoye_le', models.DateTimeField(blank=True, null=True)),
+                ('menu', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Menus.menu')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('statut', 'en_attente')), fields=['prochain_essai'], name='envoi_email_a_envoyer_idx')],
+                'constraints': [models.UniqueConstraint(fields=('type_notification', 'utilisateur', 'menu'), name='envoi_email_unique_par_menu')],
+            },
+        ),
+    ]
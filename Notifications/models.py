@@ -0,0 +1,51 @@
+from django.db import models
+from django.utils import timezone
+
+
+class EnvoiEmail(models.Model):
+    """Email à envoyer par le worker (python manage.py envoyer_emails), jamais pendant une requête.
+
+    Un seul envoi par type, utilisateur et menu. Le contenu est rédigé au moment
+    de l'envoi : une commande annulée ou un menu déjà commandé annule l'email.
+    """
+    TYPE_CHOICES = [
+        ('confirmation_commande', 'Confirmation de commande'),
+        ('rappel_limite', 'Rappel avant la date limite'),
+    ]
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('envoye', 'Envoyé'),
+        ('annule', 'Annulé'),
+        ('echec', 'Échec'),
+    ]
+
+    type_notification = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    utilisateur = models.ForeignKey('Utilisateurs.Utilisateur', on_delete=models.CASCADE)
+    menu = models.ForeignKey('Menus.Menu', on_delete=models.CASCADE)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    # Prochaine tentative ; repoussée pendant l'envoi : un worker arrêté en cours de lot rend ses emails
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    derniere_erreur = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    envoye_le = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_type_notification_display()} - {self.utilisateur_id} / menu {self.menu_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['type_notification', 'utilisateur', 'menu'],
+                name='envoi_email_unique_par_menu'
+            ),
+        ]
+        indexes = [
+            # File du worker : seuls les emails en attente sont lus
+            models.Index(
+                fields=['prochain_essai'],
+                condition=models.Q(statut='en_attente'),
+                name='envoi_email_a_envoyer_idx'
+            ),
+        ]
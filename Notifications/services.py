@@ -0,0 +1,196 @@
+"""File d'emails en base : mise en file pendant les requêtes, envoi par le worker.
+
+Une requête ne fait qu'écrire une ligne de la file (confirmation de commande). Les
+rappels, qui concernent tous les collaborateurs d'un site, sont planifiés par
+le worker. Le worker réserve un lot, rédige les emails puis les envoie sur une
+seule connexion SMTP ; un échec temporaire est retenté plus tard (délai doublé
+à chaque tentative), un refus définitif du destinataire ne l'est pas.
+"""
+import smtplib
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from Commandes.models import Commande
+from Menus.models import Menu
+from Utilisateurs.models import Utilisateur
+from .models import EnvoiEmail
+
+TAILLE_LOT = 100
+MAX_TENTATIVES = 5
+DELAI_INITIAL = timedelta(minutes=1)
+DELAI_MAX = timedelta(hours=1)
+# Durée pendant laquelle un lot réservé n'est pas repris par un autre worker
+RESERVATION = timedelta(minutes=5)
+# Les rappels partent quand la date limite de commande tombe dans l'heure
+DELAI_RAPPEL = timedelta(hours=1)
+
+
+def enfiler(type_notification, utilisateur_ids, menu_id):
+    """Met en file un email par utilisateur ; ceux déjà en file pour ce menu sont ignorés"""
+    envois = (
+        EnvoiEmail(type_notification=type_notification, utilisateur_id=utilisateur_id, menu_id=menu_id)
+        for utilisateur_id in utilisateur_ids
+    )
+    EnvoiEmail.objects.bulk_create(envois, batch_size=500, ignore_conflicts=True)
+
+
+def enfiler_confirmations(commandes):
+    """Met en file la confirmation de chaque commande, par menu ; une commande réactivée
+    après annulation est confirmée à nouveau"""
+    par_menu = {}
+    for commande in commandes:
+        par_menu.setdefault(commande.menu_id, []).append(commande.utilisateur_id)
+    for menu_id, utilisateur_ids in par_menu.items():
+        EnvoiEmail.objects.filter(
+            type_notification='confirmation_commande', utilisateur_id__in=utilisateur_ids, menu_id=menu_id
+        ).exclude(statut='en_attente').update(
+            statut='en_attente', tentatives=0, prochain_essai=timezone.now(), envoye_le=None, derniere_erreur=''
+        )
+        # Les lignes déjà présentes (relancées ci-dessus ou encore en file) sont ignorées
+        enfiler('confirmation_commande', utilisateur_ids, menu_id)
+
+
+def planifier_rappels(maintenant=None):
+    """Rappels des menus dont la date limite approche, pour les collaborateurs du site sans commande.
+
+    Retourne le nombre de menus concernés.
+    """
+    maintenant = maintenant or timezone.now()
+    menus = list(Menu.objects.filter(
+        est_publie=True,
+        is_deleted=False,
+        date_limite_commande__gt=maintenant,
+        date_limite_commande__lte=maintenant + DELAI_RAPPEL
+    ).values_list('id', 'site'))
+
+    for menu_id, site in menus:
+        destinataires = Utilisateur.objects.filter(
+            site=site, role='collaborateur', is_active=True, is_deleted=False
+        ).exclude(
+            Exists(Commande.objects.filter(utilisateur=OuterRef('pk'), menu_id=menu_id, is_deleted=False))
+        ).exclude(
+            Exists(EnvoiEmail.objects.filter(
+                utilisateur=OuterRef('pk'), menu_id=menu_id, type_notification='rappel_limite'
+            ))
+        ).values_list('id', flat=True)
+        enfiler('rappel_limite', destinataires.iterator(chunk_size=1000), menu_id)
+    return len(menus)
+
+
+def reserver_lot(taille=TAILLE_LOT):
+    """Réserve les prochains emails dus : un autre worker passe à la suite (SKIP LOCKED)"""
+    maintenant = timezone.now()
+    with transaction.atomic():
+        ids = list(EnvoiEmail.objects.select_for_update(skip_locked=True).filter(
+            statut='en_attente', prochain_essai__lte=maintenant
+        ).order_by('prochain_essai').values_list('id', flat=True)[:taille])
+        EnvoiEmail.objects.filter(id__in=ids).update(
+            prochain_essai=maintenant + RESERVATION, tentatives=F('tentatives') + 1
+        )
+    return list(EnvoiEmail.objects.filter(id__in=ids).select_related('utilisateur', 'menu').order_by('id'))
+
+
+def rediger(envoi, commandes):
+    """EmailMessage de l'envoi, ou None s'il n'a plus d'objet (commande annulée, menu déjà commandé)"""
+    commande = commandes.get((envoi.utilisateur_id, envoi.menu_id))
+    contexte = {'utilisateur': envoi.utilisateur, 'menu': envoi.menu, 'commande': commande}
+
+    if envoi.type_notification == 'confirmation_commande':
+        if commande is None:
+            return None
+        sujet = f"Commande confirmée : {commande.plat.nom} le {envoi.menu.date:%d/%m/%Y}"
+    else:
+        if commande is not None or timezone.now() >= envoi.menu.date_limite_commande:
+            return None
+        sujet = f"Dernier rappel : le menu du {envoi.menu.date:%d/%m/%Y} ferme bientôt"
+
+    corps = render_to_string(f'notifications/emails/{envoi.type_notification}.txt', contexte)
+    return EmailMessage(sujet, corps, to=[envoi.utilisateur.email])
+
+
+def _commandes_du_lot(envois):
+    """Commandes actives des couples (utilisateur, menu) du lot, en une requête"""
+    commandes = Commande.objects.filter(
+        utilisateur_id__in={envoi.utilisateur_id for envoi in envois},
+        menu_id__in={envoi.menu_id for envoi in envois},
+        is_deleted=False
+    ).select_related('plat')
+    return {(commande.utilisateur_id, commande.menu_id): commande for commande in commandes}
+
+
+def _erreur_definitive(erreur):
+    # 5xx sur tous les destinataires : adresse refusée, inutile de réessayer
+    return isinstance(erreur, smtplib.SMTPRecipientsRefused) and all(
+        code >= 500 for code, _ in erreur.recipients.values()
+    )
+
+
+def _reporter(envoi, erreur):
+    if envoi.tentatives >= MAX_TENTATIVES or _erreur_definitive(erreur):
+        maj = {'statut': 'echec'}
+    else:
+        delai = min(DELAI_INITIAL * 2 ** (envoi.tentatives - 1), DELAI_MAX)
+        maj = {'prochain_essai': timezone.now() + delai}
+    EnvoiEmail.objects.filter(id=envoi.id).update(derniere_erreur=f"{type(erreur).__name__}: {erreur}"[:1000], **maj)
+
+
+def _connexion_perdue(erreur):
+    # SMTPException hérite d'OSError : les autres OSError sont des erreurs réseau
+    return isinstance(erreur, smtplib.SMTPServerDisconnected) or not isinstance(erreur, smtplib.SMTPException)
+
+
+def envoyer_lot(envois):
+    """Rédige et envoie un lot sur une seule connexion. Retourne (envoyés, annulés, en échec)"""
+    if not envois:
+        return 0, 0, 0
+    commandes = _commandes_du_lot(envois)
+    envoyes, annules, echecs = [], [], 0
+
+    connexion = get_connection()
+    ouverte = False
+    try:
+        for rang, envoi in enumerate(envois):
+            message = rediger(envoi, commandes)
+            if message is None:
+                annules.append(envoi.id)
+                continue
+            try:
+                if not ouverte:
+                    connexion.open()
+                    ouverte = True
+                connexion.send_messages([message])
+            except OSError as erreur:
+                if not ouverte:
+                    # Serveur injoignable : tout le reste du lot est reporté
+                    for reste in envois[rang:]:
+                        _reporter(reste, erreur)
+                    echecs += len(envois) - rang
+                    break
+                echecs += 1
+                _reporter(envoi, erreur)
+                if _connexion_perdue(erreur):
+                    connexion.close()
+                    ouverte = False
+            else:
+                envoyes.append(envoi.id)
+    finally:
+        connexion.close()
+        EnvoiEmail.objects.filter(id__in=envoyes).update(statut='envoye', envoye_le=timezone.now(), derniere_erreur='')
+        EnvoiEmail.objects.filter(id__in=annules).update(statut='annule')
+    return len(envoyes), len(annules), echecs
+
+
+def traiter_file(taille=TAILLE_LOT):
+    """Envoie les emails dus, lot par lot, jusqu'à vider la file. Retourne (envoyés, annulés, en échec)"""
+    totaux = [0, 0, 0]
+    while True:
+        envois = reserver_lot(taille)
+        for i, nombre in enumerate(envoyer_lot(envois)):
+            totaux[i] += nombre
+        if len(envois) < taille:
+            return tuple(totaux)
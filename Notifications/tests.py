@@ -0,0 +1,177 @@
+import socketserver
+import threading
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from Commandes import services as commandes
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+from . import services
+from .models import EnvoiEmail
+
+
+class _SessionSMTP(socketserver.StreamRequestHandler):
+    """Juste assez de SMTP pour smtplib : 451 sur retry@..., 550 sur inconnu@..."""
+
+    def repondre(self, ligne):
+        self.wfile.write(ligne.encode() + b'\r\n')
+
+    def handle(self):
+        serveur = self.server
+        serveur.connexions += 1
+        self.repondre('220 test')
+        destinataires = []
+        while ligne := self.rfile.readline():
+            commande = ligne.decode().strip()
+            verbe = commande[:4].upper()
+            if verbe in ('EHLO', 'HELO'):
+                self.repondre('250 test')
+            elif verbe == 'MAIL':
+                destinataires = []
+                self.repondre('250 OK')
+            elif verbe == 'RCPT':
+                if 'retry@' in commande:
+                    self.repondre('451 Reessayez plus tard')
+                elif 'inconnu@' in commande:
+                    self.repondre('550 Destinataire inconnu')
+                else:
+                    destinataires.append(commande.split(':', 1)[1].strip(' <>'))
+                    self.repondre('250 OK')
+            elif verbe == 'DATA':
+                self.repondre('354 Fin par .')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                serveur.messages.extend(destinataires)
+                self.repondre('250 OK')
+            elif verbe in ('RSET', 'NOOP'):
+                self.repondre('250 OK')
+            elif verbe == 'QUIT':
+                self.repondre('221 Bye')
+                return
+            else:
+                self.repondre('502 Non supporte')
+
+
+class ServeurSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SessionSMTP)
+        self.connexions = 0
+        self.messages = []
+
+
+class FileEmailsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.serveur = ServeurSMTP()
+        threading.Thread(target=cls.serveur.serve_forever, daemon=True).start()
+        cls.reglages = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=cls.serveur.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        cls.reglages.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.reglages.disable()
+        cls.serveur.shutdown()
+        cls.serveur.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plat = Plat.objects.create(nom='Poulet DG', description='-')
+        cls.menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date() + timedelta(days=1), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now() + timedelta(minutes=30)
+        )
+        MenuPlat.objects.create(menu=cls.menu, plat=cls.plat)
+
+    def setUp(self):
+        self.serveur.connexions = 0
+        self.serveur.messages = []
+
+    def collaborateur(self, email):
+        return Utilisateur.objects.create_user(
+            email=email, password='x', prenom='Awa', nom='Test', role='collaborateur', site='Danga'
+        )
+
+    def test_commande_met_en_file_sans_envoyer(self):
+        utilisateur = self.collaborateur('awa@test.local')
+        commandes.passer_commande(utilisateur, self.menu.id, self.plat.id)
+        self.assertEqual(self.serveur.connexions, 0)
+        envoi = EnvoiEmail.objects.get()
+        self.assertEqual((envoi.type_notification, envoi.statut), ('confirmation_commande', 'en_attente'))
+
+        self.assertEqual(services.traiter_file(), (1, 0, 0))
+        self.assertEqual(self.serveur.messages, ['awa@test.local'])
+        self.assertEqual(EnvoiEmail.objects.get().statut, 'envoye')
+
+    def test_lot_sur_une_connexion_et_sans_doublon(self):
+        for i in range(12):
+            commandes.passer_commande(self.collaborateur(f'c{i}@test.local'), self.menu.id, self.plat.id)
+        utilisateur = Utilisateur.objects.get(email='c0@test.local')
+        services.enfiler('confirmation_commande', [utilisateur.id], self.menu.id)
+        self.assertEqual(EnvoiEmail.objects.count(), 12)
+
+        with self.assertNumQueries(7):
+            # Réservation (savepoint, SELECT, UPDATE, relecture), commandes du lot, marquage des envoyés
+            self.assertEqual(services.envoyer_lot(services.reserver_lot(50)), (12, 0, 0))
+        self.assertEqual(self.serveur.connexions, 1)
+        self.assertEqual(len(self.serveur.messages), 12)
+
+    def test_echec_temporaire_retente_puis_abandonne(self):
+        commandes.passer_commande(self.collaborateur('retry@test.local'), self.menu.id, self.plat.id)
+        self.assertEqual(services.traiter_file(), (0, 0, 1))
+        envoi = EnvoiEmail.objects.get()
+        self.assertEqual((envoi.statut, envoi.tentatives), ('en_attente', 1))
+        self.assertGreater(envoi.prochain_essai, timezone.now() + timedelta(seconds=50))
+        self.assertIn('451', envoi.derniere_erreur)
+
+        for _ in range(services.MAX_TENTATIVES - 1):
+            EnvoiEmail.objects.update(prochain_essai=timezone.now())
+            services.traiter_file()
+        envoi.refresh_from_db()
+        self.assertEqual((envoi.statut, envoi.tentatives), ('echec', services.MAX_TENTATIVES))
+
+    def test_refus_definitif(self):
+        commandes.passer_commande(self.collaborateur('inconnu@test.local'), self.menu.id, self.plat.id)
+        commandes.passer_commande(self.collaborateur('ok@test.local'), self.menu.id, self.plat.id)
+        self.assertEqual(services.traiter_file(), (1, 0, 1))
+        self.assertEqual(EnvoiEmail.objects.get(utilisateur__email='inconnu@test.local').statut, 'echec')
+        self.assertEqual(self.serveur.connexions, 1)
+
+    def test_commande_annulee_avant_envoi(self):
+        utilisateur = self.collaborateur('annule@test.local')
+        commande = commandes.passer_commande(utilisateur, self.menu.id, self.plat.id)
+        commandes.annuler_commande(commande, utilisateur)
+        self.assertEqual(services.traiter_file(), (0, 1, 0))
+        self.assertEqual(self.serveur.connexions, 0)
+
+        # Commande repassée : la confirmation repart
+        commandes.passer_commande(utilisateur, self.menu.id, self.plat.id)
+        self.assertEqual(services.traiter_file(), (1, 0, 0))
+
+    def test_rappels_sans_ceux_qui_ont_commande(self):
+        a_rappeler = self.collaborateur('rappel@test.local')
+        commandes.passer_commande(self.collaborateur('deja@test.local'), self.menu.id, self.plat.id)
+        Utilisateur.objects.create_user(
+            email='campus@test.local', password='x', prenom='Ali', nom='Test', role='collaborateur', site='Campus'
+        )
+
+        self.assertEqual(services.planifier_rappels(), 1)
+        services.planifier_rappels()
+        rappels = EnvoiEmail.objects.filter(type_notification='rappel_limite')
+        self.assertEqual(list(rappels.values_list('utilisateur_id', flat=True)), [a_rappeler.id])
+
+        services.traiter_file()
+        self.assertCountEqual(self.serveur.messages, ['rappel@test.local', 'deja@test.local'])
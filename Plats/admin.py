@@ -10,4 +10,6 @@ class CategoriePlatAdmin(admin.ModelAdmin):
 class PlatAdmin(admin.ModelAdmin):
     list_display = ('nom', 'categorie', 'est_actif')
     list_filter = ('categorie', 'est_actif')
+    list_select_related = ('categorie',)
     search_fields = ('nom', 'description')
+    raw_id_fields = ('created_by',)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from Plats.recherche import reindexer
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index de recherche des plats. Les signaux le tiennent à jour ; "
+        "à lancer après un bulk_create / update, un loaddata ou une copie de base."
+    )
+
+    def handle(self, *args, **options):
+        nombre = reindexer()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} plats indexés."))
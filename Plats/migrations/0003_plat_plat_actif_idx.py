@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Plats', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plat',
+            index=models.Index(condition=models.Q(('est_actif', True), ('is_deleted', False)), fields=['categorie', 'nom'], name='plat_actif_idx'),
+        ),
+    ]
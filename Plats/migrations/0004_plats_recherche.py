@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# Pas de clé étrangère vers les plats : TRUNCATE (flush, nettoyage des tests
+# transactionnels) refuse sous PostgreSQL une table référencée par une table non
+# gérée par Django. Les suppressions de plats passent par le signal post_delete,
+# qui retire l'entrée de l'index.
+
+def creer_index(apps, schema_editor):
+    connexion = schema_editor.connection
+    if connexion.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE plats_recherche (plat_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX plats_recherche_document_idx ON plats_recherche USING GIN (document)')
+    else:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE plats_recherche USING fts5('
+            'nom, description, allergenes, categorie, tokenize="unicode61 remove_diacritics 2")'
+        )
+    # Plats existants, lus avec les modèles historiques sur la base migrée
+    from Plats.recherche import reindexer
+    reindexer(apps.get_model('Plats', 'Plat').objects.all(), connexion)
+
+
+def supprimer_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS plats_recherche')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Plats', '0003_plat_plat_actif_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -30,4 +30,12 @@ class Plat(models.Model):
         return f"{self.nom} "
     
     class Meta:
-        ordering = ['categorie', 'nom']
\ No newline at end of file
+        ordering = ['categorie', 'nom']
+        indexes = [
+            # Catalogue des plats proposables, dans l'ordre d'affichage
+            models.Index(
+                fields=['categorie', 'nom'],
+                condition=models.Q(est_actif=True, is_deleted=False),
+                name='plat_actif_idx'
+            ),
+        ]
@@ -0,0 +1,150 @@
+"""Recherche plein texte des plats : nom, description, allergènes et catégorie.
+
+L'index est la table plats_recherche (migration 0004) : table virtuelle FTS5
+sous SQLite, colonne tsvector indexée en GIN sous PostgreSQL. Les textes et les
+requêtes sont normalisés ici (minuscules, sans accents) : « creme » trouve
+« Crème brûlée » sur les deux moteurs, sans l'extension unaccent.
+Chaque mot recherché est un préfixe (« pur » trouve « purée »).
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+TABLE_RECHERCHE = 'plats_recherche'
+RESULTATS_MAX = 200
+
+_MOT = re.compile(r'\w+')
+_LIGATURES = str.maketrans({'œ': 'oe', 'Œ': 'OE', 'æ': 'ae', 'Æ': 'AE'})
+
+
+def normaliser(texte):
+    """Minuscules sans diacritiques ni ligatures : « Purée » -> « puree », « œuf » -> « oeuf »"""
+    decompose = unicodedata.normalize('NFKD', (texte or '').translate(_LIGATURES))
+    return ''.join(c for c in decompose if not unicodedata.combining(c)).lower()
+
+
+def termes_recherche(texte):
+    return _MOT.findall(normaliser(texte))
+
+
+def _document(plat):
+    return (
+        normaliser(plat.nom),
+        normaliser(plat.description),
+        normaliser(plat.allergenes),
+        normaliser(plat.categorie.nom) if plat.categorie_id else '',
+    )
+
+
+def indexer_plats(plats, connexion=connection):
+    """Remplace les entrées des plats donnés (catégorie chargée par select_related de préférence)"""
+    lignes = [(plat.id, *_document(plat)) for plat in plats]
+    if not lignes:
+        return
+    with connexion.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE_RECHERCHE} WHERE {_colonne_id(connexion)} IN ({", ".join(["%s"] * len(lignes))})',
+            [ligne[0] for ligne in lignes]
+        )
+        if connexion.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {TABLE_RECHERCHE} (plat_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C') || setweight(to_tsvector('simple', %s), 'C'))",
+                lignes
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {TABLE_RECHERCHE} (rowid, nom, description, allergenes, categorie) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                lignes
+            )
+
+
+def desindexer_plat(plat_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE_RECHERCHE} WHERE {_colonne_id()} = %s', [plat_id])
+
+
+def reindexer(plats=None, connexion=connection):
+    """Reconstruit tout l'index (après bulk_create / update ou une copie de base)"""
+    if plats is None:
+        from .models import Plat
+        plats = Plat.objects.all()
+
+    with connexion.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE_RECHERCHE}')
+    plats = plats.using(connexion.alias).select_related('categorie').order_by('pk')
+    nombre = 0
+    lot = []
+    for plat in plats.iterator(chunk_size=500):
+        lot.append(plat)
+        if len(lot) == 500:
+            indexer_plats(lot, connexion)
+            nombre += len(lot)
+            lot = []
+    indexer_plats(lot, connexion)
+    return nombre + len(lot)
+
+
+def _colonne_id(connexion=connection):
+    return 'plat_id' if connexion.vendor == 'postgresql' else 'rowid'
+
+
+def ids_plats(texte, limite=RESULTATS_MAX):
+    """Identifiants des plats correspondant à tous les mots, du plus pertinent au moins pertinent.
+
+    Le nom pèse plus que la description, elle-même plus que les allergènes et la catégorie.
+    """
+    termes = termes_recherche(texte)
+    if not termes:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT plat_id FROM {TABLE_RECHERCHE}, to_tsquery('simple', %s) requete "
+                "WHERE document @@ requete ORDER BY ts_rank(document, requete) DESC, plat_id LIMIT %s",
+                [' & '.join(f'{terme}:*' for terme in termes), limite]
+            )
+        else:
+            cursor.execute(
+                f'SELECT rowid FROM {TABLE_RECHERCHE} WHERE {TABLE_RECHERCHE} MATCH %s '
+                f'ORDER BY bm25({TABLE_RECHERCHE}, 10.0, 3.0, 1.0, 1.0), rowid LIMIT %s',
+                [' '.join(f'"{terme}"*' for terme in termes), limite]
+            )
+        return [ligne[0] for ligne in cursor.fetchall()]
+
+
+def filtrer_plats(queryset, texte):
+    """Restreint le queryset aux plats trouvés, triés par pertinence (reste paginable)"""
+    ids = ids_plats(texte)
+    return queryset.filter(id__in=ids).order_by(Case(
+        *[When(id=plat_id, then=rang) for rang, plat_id in enumerate(ids)],
+        output_field=IntegerField()
+    )) if ids else queryset.none()
+
+
+def surligner(texte, recherche):
+    """Texte échappé, les mots commençant par un terme recherché entourés de <mark>"""
+    termes = termes_recherche(recherche)
+    texte = texte or ''
+    if not termes:
+        return escape(texte)
+    # Un caractère précomposé donne un caractère normalisé : les positions coïncident,
+    # sauf texte décomposé ou ligatures (pas de surlignage alors)
+    normalise = normaliser(texte)
+    if len(normalise) != len(texte):
+        return escape(texte)
+    morceaux = []
+    position = 0
+    for mot in _MOT.finditer(normalise):
+        if any(mot.group().startswith(terme) for terme in termes):
+            morceaux.append(escape(texte[position:mot.start()]))
+            morceaux.append(f'<mark>{escape(texte[mot.start():mot.end()])}</mark>')
+            position = mot.end()
+    morceaux.append(escape(texte[position:]))
+    return mark_safe(''.join(morceaux))
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .models import CategoriePlat, Plat
+from .recherche import desindexer_plat, indexer_plats
+
+
+@receiver(post_save, sender=Plat)
+def indexer_plat(sender, instance, raw=False, **kwargs):
+    # Chargement de fixtures (raw) : reindexer_plats ensuite
+    if not raw:
+        indexer_plats([instance])
+
+
+@receiver(post_delete, sender=Plat)
+def desindexer(sender, instance, **kwargs):
+    desindexer_plat(instance.id)
+
+
+@receiver(post_save, sender=CategoriePlat)
+def reindexer_categorie(sender, instance, created, raw=False, **kwargs):
+    """Le nom de la catégorie fait partie du document de chacun de ses plats"""
+    if not created and not raw:
+        indexer_plats(instance.plat_set.select_related('categorie'))
+
+
+@receiver(pre_delete, sender=CategoriePlat)
+def noter_plats_categorie(sender, instance, **kwargs):
+    instance._plats_a_reindexer = list(instance.plat_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=CategoriePlat)
+def reindexer_apres_suppression(sender, instance, **kwargs):
+    # SET_NULL met à jour les plats sans post_save
+    ids = getattr(instance, '_plats_a_reindexer', [])
+    if ids:
+        indexer_plats(Plat.objects.filter(id__in=ids).select_related('categorie'))
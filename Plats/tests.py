@@ -1,3 +1,62 @@
 from django.test import TestCase
+from django.urls import reverse
+from Utilisateurs.models import Utilisateur
+from .models import CategoriePlat, Plat
+from .recherche import ids_plats, surligner
 
-# Create your tests here.
+
+class RecherchePlatsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.desserts = CategoriePlat.objects.create(nom='Desserts')
+        cls.creme = Plat.objects.create(
+            nom='Crème brûlée', description='Dessert à la vanille', categorie=cls.desserts, allergenes='lait, œufs'
+        )
+        cls.puree = Plat.objects.create(
+            nom='Purée de patates douces', description='Avec une pointe de crème fraîche'
+        )
+        cls.poulet = Plat.objects.create(nom='Poulet DG', description='Plantains et légumes')
+
+    def test_sans_accents_et_par_prefixe(self):
+        self.assertEqual(ids_plats('puree'), [self.puree.id])
+        self.assertEqual(ids_plats('PUR'), [self.puree.id])
+        self.assertEqual(ids_plats('brulee vanil'), [self.creme.id])
+        self.assertEqual(ids_plats('oeufs'), [self.creme.id])
+        self.assertEqual(ids_plats('dessert'), [self.creme.id])
+        self.assertEqual(ids_plats('"; DROP'), [])
+
+    def test_nom_avant_description(self):
+        self.assertEqual(ids_plats('crème'), [self.creme.id, self.puree.id])
+
+    def test_index_suit_les_modifications(self):
+        self.poulet.description = 'Plantains, sauce arachide'
+        self.poulet.save()
+        self.assertEqual(ids_plats('arachide'), [self.poulet.id])
+
+        self.desserts.nom = 'Douceurs'
+        self.desserts.save()
+        self.assertEqual(ids_plats('douceurs'), [self.creme.id])
+
+        self.desserts.delete()
+        self.assertEqual(ids_plats('douceurs'), [])
+        self.assertEqual(ids_plats('vanille'), [self.creme.id])
+
+        self.creme.delete()
+        self.assertEqual(ids_plats('vanille'), [])
+
+    def test_surlignage_echappe(self):
+        self.assertEqual(
+            surligner('Crème <b>brûlée</b>', 'creme'),
+            '<mark>Crème</mark> &lt;b&gt;brûlée&lt;/b&gt;'
+        )
+
+    def test_liste_plats(self):
+        utilisateur = Utilisateur.objects.create_user(
+            email='recherche@sah.test', prenom='Re', nom='Cherche'
+        )
+        self.client.force_login(utilisateur)
+        response = self.client.get(reverse('plats:liste_plats'), {'q': 'puree'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([plat.id for plat in response.context['page_obj']], [self.puree.id])
+        self.assertContains(response, '<mark>Purée</mark> de patates douces')
@@ -3,8 +3,10 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.utils.text import Truncator
 from .models import CategoriePlat, Plat
 from .forms import CategoriePlatForm, PlatForm
+from .recherche import filtrer_plats, surligner
 
 
 
@@ -105,13 +107,17 @@ def liste_plats(request):
 
     query = request.GET.get('q')
     if query:
-        plats = plats.filter(Q(nom__icontains=query) | Q(description__icontains=query))
+        # Index plein texte : sans accents, par préfixe, trié par pertinence
+        plats = filtrer_plats(plats, query)
 
-    paginator = Paginator(plats, 10)
+    paginator = Paginator(plats.select_related('categorie'), 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    for plat in page_obj:
+        plat.nom_surligne = surligner(plat.nom, query)
+        plat.extrait = surligner(Truncator(plat.description).words(15), query)
     
-    categories = CategoriePlat.objects.filter(is_deleted=False)
+    categories = CategoriePlat.objects.order_by('nom')
     
     context = {
         'page_obj': page_obj,
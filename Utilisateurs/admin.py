@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from main.pagination import PaginateurPlafonne
 from .models import Utilisateur, Profile
 
 @admin.register(Utilisateur)
@@ -8,6 +9,8 @@ class UtilisateurAdmin(UserAdmin):
     list_filter = ('role', 'site', 'departement', 'is_active')
     search_fields = ('email', 'prenom', 'nom')
     ordering = ('email',)
+    paginator = PaginateurPlafonne
+    show_full_result_count = False
     
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -27,4 +30,6 @@ class UtilisateurAdmin(UserAdmin):
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('utilisateur', 'telephone')
-    search_fields = ('utilisateur__email', 'utilisateur__prenom', 'utilisateur__nom')
\ No newline at end of file
+    list_select_related = ('utilisateur',)
+    search_fields = ('utilisateur__email', 'utilisateur__prenom', 'utilisateur__nom')
+    raw_id_fields = ('utilisateur',)
\ No newline at end of file
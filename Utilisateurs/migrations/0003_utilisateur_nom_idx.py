@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Utilisateurs', '0002_alter_utilisateur_managers_and_more'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='utilisateur',
+            index=models.Index(fields=['nom', 'prenom', 'id'], name='utilisateur_nom_idx'),
+        ),
+    ]
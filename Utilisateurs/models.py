@@ -98,6 +98,10 @@ class Utilisateur(AbstractUser):
         verbose_name = 'Utilisateur'
         verbose_name_plural = 'Utilisateurs'
         ordering = ['nom', 'prenom']
+        indexes = [
+            # Liste admin des utilisateurs, paginée par curseur sur (nom, prenom, id)
+            models.Index(fields=['nom', 'prenom', 'id'], name='utilisateur_nom_idx'),
+        ]
 
     def get_dashboard_url(self):
         role_dashboards = {
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from django.db.models import Q, Avg, Count, Prefetch, Sum
+from django.utils import timezone
+from .models import Utilisateur
+
+
+def debut_jour(date_obj):
+    """Datetime aware de minuit pour une date (bornes indexables sur created_at)"""
+    return timezone.make_aware(datetime.combine(date_obj, datetime.min.time()))
+
+
+def evolution_pourcentage(actuel, precedent):
+    return round((actuel - precedent) / precedent * 100, 1) if precedent > 0 else 0
+
+
+def statistiques_dashboard_admin(today=None):
+    """Statistiques du dashboard administrateur en un nombre constant de requêtes"""
+    from Menus.models import Menu
+    from Commandes import statistiques
+    from Avis.models import Avis
+    from Plats.models import Plat
+
+    today = today or timezone.now().date()
+    start_of_week = today - timedelta(days=today.weekday())  # Lundi
+    end_of_week = start_of_week + timedelta(days=6)  # Dimanche
+    start_last_week = start_of_week - timedelta(days=7)
+    end_last_week = end_of_week - timedelta(days=7)
+
+    debut_semaine = debut_jour(start_of_week)
+    fin_semaine = debut_jour(end_of_week + timedelta(days=1))
+
+    # 1 requête : utilisateurs actifs, maintenant et à la fin de la semaine dernière
+    stats_utilisateurs = Utilisateur.objects.aggregate(
+        actifs=Count('id', filter=Q(is_active=True)),
+        actifs_semaine_derniere=Count('id', filter=Q(
+            is_active=True,
+            date_joined__lt=debut_jour(end_last_week + timedelta(days=1))
+        ))
+    )
+
+    # 1 requête : commandes de la semaine, du jour et de la semaine précédente
+    stats_commandes = statistiques.stats_periode(start_last_week, end_of_week).aggregate(
+        semaine=Sum('nombre', filter=Q(date__gte=start_of_week), default=0),
+        aujourdhui=Sum('nombre', filter=Q(date=today), default=0),
+        semaine_derniere=Sum('nombre', filter=Q(date__lt=start_of_week), default=0)
+    )
+
+    # 1 requête : avis de la semaine
+    stats_avis = Avis.objects.filter(
+        created_at__gte=debut_semaine,
+        created_at__lt=fin_semaine,
+        is_deleted=False
+    ).aggregate(avg_note=Avg('note'), nombre=Count('id'))
+
+    # 2 requêtes : menus publiés avec leur nombre de commandes et leurs plats
+    menus_semaine = Menu.objects.filter(
+        date__gte=start_of_week,
+        date__lte=end_of_week,
+        est_publie=True
+    ).annotate(
+        nombre_commandes=Count('commande', filter=Q(commande__is_deleted=False))
+    ).prefetch_related(
+        Prefetch('plats', queryset=Plat.objects.only('id', 'nom', 'allergenes'))
+    ).order_by('date')
+
+    # 1 requête : plats populaires (top 5 du dernier mois)
+    plats_with_counts = list(statistiques.stats_periode(start_of_week - timedelta(days=30), today).values(
+        'plat__nom'
+    ).annotate(
+        commandes=Sum('nombre')
+    ).order_by('-commandes')[:5])
+
+    total_commandes_plats = sum(plat['commandes'] for plat in plats_with_counts)
+    plats_populaires = [
+        {
+            'nom': plat_data['plat__nom'],
+            'commandes': plat_data['commandes'],
+            'popularite': round((plat_data['commandes'] / total_commandes_plats * 100), 1) if total_commandes_plats > 0 else 0
+        }
+        for plat_data in plats_with_counts
+    ]
+
+    # 1 requête : avis récents (5 derniers)
+    avis_recents = Avis.objects.filter(is_deleted=False).select_related(
+        'utilisateur', 'plat'
+    ).order_by('-created_at')[:5]
+
+    utilisateurs_actifs = stats_utilisateurs['actifs']
+    commandes_semaine = stats_commandes['semaine']
+
+    return {
+        'stats': {
+            'utilisateurs_actifs': utilisateurs_actifs,
+            'evolution_utilisateurs': evolution_pourcentage(
+                utilisateurs_actifs, stats_utilisateurs['actifs_semaine_derniere']
+            ),
+            'commandes_semaine': commandes_semaine,
+            'commandes_aujourdhui': stats_commandes['aujourdhui'],
+            'evolution_commandes': evolution_pourcentage(
+                commandes_semaine, stats_commandes['semaine_derniere']
+            ),
+            'taux_participation': round((commandes_semaine / utilisateurs_actifs * 100), 1) if utilisateurs_actifs > 0 else 0,
+            'participation_prevue': commandes_semaine,
+            'avis_moyen': round(stats_avis['avg_note'] or 0, 1),
+            'nombre_avis': stats_avis['nombre'],
+            'plats_populaires': plats_populaires,
+        },
+        'semaine_courante': start_of_week,
+        'menus_semaine': menus_semaine,
+        'avis_recents': avis_recents,
+        'admin_actions': {
+            'utilisateurs': utilisateurs_actifs,
+            'commandes': commandes_semaine,
+        },
+    }
@@ -1,3 +1,211 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Count
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from .models import Utilisateur
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Commandes.models import Commande
+from Commandes import statistiques
+from Avis.models import Avis
+
+
+class AdminDashboardQueryTest(TestCase):
+    """Le dashboard admin doit rester à nombre de requêtes constant"""
+
+    # session + utilisateur + 7 requêtes de statistiques
+    QUERY_BUDGET = 9
+
+    def setUp(self):
+        self.admin = Utilisateur.objects.create_user(
+            email='admin@sah.test', prenom='Ada', nom='Admin',
+            role='admin', is_superuser=True, is_staff=True
+        )
+        self.client.force_login(self.admin)
+        self.today = timezone.now().date()
+        self.start_of_week = self.today - timedelta(days=self.today.weekday())
+
+    def creer_menus(self, sites):
+        for i, site in enumerate(sites):
+            for jour_index, jour in enumerate(['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi']):
+                date_menu = self.start_of_week + timedelta(days=jour_index)
+                menu = Menu.objects.create(
+                    jour=jour, date=date_menu, site=site, est_publie=True,
+                    date_limite_commande=timezone.now() + timedelta(days=1)
+                )
+                plat = Plat.objects.create(nom=f'Plat {site} {jour}', description='-')
+                MenuPlat.objects.create(menu=menu, plat=plat)
+                user = Utilisateur.objects.create_user(
+                    email=f'{site}.{jour}.{i}@sah.test', prenom='C', nom=jour, site=site
+                )
+                commande = Commande.objects.create(utilisateur=user, menu=menu, plat=plat)
+                Avis.objects.create(utilisateur=user, plat=plat, commande=commande, note=4)
+        statistiques.reconstruire()
+
+    def test_query_budget(self):
+        self.creer_menus(['Danga'])
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['commandes_semaine'], 5)
+
+    def test_query_count_independant_du_nombre_de_menus(self):
+        self.creer_menus(['Danga', 'Campus'])
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(len(response.context['menus_semaine']), 10)
+        self.assertTrue(all(menu.nombre_commandes == 1 for menu in response.context['menus_semaine']))
+
+
+class CollaborateurDashboardQueryTest(TestCase):
+    """Le dashboard collaborateur charge la semaine en un nombre fixe de requêtes"""
+
+    # session + utilisateur + menus + plats + commandes récentes + résumé d'activité
+    QUERY_BUDGET = 6
+
+    def setUp(self):
+        self.collaborateur = Utilisateur.objects.create_user(
+            email='collab@sah.test', prenom='Col', nom='Laborateur', site='Danga'
+        )
+        self.client.force_login(self.collaborateur)
+        today = timezone.localdate()
+        self.start_of_week = today - timedelta(days=today.weekday())
+
+    def creer_semaine(self, nb_plats):
+        menus = []
+        for jour_index, jour in enumerate(['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi']):
+            menu = Menu.objects.create(
+                jour=jour, date=self.start_of_week + timedelta(days=jour_index), site='Danga',
+                est_publie=True, date_limite_commande=timezone.now() + timedelta(days=7)
+            )
+            for i in range(nb_plats):
+                plat = Plat.objects.create(nom=f'Plat {jour} {i}', description='-')
+                MenuPlat.objects.create(menu=menu, plat=plat)
+            menus.append(menu)
+        return menus
+
+    def commander(self, menus):
+        for menu in menus:
+            plat = menu.plats.first()
+            commande = Commande.objects.create(utilisateur=self.collaborateur, menu=menu, plat=plat, statut='livree')
+            Avis.objects.create(utilisateur=self.collaborateur, plat=plat, commande=commande, note=5)
+
+    def test_query_budget(self):
+        menus = self.creer_semaine(nb_plats=1)
+        self.commander(menus[:1])
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('collaborateur_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        lundi = response.context['menus_semaine']['lundi']
+        self.assertTrue(lundi['commande_existante'])
+        self.assertTrue(lundi['avis_donne'])
+        self.assertFalse(response.context['menus_semaine']['mardi']['commande_existante'])
+        self.assertTrue(response.context['commandes_recentes'][0].avis_donne)
+
+    def test_query_count_independant_du_nombre_de_plats_et_commandes(self):
+        menus = self.creer_semaine(nb_plats=4)
+        self.commander(menus)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('collaborateur_dashboard'))
+        self.assertEqual(len(response.context['menus_semaine']['vendredi']['plats']), 4)
+        self.assertEqual(len(response.context['commandes_recentes']), 5)
+
+    def test_menus_semaine(self):
+        cache.clear()
+        menus = self.creer_semaine(nb_plats=3)
+        self.commander(menus[:2])
+        # session + utilisateur + commandes de l'utilisateur, + menus, plats et stock au premier appel
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('menus_semaine'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([menu['commande_existante'] for menu in response.context['menus_semaine']],
+                         [True, True, False, False, False])
+        with self.assertNumQueries(3):
+            self.client.get(reverse('menus_semaine'))
+
+
+class SecretaireDashboardTest(TestCase):
+    """Le dashboard secrétaire s'affiche et pointe vers des pages existantes"""
+
+    def test_rendu(self):
+        secretaire = Utilisateur.objects.create_user(
+            email='secretaire@sah.test', prenom='Sec', nom='Retaire', role='secretaire'
+        )
+        self.client.force_login(secretaire)
+        response = self.client.get(reverse('secretaire_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('admin_reports'))
+
+
+class RapportsAdminTest(TestCase):
+    """Les rapports lus dans StatCommandeJour donnent les chiffres d'un comptage direct des commandes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from Commandes import services
+
+        cls.admin = Utilisateur.objects.create_user(
+            email='rapports@sah.test', prenom='Ada', nom='Rapports', role='admin'
+        )
+        plats = [Plat.objects.create(nom=nom, description='-') for nom in ('Ndolé', 'Eru', 'Koki')]
+        for i, site in enumerate(['Danga', 'Campus']):
+            menu = Menu.objects.create(
+                jour='lundi', date=timezone.localdate(), site=site, est_publie=True,
+                date_limite_commande=timezone.now() + timedelta(hours=1)
+            )
+            for plat in plats:
+                MenuPlat.objects.create(menu=menu, plat=plat)
+            for j in range(4 + i):
+                collaborateur = Utilisateur.objects.create_user(
+                    email=f'rapports.{site}.{j}@sah.test', prenom='C', nom=f'Rapports{j}', site=site
+                )
+                commande = services.passer_commande(collaborateur, menu.id, plats[j % 3].id)
+                if j == 0:
+                    services.annuler_commande(commande, collaborateur)
+                elif j == 1:
+                    services.changer_statut(commande, 'confirmee', cls.admin)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_rapports(self):
+        commandes = Commande.objects.filter(is_deleted=False)
+        for periode in ['week', 'month', 'year']:
+            response = self.client.get(reverse('admin_reports'), {'periode': periode})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['stats']['total_commandes'], commandes.count())
+            self.assertEqual(response.context['stats']['total_utilisateurs'], 7)
+            self.assertEqual(
+                {ligne['statut']: ligne['count'] for ligne in response.context['commandes_par_statut']},
+                {'en_attente': 5, 'confirmee': 2}
+            )
+            self.assertEqual(
+                {ligne['plat__nom']: ligne['count'] for ligne in response.context['top_plats']},
+                {ligne['plat__nom']: ligne['count'] for ligne in commandes.values('plat__nom').annotate(count=Count('id'))}
+            )
+            self.assertEqual(
+                {ligne['site']: ligne['count'] for ligne in response.context['commandes_par_site']},
+                {'Danga': 3, 'Campus': 4}
+            )
+            self.assertAlmostEqual(sum(ligne['pourcentage'] for ligne in response.context['commandes_par_site']), 100)
+            self.assertContains(response, '(57,1%)')
+            self.assertEqual(response.context['evolution_data'][-1]['count'], commandes.count())
+
+    def test_tableau_de_bord_prestataire(self):
+        prestataire = Utilisateur.objects.create_user(
+            email='chef.rapports@sah.test', prenom='Chef', nom='Rapports', role='prestataire'
+        )
+        self.client.force_login(prestataire)
+        response = self.client.get(reverse('prestataire_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['commandes_semaine'], 7)
+
+    def test_rapport_vide(self):
+        Commande.objects.all().delete()
+        statistiques.reconstruire()
+        response = self.client.get(reverse('admin_reports'), {'periode': 'year'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['total_commandes'], 0)
@@ -11,6 +11,10 @@ from django.utils import timezone
 
 from .forms import EmailAuthenticationForm, CustomUserCreationForm, CustomPasswordResetForm, UserSearchForm, AdminUserUpdateForm
 from .models import Utilisateur
+from .services import statistiques_dashboard_admin, debut_jour
+from Commandes.activite import activite
+from Commandes.exports import filtrer_commandes
+from main.pagination import paginer
 
 def login_view(request):
     if request.user.is_authenticated:
@@ -80,125 +84,7 @@ def admin_dashboard_view(request):
         messages.error(request, 'Accès non autorisé.')
         return redirect('dashboard')
 
-    from datetime import datetime, timedelta
-    from django.db.models import Count, Avg, Q
-    from Menus.models import Menu
-    from Commandes.models import Commande
-    from Avis.models import Avis
-    from Plats.models import Plat
-
-    # Date actuelle et semaine courante
-    today = timezone.now().date()
-    start_of_week = today - timedelta(days=today.weekday())  # Lundi
-    end_of_week = start_of_week + timedelta(days=6)  # Dimanche
-
-    # Statistiques générales
-    utilisateurs_actifs = Utilisateur.objects.filter(is_active=True).count()
-    commandes_semaine = Commande.objects.filter(
-        created_at__date__gte=start_of_week,
-        created_at__date__lte=end_of_week,
-        is_deleted=False
-    ).count()
-
-    commandes_aujourdhui = Commande.objects.filter(
-        created_at__date=today,
-        is_deleted=False
-    ).count()
-
-    # Calcul des taux de participation
-    total_utilisateurs = Utilisateur.objects.filter(is_active=True).count()
-    participation_prevue = commandes_semaine
-    taux_participation = round((participation_prevue / total_utilisateurs * 100), 1) if total_utilisateurs > 0 else 0
-
-    # Avis moyen
-    avis_semaine = Avis.objects.filter(
-        date_creation__date__gte=start_of_week,
-        date_creation__date__lte=end_of_week
-    )
-    avis_moyen = avis_semaine.aggregate(avg_note=Avg('note'))['avg_note'] or 0
-    avis_moyen = round(avis_moyen, 1)
-    nombre_avis = avis_semaine.count()
-
-    # Évolution (comparaison avec semaine précédente)
-    start_last_week = start_of_week - timedelta(days=7)
-    end_last_week = end_of_week - timedelta(days=7)
-
-    utilisateurs_actifs_last_week = Utilisateur.objects.filter(
-        date_joined__date__lte=end_last_week,
-        is_active=True
-    ).count()
-
-    commandes_last_week = Commande.objects.filter(
-        created_at__date__gte=start_last_week,
-        created_at__date__lte=end_last_week,
-        is_deleted=False
-    ).count()
-
-    evolution_utilisateurs = ((utilisateurs_actifs - utilisateurs_actifs_last_week) / utilisateurs_actifs_last_week * 100) if utilisateurs_actifs_last_week > 0 else 0
-    evolution_commandes = ((commandes_semaine - commandes_last_week) / commandes_last_week * 100) if commandes_last_week > 0 else 0
-
-    # Menus de la semaine
-    menus_semaine = Menu.objects.filter(
-        date__gte=start_of_week,
-        date__lte=end_of_week,
-        est_publie=True
-    ).select_related().order_by('date')
-
-    # Ajouter le nombre de commandes pour chaque menu
-    for menu in menus_semaine:
-        menu.nombre_commandes = Commande.objects.filter(
-            menu=menu,
-            is_deleted=False
-        ).count()
-
-    # Plats populaires (top 5)
-    plats_populaires = []
-    plats_with_counts = Commande.objects.filter(
-        created_at__date__gte=start_of_week - timedelta(days=30),  # Dernier mois
-        is_deleted=False
-    ).values('plat__nom').annotate(
-        commandes=Count('id')
-    ).order_by('-commandes')[:5]
-
-    total_commandes_plats = sum(plat['commandes'] for plat in plats_with_counts)
-    for plat_data in plats_with_counts:
-        popularite = round((plat_data['commandes'] / total_commandes_plats * 100), 1) if total_commandes_plats > 0 else 0
-        plats_populaires.append({
-            'nom': plat_data['plat__nom'],
-            'commandes': plat_data['commandes'],
-            'popularite': popularite
-        })
-
-    # Avis récents (5 derniers)
-    avis_recents = Avis.objects.select_related(
-        'utilisateur', 'commande__plat'
-    ).order_by('-date_creation')[:5]
-
-    # Actions rapides - données pour les liens
-    admin_actions = {
-        'utilisateurs': utilisateurs_actifs,
-        'commandes': commandes_semaine,
-    }
-
-    context = {
-        'stats': {
-            'utilisateurs_actifs': utilisateurs_actifs,
-            'evolution_utilisateurs': round(evolution_utilisateurs, 1),
-            'commandes_semaine': commandes_semaine,
-            'commandes_aujourdhui': commandes_aujourdhui,
-            'evolution_commandes': round(evolution_commandes, 1),
-            'taux_participation': taux_participation,
-            'participation_prevue': participation_prevue,
-            'utilisateurs_actifs': utilisateurs_actifs,
-            'avis_moyen': avis_moyen,
-            'nombre_avis': nombre_avis,
-            'plats_populaires': plats_populaires,
-        },
-        'semaine_courante': start_of_week,
-        'menus_semaine': menus_semaine,
-        'avis_recents': avis_recents,
-        'admin_actions': admin_actions,
-    }
+    context = statistiques_dashboard_admin()
 
     return render(request, 'utilisateurs/dashboards/admin_dashboard.html', context)
 
@@ -211,6 +97,7 @@ def prestataire_dashboard_view(request):
     from datetime import datetime, timedelta
     from Menus.models import Menu, MenuPlat
     from Commandes.models import Commande
+    from Commandes import statistiques
     from Plats.models import Plat
 
     # Date actuelle et semaine courante
@@ -218,12 +105,8 @@ def prestataire_dashboard_view(request):
     start_of_week = today - timedelta(days=today.weekday())  # Lundi
     end_of_week = start_of_week + timedelta(days=6)  # Dimanche
 
-    # Statistiques générales
-    commandes_semaine = Commande.objects.filter(
-        created_at__date__gte=start_of_week,
-        created_at__date__lte=end_of_week,
-        is_deleted=False
-    ).count()
+    # Statistiques générales (table pré-agrégée StatCommandeJour)
+    commandes_semaine = statistiques.total_commandes(start_of_week, end_of_week)
 
     sites_actifs = Menu.objects.filter(
         date__gte=start_of_week,
@@ -241,18 +124,13 @@ def prestataire_dashboard_view(request):
     ).count()
 
     # Évolution des commandes (dernières 5 semaines)
+    totaux_jour = statistiques.totaux_par_jour(start_of_week - timedelta(days=28), end_of_week)
     evolution_data = []
     for i in range(4, -1, -1):
         week_start = start_of_week - timedelta(days=i*7)
-        week_end = week_start + timedelta(days=6)
-        count = Commande.objects.filter(
-            created_at__date__gte=week_start,
-            created_at__date__lte=week_end,
-            is_deleted=False
-        ).count()
         evolution_data.append({
             'semaine': f'S{i+1}',
-            'count': count
+            'count': sum(totaux_jour[week_start + timedelta(days=j)] for j in range(7))
         })
 
     # Consolidation par site
@@ -393,57 +271,41 @@ def secretaire_dashboard_view(request):
 
 @login_required
 def collaborateur_dashboard_view(request):
-    from datetime import datetime, timedelta
-    from Menus.models import Menu
+    from datetime import timedelta
+    from django.db.models import Exists, OuterRef
+    from Menus.services import charger_menus_semaine
     from Commandes.models import Commande
     from Avis.models import Avis
 
     # Obtenir la semaine actuelle (lundi à dimanche)
-    today = datetime.now().date()
+    today = timezone.localdate()
     start_of_week = today - timedelta(days=today.weekday())  # Lundi
     end_of_week = start_of_week + timedelta(days=6)  # Dimanche
 
-    # Récupérer les menus de la semaine pour le site de l'utilisateur
-    menus_semaine = Menu.objects.filter(
-        date__gte=start_of_week,
-        date__lte=end_of_week,
-        site=request.user.site,
-        est_publie=True
-    ).select_related('menuplat_set__plat').order_by('date', 'jour')
-
-    # Grouper par jour
-    menus_par_jour = {}
-    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
-    for jour in jours:
-        menus_jour = menus_semaine.filter(jour=jour)
-        if menus_jour.exists():
-            menu = menus_jour.first()
-            # Vérifier si l'utilisateur a déjà commandé pour ce menu
-            commande_existante = Commande.objects.filter(
-                utilisateur=request.user,
-                menu=menu,
-                is_deleted=False
-            ).exists()
-            plats = menu.menuplat_set.select_related('plat').all()
-            est_aujourdhui = menu.date == today
-            est_futur = menu.date > today
-            est_passe = menu.date < today
-            menus_par_jour[jour] = {
+    # 2 requêtes : menus publiés du site avec plats et drapeaux commande / avis
+    menus = charger_menus_semaine(start_of_week, end_of_week, utilisateur=request.user, site=request.user.site)
+
+    # Grouper par jour (premier menu du jour)
+    menus_par_jour = dict.fromkeys(['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche'])
+    for menu in menus:
+        if menus_par_jour.get(menu.jour) is None:
+            menus_par_jour[menu.jour] = {
                 'menu': menu,
-                'commande_existante': commande_existante,
-                'plats': plats,
-                'est_aujourdhui': est_aujourdhui,
-                'est_futur': est_futur,
-                'est_passe': est_passe,
+                'commande_existante': menu.commande_existante,
+                'avis_donne': menu.avis_donne,
+                'plats': [menu_plat.plat for menu_plat in menu.menuplat_set.all()],
+                'est_aujourdhui': menu.date == today,
+                'est_futur': menu.date > today,
+                'est_passe': menu.date < today,
                 'date': menu.date
             }
-        else:
-            menus_par_jour[jour] = None
 
-    # Commandes récentes (dernières 5)
+    # 1 requête : commandes récentes (dernières 5) avec avis donné
     commandes_recentes = Commande.objects.filter(
         utilisateur=request.user,
         is_deleted=False
+    ).annotate(
+        avis_donne=Exists(Avis.objects.filter(utilisateur=request.user, commande=OuterRef('pk')))
     ).select_related('plat', 'menu').order_by('-created_at')[:5]
 
     # Ajouter des propriétés pour les commandes
@@ -463,43 +325,19 @@ def collaborateur_dashboard_view(request):
         else:  # annulee
             commande.couleur_statut = 'red'
             commande.icone_statut = 'times-circle'
-        
-        # Vérifier si avis donné
-        commande.avis_donne = Avis.objects.filter(
-            utilisateur=request.user,
-            commande=commande
-        ).exists()
-
-    # Statistiques personnelles
-    total_commandes_mois = Commande.objects.filter(
-        utilisateur=request.user,
-        created_at__month=datetime.now().month,
-        is_deleted=False
-    ).count()
 
-    avis_perso = Avis.objects.filter(
-        utilisateur=request.user,
-        is_deleted=False
-    )
-    moyenne_avis = avis_perso.aggregate(avg=Avg('note'))['avg'] or 0
-    nombre_avis = avis_perso.count()
-
-    # Plats favoris (top 3 par nombre de commandes)
-    plats_favoris = Commande.objects.filter(
-        utilisateur=request.user,
-        is_deleted=False
-    ).values('plat__nom').annotate(
-        count=Count('plat')
-    ).order_by('-count')[:3]
+    # Statistiques personnelles : 1 requête, résumé d'activité lu par clé primaire
+    resume = activite(request.user)
 
     context = {
         'menus_semaine': menus_par_jour,
         'commandes_recentes': commandes_recentes,
         'stats': {
-            'commandes_mois': total_commandes_mois,
-            'moyenne_avis': round(moyenne_avis, 1),
-            'nombre_avis': nombre_avis,
-            'plats_favoris': list(plats_favoris),
+            'commandes_mois': resume.commandes_du_mois(today),
+            'moyenne_avis': round(resume.moyenne_avis, 1),
+            'nombre_avis': resume.nb_avis,
+            # Appelé par le template seulement s'il affiche les favoris (noms des plats)
+            'plats_favoris': resume.plats_favoris,
         },
         'semaine_debut': start_of_week,
         'semaine_fin': end_of_week,
@@ -558,7 +396,7 @@ def admin_users(request):
         return redirect('dashboard')
     
     search_form = UserSearchForm(request.GET or None)
-    utilisateurs = Utilisateur.objects.all().order_by('nom')
+    utilisateurs = Utilisateur.objects.all()
     
     if search_form.is_valid():
         search_data = search_form.cleaned_data
@@ -579,14 +417,21 @@ def admin_users(request):
         if search_data['departement']:
             utilisateurs = utilisateurs.filter(departement=search_data['departement'])
     
-    # Pagination
-    paginator = Paginator(utilisateurs, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+    # Statistiques de la liste filtrée (une requête)
+    stats_utilisateurs = utilisateurs.aggregate(
+        total=Count('id'),
+        collaborateurs=Count('id', filter=Q(role='collaborateur')),
+        prestataires=Count('id', filter=Q(role='prestataire')),
+        admins=Count('id', filter=Q(role='admin'))
+    )
+
+    # Pagination par curseur : pas d'OFFSET
+    page_obj = paginer(request, utilisateurs, ('nom', 'prenom', 'id'), 10)
+
     context = {
         'page_obj': page_obj,
         'search_form': search_form,
+        'stats_utilisateurs': stats_utilisateurs,
     }
     return render(request, 'utilisateurs/admin/users.html', context)
 
@@ -657,12 +502,11 @@ def admin_orders(request):
         return redirect('dashboard')
 
     from Commandes.models import Commande
-    from django.core.paginator import Paginator
 
     # Récupérer toutes les commandes avec pagination
     commandes = Commande.objects.select_related(
         'utilisateur', 'menu', 'plat'
-    ).filter(is_deleted=False).order_by('-created_at')
+    ).filter(is_deleted=False)
 
     # Recherche et filtres
     search_query = request.GET.get('search', '')
@@ -670,32 +514,20 @@ def admin_orders(request):
     site_filter = request.GET.get('site', '')
     date_filter = request.GET.get('date', '')
 
-    if search_query:
-        commandes = commandes.filter(
-            Q(utilisateur__nom__icontains=search_query) |
-            Q(utilisateur__prenom__icontains=search_query) |
-            Q(plat__nom__icontains=search_query)
-        )
-
-    if status_filter:
-        commandes = commandes.filter(statut=status_filter)
-
-    if site_filter:
-        commandes = commandes.filter(utilisateur__site=site_filter)
-
-    if date_filter:
-        commandes = commandes.filter(created_at__date=date_filter)
+    commandes = filtrer_commandes(commandes, request.GET)
 
-    # Statistiques
-    total_commandes = commandes.count()
-    commandes_en_attente = commandes.filter(statut='en_attente').count()
-    commandes_confirmees = commandes.filter(statut='confirmee').count()
-    commandes_annulees = commandes.filter(statut='annulee').count()
+    # Statistiques (une requête)
+    stats_commandes = commandes.aggregate(
+        total=Count('id'),
+        en_attente=Count('id', filter=Q(statut='en_attente')),
+        confirmees=Count('id', filter=Q(statut='confirmee')),
+        pretes=Count('id', filter=Q(statut='prete')),
+        livrees=Count('id', filter=Q(statut='livree')),
+        annulees=Count('id', filter=Q(statut='annulee'))
+    )
 
-    # Pagination
-    paginator = Paginator(commandes, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination par curseur : pas d'OFFSET
+    page_obj = paginer(request, commandes, ('-created_at', '-id'), 15)
 
     context = {
         'page_obj': page_obj,
@@ -703,12 +535,8 @@ def admin_orders(request):
         'status_filter': status_filter,
         'site_filter': site_filter,
         'date_filter': date_filter,
-        'stats': {
-            'total': total_commandes,
-            'en_attente': commandes_en_attente,
-            'confirmees': commandes_confirmees,
-            'annulees': commandes_annulees,
-        }
+        'export_query': request.GET.urlencode(),
+        'stats_commandes': stats_commandes
     }
     return render(request, 'commandes/admin/gestion_commandes.html', context)
 @login_required
@@ -720,9 +548,8 @@ def admin_reports(request):
     from datetime import datetime, timedelta
     from django.db.models import Count, Avg, Sum
     from Commandes.models import Commande
+    from Commandes import statistiques
     from Avis.models import Avis
-    from Menus.models import Menu
-    from Plats.models import Plat
 
     # Période d'analyse (dernier mois par défaut)
     periode = request.GET.get('periode', 'month')
@@ -738,63 +565,49 @@ def admin_reports(request):
         start_date = today.replace(month=1, day=1)
         end_date = today
 
-    # Statistiques générales
-    total_commandes = Commande.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
-        is_deleted=False
-    ).count()
+    # Statistiques générales (table pré-agrégée StatCommandeJour)
+    stats_jour = statistiques.stats_periode(start_date, end_date)
+    total_commandes = stats_jour.aggregate(total=Sum('nombre'))['total'] or 0
 
     total_utilisateurs = Commande.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
+        created_at__gte=debut_jour(start_date),
+        created_at__lt=debut_jour(end_date + timedelta(days=1)),
         is_deleted=False
     ).values('utilisateur').distinct().count()
 
+    def avec_pourcentage(lignes):
+        # Part de chaque ligne dans le total de la période
+        return [dict(ligne, pourcentage=100 * ligne['count'] / (total_commandes or 1)) for ligne in lignes]
+
     # Répartition par statut
-    commandes_par_statut = Commande.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
-        is_deleted=False
-    ).values('statut').annotate(count=Count('id')).order_by('-count')
+    commandes_par_statut = avec_pourcentage(
+        stats_jour.values('statut').annotate(count=Sum('nombre')).order_by('-count')
+    )
 
     # Top plats
-    top_plats = Commande.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
-        is_deleted=False
-    ).values('plat__nom').annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]
+    top_plats = statistiques.top_plats(start_date, end_date)
 
     # Évolution journalière (derniers 7 jours)
-    evolution_data = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        count = Commande.objects.filter(
-            created_at__date=date,
-            is_deleted=False
-        ).count()
-        evolution_data.append({
-            'date': date.strftime('%d/%m'),
-            'count': count
-        })
+    evolution_data = [
+        {'date': date.strftime('%d/%m'), 'count': count}
+        for date, count in statistiques.totaux_par_jour(today - timedelta(days=6), today).items()
+    ]
 
     # Avis et satisfaction
     avis_stats = Avis.objects.filter(
-        date_creation__date__gte=start_date,
-        date_creation__date__lte=end_date
+        created_at__gte=debut_jour(start_date),
+        created_at__lt=debut_jour(end_date + timedelta(days=1)),
+        is_deleted=False
     ).aggregate(
         avg_note=Avg('note'),
         total_avis=Count('id')
     )
 
-    # Répartition par site
-    commandes_par_site = Commande.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
-        is_deleted=False
-    ).values('utilisateur__site').annotate(count=Count('id')).order_by('-count')
+    # Répartition par site du menu (lieu du repas) : la table pré-agrégée ne connaît pas
+    # le site de rattachement des utilisateurs
+    commandes_par_site = avec_pourcentage(
+        stats_jour.values('site').annotate(count=Sum('nombre')).order_by('-count')
+    )
 
     context = {
         'periode': periode,
@@ -935,7 +748,12 @@ def admin_reviews(request):
     return render(request, 'avis/admin/moderation.html', context)
 @login_required
 def profile_view(request):
-    return render(request, 'utilisateurs/profile.html')
+    resume = activite(request.user)
+    context = {
+        'activite': resume,
+        'commandes_mois': resume.commandes_du_mois(timezone.localdate()),
+    }
+    return render(request, 'utilisateurs/profile.html', context)
 
 @login_required
 def toggle_theme_view(request):
@@ -947,48 +765,23 @@ def toggle_theme_view(request):
 
 @login_required
 def menus_semaine_view(request):
-    from datetime import datetime, timedelta
-    from Menus.models import Menu
-    from Commandes.models import Commande
+    from datetime import timedelta
+    from Menus.services import snapshot_semaine, menus_utilisateur, stock_semaine, avec_stock
 
-    # Obtenir la semaine actuelle (lundi à dimanche)
-    today = datetime.now().date()
+    # Semaine actuelle (lundi à vendredi), menus du site de l'utilisateur
+    today = timezone.localdate()
     start_of_week = today - timedelta(days=today.weekday())  # Lundi
-    end_of_week = start_of_week + timedelta(days=6)  # Dimanche
-
-    # Récupérer les menus de la semaine pour le site de l'utilisateur
-    menus_semaine = Menu.objects.filter(
-        date__gte=start_of_week,
-        date__lte=end_of_week,
-        site=request.user.site,
-        est_publie=True
-    ).order_by('date', 'jour')
-
-    # Grouper par jour
-    menus_par_jour = {}
-    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi']
-
-    for jour in jours:
-        menus_jour = menus_semaine.filter(jour=jour)
-        if menus_jour.exists():
-            menu = menus_jour.first()
-            # Vérifier si l'utilisateur a déjà commandé pour ce menu
-            commande_existante = Commande.objects.filter(
-                utilisateur=request.user,
-                menu=menu,
-                is_deleted=False
-            ).exists()
-            menus_par_jour[jour] = {
-                'menu': menu,
-                'commande_existante': commande_existante
-            }
+    dates_semaine = [start_of_week + timedelta(days=i) for i in range(5)]
+    snapshot = snapshot_semaine(dates_semaine[0], dates_semaine[-1], site=request.user.site)
+    stock = stock_semaine(dates_semaine[0], dates_semaine[-1], site=request.user.site)
 
     context = {
-        'menus_par_jour': menus_par_jour,
-        'semaine_debut': start_of_week,
-        'semaine_fin': end_of_week,
+        'menus_semaine': avec_stock(menus_utilisateur(snapshot, request.user), stock['menus']),
+        'dates_semaine': dates_semaine,
+        'aujourdhui': today,
+        'site_stock': request.user.site,
     }
-    return render(request, "menus/menus_semaine.html", context)
+    return render(request, 'menus/collaborateur/menus_semaine.html', context)
 
 @login_required
 def historique_commandes_view(request):
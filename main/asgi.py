@@ -3,6 +3,11 @@ ASGI config for main project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Le flux SSE des commandes (Commandes.views.flux_commandes_prestataire) est
+une vue asynchrone : il doit être servi par ce point d'entrée avec un
+serveur ASGI (uvicorn, daphne) en un seul processus tant que le bus
+d'événements est Commandes.evenements.BusLocal.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,188 @@
+"""Pagination par curseur (keyset) : chaque page coûte le même prix que la première.
+
+Paginator compte toutes les lignes filtrées (COUNT(*)) puis saute les pages
+précédentes (OFFSET), de plus en plus cher à mesure que l'historique grandit.
+Ici, la page suivante reprend après la dernière ligne affichée :
+WHERE created_at <= x AND (created_at < x OR id < y) ORDER BY ... LIMIT n,
+une recherche dans l'index quelle que soit la profondeur.
+
+Le curseur est un jeton signé, lié à l'ordre de la liste : un jeton modifié ou
+venu d'une autre liste ramène à la première page. L'ordre se termine par une
+clé unique (id) et ne porte que sur des champs non nuls du modèle.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PARAMETRE = 'curseur'
+
+
+class PageCurseur:
+    """Page d'une liste paginée par curseur, utilisable comme une Page dans les templates"""
+
+    def __init__(self, objets, curseur_suivant, curseur_precedent, parametres, nombre=None, nombre_depasse=False):
+        self.object_list = objets
+        self.curseur_suivant = curseur_suivant
+        self.curseur_precedent = curseur_precedent
+        self.has_next = curseur_suivant is not None
+        self.has_previous = curseur_precedent is not None
+        # Nombre de lignes de la liste, borné : nombre_depasse si la liste en compte davantage
+        self.nombre = nombre
+        self.nombre_depasse = nombre_depasse
+        self._parametres = parametres
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _url(self, curseur=None):
+        parametres = self._parametres.copy()
+        if curseur:
+            parametres[PARAMETRE] = curseur
+        return '?' + parametres.urlencode()
+
+    @property
+    def url_premiere(self):
+        return self._url()
+
+    @property
+    def url_suivante(self):
+        return self._url(self.curseur_suivant)
+
+    @property
+    def url_precedente(self):
+        return self._url(self.curseur_precedent)
+
+
+def _sel(ordre):
+    return 'main.pagination:' + ','.join(ordre)
+
+
+def _serialiser(valeur):
+    # Microsecondes conservées : DjangoJSONEncoder tronquerait à la milliseconde
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    return valeur
+
+
+def _cle(objet, champs):
+    return [_serialiser(objet[champ] if isinstance(objet, dict) else getattr(objet, champ)) for champ in champs]
+
+
+def _encoder(ordre, sens, valeurs):
+    return signing.dumps({'s': sens, 'v': valeurs}, salt=_sel(ordre), compress=True)
+
+
+def _decoder(jeton, ordre, modele, champs):
+    """(sens, valeurs) du jeton, ou None s'il est absent ou invalide"""
+    if not jeton:
+        return None
+    try:
+        donnees = signing.loads(jeton, salt=_sel(ordre))
+        sens, valeurs = donnees['s'], donnees['v']
+        if sens not in ('apres', 'avant') or len(valeurs) != len(champs):
+            return None
+        return sens, [modele._meta.get_field(champ).to_python(valeur) for champ, valeur in zip(champs, valeurs)]
+    except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+        return None
+
+
+def _au_dela(champs, descendants, valeurs):
+    """Lignes strictement après la clé valeurs dans l'ordre donné"""
+    condition = Q()
+    egalites = {}
+    for champ, descendant, valeur in zip(champs, descendants, valeurs):
+        condition |= Q(**egalites, **{f'{champ}__{"lt" if descendant else "gt"}': valeur})
+        egalites[champ] = valeur
+    # Borne sur le premier champ : la recherche part de l'index plutôt que d'un parcours
+    premier = f'{champs[0]}__{"lte" if descendants[0] else "gte"}'
+    return Q(**{premier: valeurs[0]}) & condition
+
+
+def paginer(request, queryset, ordre, taille, plafond_nombre=None, parametre=PARAMETRE):
+    """Page du queryset désignée par le curseur de request.GET.
+
+    ordre : champs de tri, par exemple ('-created_at', '-id') ou ('nom', 'id').
+    plafond_nombre : compte aussi les lignes de la liste, sans dépasser ce
+    plafond (nombre_depasse au-delà) ; sans plafond, aucun COUNT.
+    """
+    champs = [champ.lstrip('-') for champ in ordre]
+    descendants = [champ.startswith('-') for champ in ordre]
+    curseur = _decoder(request.GET.get(parametre), ordre, queryset.model, champs)
+
+    lignes = queryset.order_by(*ordre)
+    if curseur is None:
+        sens = 'apres'
+    else:
+        sens, valeurs = curseur
+        if sens == 'apres':
+            lignes = lignes.filter(_au_dela(champs, descendants, valeurs))
+        else:
+            # Page précédente : on remonte dans l'ordre inverse puis on retourne la page
+            inverses = [not descendant for descendant in descendants]
+            lignes = queryset.filter(_au_dela(champs, inverses, valeurs)).order_by(
+                *[('-' if inverse else '') + champ for champ, inverse in zip(champs, inverses)]
+            )
+    objets = list(lignes[:taille + 1])
+    encore = len(objets) > taille
+    objets = objets[:taille]
+    if sens == 'avant':
+        objets.reverse()
+
+    if sens == 'apres':
+        suivant = encore
+        precedent = curseur is not None
+    else:
+        suivant = True
+        precedent = encore
+
+    nombre, nombre_depasse = None, False
+    if plafond_nombre is not None:
+        # COUNT sur une sous-requête limitée : le coût ne dépend pas de la taille de la table
+        nombre = queryset.order_by()[:plafond_nombre + 1].count()
+        nombre_depasse = nombre > plafond_nombre
+        nombre = min(nombre, plafond_nombre)
+
+    parametres = request.GET.copy()
+    parametres.pop(parametre, None)
+    parametres.pop('page', None)
+    return PageCurseur(
+        objets,
+        _encoder(ordre, 'apres', _cle(objets[-1], champs)) if suivant and objets else None,
+        _encoder(ordre, 'avant', _cle(objets[0], champs)) if precedent and objets else None,
+        parametres,
+        nombre=nombre,
+        nombre_depasse=nombre_depasse,
+    )
+
+
+class PaginateurPlafonne(Paginator):
+    """Paginator des changelists de l'admin Django sur les grandes tables.
+
+    Le nombre de lignes est compté sur une sous-requête limitée à PLAFOND :
+    au-delà, seules les PLAFOND premières lignes sont paginées (filtres,
+    recherche et hiérarchie par date restreignent la liste). Avec
+    show_full_result_count = False, plus aucun COUNT ne parcourt la table.
+    """
+    PLAFOND = 10000
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'order_by'):
+            return self.object_list.order_by()[:self.PLAFOND].count()
+        return min(len(self.object_list), self.PLAFOND)
@@ -0,0 +1,212 @@
+"""Profilage des requêtes : nombre et durée SQL, requêtes répétées (N+1), rendu des templates.
+
+Le middleware publie les mesures dans l'en-tête Server-Timing et les conserve
+par nom d'URL (page /admin/perf/). BUDGETS_REQUETES fixe un nombre maximal de
+requêtes SQL par vue : dépassement journalisé, ou exception sous ProfilageTestRunner.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+from django.test.runner import DiscoverRunner
+
+logger = logging.getLogger(__name__)
+
+_profil_courant = ContextVar('profil_requete', default=None)
+
+
+class BudgetRequetesDepasse(Exception):
+    pass
+
+
+class ProfilRequete:
+    """Mesures d'une requête HTTP"""
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.requetes = []
+        self.duree_sql = 0.0
+        self.duree_templates = 0.0
+        self.profondeur_template = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Enveloppe connection.execute_wrapper
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree_sql += time.perf_counter() - debut
+            self.requetes.append((sql, repr(params)))
+
+    @property
+    def nombre_requetes(self):
+        return len(self.requetes)
+
+    @property
+    def requetes_similaires(self):
+        """Requêtes dont le SQL (hors paramètres) a déjà été exécuté : signe d'un N+1"""
+        return self.nombre_requetes - len({sql for sql, _ in self.requetes})
+
+    @property
+    def requetes_dupliquees(self):
+        """Requêtes exécutées plusieurs fois avec les mêmes paramètres"""
+        return self.nombre_requetes - len(set(self.requetes))
+
+    def plus_repetee(self):
+        if not self.requetes:
+            return None, 0
+        return Counter(sql for sql, _ in self.requetes).most_common(1)[0]
+
+    def server_timing(self, duree_totale):
+        return ', '.join([
+            f'sql;dur={self.duree_sql * 1000:.1f};desc="{self.nombre_requetes} requetes, '
+            f'{self.requetes_similaires} similaires, {self.requetes_dupliquees} dupliquees"',
+            f'tpl;dur={self.duree_templates * 1000:.1f};desc="Templates"',
+            f'total;dur={duree_totale * 1000:.1f}',
+        ])
+
+
+def percentile(valeurs, p):
+    """Percentile au rang le plus proche d'une liste triée"""
+    if not valeurs:
+        return 0
+    rang = max(0, min(len(valeurs) - 1, round(p / 100 * len(valeurs) + 0.5) - 1))
+    return valeurs[rang]
+
+
+class RegistreProfils:
+    """Derniers échantillons par nom d'URL, en mémoire du processus"""
+
+    def __init__(self, taille=1000):
+        self._echantillons = defaultdict(lambda: deque(maxlen=taille))
+        self._verrou = threading.Lock()
+
+    def enregistrer(self, nom_url, duree, profil):
+        echantillon = (
+            duree * 1000,
+            profil.nombre_requetes,
+            profil.duree_sql * 1000,
+            profil.duree_templates * 1000,
+            profil.requetes_similaires,
+        )
+        with self._verrou:
+            self._echantillons[nom_url].append(echantillon)
+
+    def vider(self):
+        with self._verrou:
+            self._echantillons.clear()
+
+    def resume(self):
+        """Percentiles par nom d'URL, les vues les plus lentes (p95) d'abord"""
+        with self._verrou:
+            echantillons = {nom: list(valeurs) for nom, valeurs in self._echantillons.items()}
+
+        lignes = []
+        for nom_url, valeurs in echantillons.items():
+            durees, requetes, sql, templates, similaires = (sorted(colonne) for colonne in zip(*valeurs))
+            lignes.append({
+                'nom_url': nom_url,
+                'nombre': len(valeurs),
+                'duree_p50': percentile(durees, 50),
+                'duree_p95': percentile(durees, 95),
+                'duree_p99': percentile(durees, 99),
+                'requetes_p50': percentile(requetes, 50),
+                'requetes_p95': percentile(requetes, 95),
+                'requetes_max': requetes[-1],
+                'sql_p95': percentile(sql, 95),
+                'templates_p95': percentile(templates, 95),
+                'similaires_max': similaires[-1],
+                'budget': budget_requetes(nom_url),
+            })
+        return sorted(lignes, key=lambda ligne: ligne['duree_p95'], reverse=True)
+
+
+registre = RegistreProfils(getattr(settings, 'PROFILAGE_ECHANTILLONS', 1000))
+
+
+def budget_requetes(nom_url):
+    return getattr(settings, 'BUDGETS_REQUETES', {}).get(nom_url)
+
+
+class ProfilageRequetesMiddleware:
+    """Middleware synchrone : les connexions (et leurs execute_wrapper) sont propres au thread"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILAGE_REQUETES', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profil = ProfilRequete()
+        jeton = _profil_courant.set(profil)
+        try:
+            with ExitStack() as pile:
+                for connexion in connections.all():
+                    pile.enter_context(connexion.execute_wrapper(profil))
+                response = self.get_response(request)
+        finally:
+            _profil_courant.reset(jeton)
+
+        duree = time.perf_counter() - profil.debut
+        response['Server-Timing'] = profil.server_timing(duree)
+
+        match = request.resolver_match
+        if match is not None:
+            registre.enregistrer(match.view_name, duree, profil)
+            self.verifier_budget(match.view_name, profil)
+        return response
+
+    def verifier_budget(self, nom_url, profil):
+        budget = budget_requetes(nom_url)
+        if budget is None or profil.nombre_requetes <= budget:
+            return
+        sql, repetitions = profil.plus_repetee()
+        message = (
+            f"{nom_url} : {profil.nombre_requetes} requêtes SQL pour un budget de {budget} "
+            f"(requête la plus répétée, {repetitions} fois : {sql})"
+        )
+        if getattr(settings, 'PROFILAGE_BUDGETS_STRICTS', False):
+            raise BudgetRequetesDepasse(message)
+        logger.warning(message)
+
+
+class TemplateProfile(Template):
+
+    def render(self, context=None, request=None):
+        profil = _profil_courant.get()
+        if profil is None:
+            return super().render(context, request)
+        # Seul le template le plus externe est chronométré (pas de double compte)
+        profil.profondeur_template += 1
+        debut = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profil.profondeur_template -= 1
+            if profil.profondeur_template == 0:
+                profil.duree_templates += time.perf_counter() - debut
+
+
+class DjangoTemplatesProfiles(DjangoTemplates):
+    """Moteur de templates Django dont le rendu est chronométré par le middleware"""
+
+    def from_string(self, template_code):
+        return TemplateProfile(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TemplateProfile(super().get_template(template_name).template, self)
+
+
+class ProfilageTestRunner(DiscoverRunner):
+    """Les budgets de requêtes dépassés font échouer les tests"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.PROFILAGE_BUDGETS_STRICTS = True
@@ -1,4 +1,5 @@
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
     'Commandes',
     'Utilisateurs',
     'Avis',
+    'Notifications',
 
 ]
 
@@ -39,6 +41,7 @@ AUTH_USER_MODEL = 'Utilisateurs.Utilisateur'
 
 
 MIDDLEWARE = [
+    'main.profilage.ProfilageRequetesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,7 +55,7 @@ ROOT_URLCONF = 'main.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.profilage.DjangoTemplatesProfiles',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,13 +74,95 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# SAH_DB_ENGINE choisit la base : sqlite (défaut) ou postgresql.
+DB_ENGINE = os.environ.get('SAH_DB_ENGINE', 'sqlite')
+
+# SAH_SQLITE_PROFILE=production active le profil SQLite de production :
+# journal WAL, pragmas de performance, busy timeout, transactions IMMEDIATE
+# (sérialisation des écritures dès le BEGIN) et connexions persistantes.
+SQLITE_PROFILE = os.environ.get('SAH_SQLITE_PROFILE', 'dev')
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SAH_SQLITE_BUSY_TIMEOUT', 20))
+
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.environ.get('SAH_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
 }
 
+if SQLITE_PROFILE == 'production':
+    SQLITE_DATABASE.update({
+        'CONN_MAX_AGE': int(os.environ.get('SAH_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA temp_store=MEMORY;'
+                f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000};'
+            ),
+        },
+    })
+
+if DB_ENGINE == 'postgresql':
+    # PostgreSQL (psycopg 3). SAH_PG_POOL choisit la mise en commun des connexions :
+    #  - psycopg : pool intégré à Django (psycopg[pool]), tailles SAH_PG_POOL_MIN/MAX ;
+    #  - pgbouncer : pool côté serveur en mode transaction (curseurs serveur désactivés) ;
+    #  - vide : connexions persistantes classiques (SAH_DB_CONN_MAX_AGE).
+    PG_POOL = os.environ.get('SAH_PG_POOL', '')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SAH_PG_NAME', 'sah'),
+            'USER': os.environ.get('SAH_PG_USER', 'postgres'),
+            'PASSWORD': os.environ.get('SAH_PG_PASSWORD', ''),
+            'HOST': os.environ.get('SAH_PG_HOST', 'localhost'),
+            'PORT': os.environ.get('SAH_PG_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        },
+        # Base SQLite d'origine, lue par la commande migrer_sqlite_postgres
+        'sqlite_source': SQLITE_DATABASE,
+    }
+    if PG_POOL == 'psycopg':
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('SAH_PG_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('SAH_PG_POOL_MAX', 10)),
+            'timeout': int(os.environ.get('SAH_PG_POOL_TIMEOUT', 10)),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('SAH_DB_CONN_MAX_AGE', 600))
+    if PG_POOL == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': SQLITE_DATABASE,
+    }
+
+
+# Cache (snapshots des menus publiés, Menus/services.py).
+# SAH_WORKERS (ou WEB_CONCURRENCY) : nombre de processus du serveur d'application.
+# Un seul processus : locmem par défaut. Plusieurs : le cache fichier (SAH_CACHE_DIR)
+# par défaut, pour que tous lisent la même version des menus ; un locmem imposé
+# (SAH_CACHE=locmem) est signalé par le check menus.W001.
+SAH_WORKERS = int(os.environ.get('SAH_WORKERS', os.environ.get('WEB_CONCURRENCY', 1)))
+if os.environ.get('SAH_CACHE', 'file' if SAH_WORKERS > 1 else 'locmem') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('SAH_CACHE_DIR', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sah',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,7 +206,16 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "tailwind"
 CRISPY_TEMPLATE_PACK = "tailwind"
 
 # Email Configuration (pour les notifications)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Console par défaut ; SAH_EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend en production.
+# Les emails partent du worker Notifications (python manage.py envoyer_emails), jamais d'une requête.
+EMAIL_BACKEND = os.environ.get('SAH_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('SAH_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('SAH_EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('SAH_EMAIL_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('SAH_EMAIL_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('SAH_EMAIL_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('SAH_EMAIL_FROM', 'SAH Restauration <noreply@sah.local>')
 # Redirection après login
 LOGIN_REDIRECT_URL = '/dashboard/collaborateur/'
 
@@ -130,4 +224,25 @@ LOGIN_URL = '/login/'
 AUTH_USER_MODEL = "Utilisateurs.Utilisateur"
 
 # Redirection après logout
-LOGOUT_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'
+
+# Bus d'événements des commandes (flux SSE de la cuisine).
+# BusLocal fonctionne en mémoire dans un seul processus ASGI.
+COMMANDES_BUS_EVENEMENTS = 'Commandes.evenements.BusLocal'
+
+# Profilage des requêtes (main/profilage.py, page /admin/perf/)
+PROFILAGE_REQUETES = True
+PROFILAGE_ECHANTILLONS = 1000
+# Nombre maximal de requêtes SQL par nom d'URL : avertissement dans les logs,
+# échec des tests (ProfilageTestRunner)
+BUDGETS_REQUETES = {
+    'admin_dashboard': 9,
+    'collaborateur_dashboard': 6,
+    'menus_semaine': 6,
+    'menus:menus_semaine': 6,
+    'menus:api_menus_semaine': 4,
+    'menus:api_stock_semaine': 3,
+    'commandes:mes_commandes': 4,
+    'mes_avis': 4,
+}
+TEST_RUNNER = 'main.profilage.ProfilageTestRunner'
@@ -0,0 +1,137 @@
+from datetime import timedelta
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Commandes import activite
+from Commandes.models import Commande
+from Menus.models import Menu, MenuPlat
+from Plats.models import Plat
+from Utilisateurs.models import Utilisateur
+from .pagination import paginer
+from .profilage import BudgetRequetesDepasse, registre
+
+
+class ProfilageRequetesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            email='admin@sah.test', prenom='Ada', nom='Admin', role='admin'
+        )
+        cls.collaborateur = Utilisateur.objects.create_user(
+            email='collab@sah.test', prenom='Col', nom='Laborateur', site='Danga'
+        )
+        today = timezone.now().date()
+        for i in range(3):
+            menu = Menu.objects.create(
+                jour='lundi', date=today - timedelta(days=7 * (i + 1)), site='Danga', est_publie=True,
+                date_limite_commande=timezone.now()
+            )
+            plat = Plat.objects.create(nom=f'Plat {i}', description='-')
+            MenuPlat.objects.create(menu=menu, plat=plat)
+            Commande.objects.create(utilisateur=cls.collaborateur, menu=menu, plat=plat)
+
+    def setUp(self):
+        registre.vider()
+
+    def test_server_timing(self):
+        self.client.force_login(self.collaborateur)
+        response = self.client.get(reverse('collaborateur_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="\d+ requetes, ')
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    def test_page_perf_reservee_admin(self):
+        self.client.force_login(self.collaborateur)
+        self.client.get(reverse('collaborateur_dashboard'))
+        self.assertEqual(self.client.get(reverse('perf')).status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('perf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'collaborateur_dashboard')
+
+    @override_settings(BUDGETS_REQUETES={'collaborateur_dashboard': 1})
+    def test_budget_depasse(self):
+        self.client.force_login(self.collaborateur)
+        with self.assertRaises(BudgetRequetesDepasse):
+            self.client.get(reverse('collaborateur_dashboard'))
+
+
+class PaginationCurseurTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Utilisateur.objects.create_user(
+            email='admin@sah.test', prenom='Ada', nom='Admin', role='admin'
+        )
+        cls.collaborateur = Utilisateur.objects.create_user(
+            email='collab@sah.test', prenom='Col', nom='Laborateur', site='Danga'
+        )
+        menu = Menu.objects.create(
+            jour='lundi', date=timezone.now().date(), site='Danga', est_publie=True,
+            date_limite_commande=timezone.now()
+        )
+        debut = timezone.now() - timedelta(days=30)
+        for i in range(23):
+            plat = Plat.objects.create(nom=f'Plat {i}', description='-')
+            # Dates en double (i // 2) : l'id départage
+            Commande.objects.create(
+                utilisateur=cls.collaborateur, menu=menu, plat=plat, created_at=debut + timedelta(hours=i // 2)
+            )
+        activite.reconstruire()
+        cls.ordre = list(Commande.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def page(self, parametres=''):
+        return paginer(RequestFactory().get('/' + parametres), Commande.objects.all(), ('-created_at', '-id'), 10)
+
+    def test_parcours_sans_offset(self):
+        pages = [self.page()]
+        with CaptureQueriesContext(connection) as requetes:
+            while pages[-1].has_next:
+                pages.append(self.page(pages[-1].url_suivante))
+        self.assertFalse([requete for requete in requetes.captured_queries if 'OFFSET' in requete['sql']])
+        self.assertEqual([len(page) for page in pages], [10, 10, 3])
+        self.assertEqual([commande.id for page in pages for commande in page], self.ordre)
+        self.assertFalse(pages[0].has_previous)
+
+        # Retour en arrière depuis la dernière page
+        precedente = self.page(pages[-1].url_precedente)
+        self.assertEqual([commande.id for commande in precedente], self.ordre[10:20])
+        self.assertTrue(precedente.has_next)
+        premiere = self.page(precedente.url_precedente)
+        self.assertEqual([commande.id for commande in premiere], self.ordre[:10])
+        self.assertFalse(premiere.has_previous)
+
+    def test_jeton_invalide_et_nombre_borne(self):
+        suivante = self.page().url_suivante
+        self.assertEqual(self.page(suivante[:-3] + 'abc')[0].id, self.ordre[0])
+        # Jeton d'une autre liste : ordre différent, signature refusée
+        autre = paginer(RequestFactory().get('/'), Commande.objects.all(), ('created_at', 'id'), 10)
+        self.assertEqual(self.page(autre.url_suivante)[0].id, self.ordre[0])
+
+        page = paginer(RequestFactory().get('/'), Commande.objects.all(), ('-created_at', '-id'), 10, plafond_nombre=20)
+        self.assertEqual((page.nombre, page.nombre_depasse), (20, True))
+
+    def test_vues_paginees(self):
+        self.client.force_login(self.collaborateur)
+        response = self.client.get(reverse('commandes:mes_commandes'))
+        self.assertEqual(response.context['total_commandes'], 23)
+        response = self.client.get(reverse('commandes:mes_commandes') + response.context['page_obj'].url_suivante)
+        self.assertEqual([commande.id for commande in response.context['page_obj']], self.ordre[10:20])
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin_orders'), {'status': 'en_attente'})
+        self.assertContains(response, 'curseur=')
+        self.assertContains(response, 'status=en_attente')
+        response = self.client.get(reverse('admin_users'))
+        self.assertEqual(response.context['stats_utilisateurs']['admins'], 1)
+        self.assertEqual([utilisateur.nom for utilisateur in response.context['page_obj']], ['Admin', 'Laborateur'])
+        for url in ('commandes:gestion_commandes_admin', 'moderation_avis', 'mes_avis'):
+            self.assertEqual(self.client.get(reverse(url)).status_code, 200)
+
+        plat = Plat.objects.get(nom='Plat 0')
+        self.assertEqual(self.client.get(reverse('api_avis_plat', args=[plat.id])).json()['suivant'], None)
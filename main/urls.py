@@ -3,7 +3,10 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from . import views
+
 urlpatterns = [
+    path('admin/perf/', views.perf_view, name='perf'),
     path('admin/', admin.site.urls),
     path('', include('Utilisateurs.urls')),
     path('menus/', include('Menus.urls')),
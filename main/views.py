@@ -0,0 +1,18 @@
+from django.contrib.auth.decorators import user_passes_test
+from django.shortcuts import redirect, render
+
+from .profilage import registre
+
+
+def is_admin(user):
+    return user.is_authenticated and user.role == 'admin'
+
+
+@user_passes_test(is_admin)
+def perf_view(request):
+    """Percentiles par vue des dernières requêtes profilées (processus courant)"""
+    if request.method == 'POST':
+        registre.vider()
+        return redirect('perf')
+
+    return render(request, 'utilisateurs/admin/perf.html', {'vues': registre.resume()})
@@ -0,0 +1,69 @@
+// flux-commandes.js - Mise à jour en direct des écrans cuisine via le flux SSE des commandes
+
+document.addEventListener('DOMContentLoaded', function() {
+    const STATUTS_CUISINE = ['confirmee', 'prete'];
+    const TYPES_EVENEMENTS = ['created', 'modified', 'cancelled', 'statuts', 'prete', 'livree'];
+
+    function incrementer(element, delta) {
+        if (element) {
+            element.textContent = Math.max(0, parseInt(element.textContent || '0', 10) + delta);
+        }
+    }
+
+    // Retourne false si le plat n'est pas encore affiché sur l'écran
+    function ajuster(conteneur, platId, statut, delta) {
+        const site = conteneur.dataset.site;
+        document.querySelectorAll('[data-total-site="' + site + '"]').forEach(function(element) {
+            incrementer(element, delta);
+        });
+        incrementer(conteneur.querySelector('[data-compteur-total="' + statut + '"]'), delta);
+
+        const carte = conteneur.querySelector('[data-plat-id="' + platId + '"]');
+        if (!carte) {
+            return false;
+        }
+        incrementer(carte.querySelector('[data-compteur="quantite"]'), delta);
+        incrementer(carte.querySelector('[data-compteur="' + statut + '"]'), delta);
+        return true;
+    }
+
+    // Retourne false si un plat de l'événement n'est pas encore affiché
+    function appliquer(conteneur, evenement) {
+        const ancienStatut = evenement.type === 'created' ? null : (evenement.ancien_statut || evenement.statut);
+        const ancienPlat = evenement.ancien_plat_id || evenement.plat_id;
+        let affiche = true;
+
+        if (STATUTS_CUISINE.includes(ancienStatut)) {
+            affiche = ajuster(conteneur, ancienPlat, ancienStatut, -1) && affiche;
+        }
+        if (STATUTS_CUISINE.includes(evenement.statut)) {
+            affiche = ajuster(conteneur, evenement.plat_id, evenement.statut, 1) && affiche;
+        }
+        return affiche;
+    }
+
+    function recevoir(conteneur, evenement) {
+        let affiche = true;
+        if (evenement.type === 'statuts') {
+            // Changement en masse : une entrée par commande
+            evenement.commandes.forEach(function(commande) {
+                affiche = appliquer(conteneur, Object.assign({statut: evenement.statut}, commande)) && affiche;
+            });
+        } else {
+            affiche = appliquer(conteneur, evenement);
+        }
+        if (!affiche) {
+            // Premier plat de ce type pour la journée : on recharge une seule fois
+            window.location.reload();
+        }
+    }
+
+    document.querySelectorAll('[data-flux-commandes]').forEach(function(conteneur) {
+        const source = new EventSource(conteneur.dataset.fluxCommandes);
+        TYPES_EVENEMENTS.forEach(function(type) {
+            source.addEventListener(type, function(e) {
+                recevoir(conteneur, JSON.parse(e.data));
+            });
+        });
+    });
+});
@@ -0,0 +1,73 @@
+// stock-menus.js - Places restantes des menus ouverts, relues toutes les quelques secondes
+
+document.addEventListener('DOMContentLoaded', function() {
+    const INTERVALLE = 5000;
+    const page = document.getElementById('menus-semaine');
+    if (!page || !page.querySelector('[data-commander-menu]')) {
+        // Aucun menu ouvert à la commande : rien à suivre
+        return;
+    }
+
+    function texteRestant(restant, singulier, pluriel) {
+        return restant + ' ' + (restant > 1 ? pluriel : singulier);
+    }
+
+    function afficherPlat(badge, restant) {
+        badge.classList.toggle('d-none', restant === null || restant === undefined);
+        badge.classList.toggle('bg-danger', restant === 0);
+        badge.classList.toggle('bg-light', restant !== 0);
+        badge.classList.toggle('text-dark', restant !== 0);
+        badge.textContent = restant === 0 ? 'Complet' : texteRestant(restant, 'restant', 'restants');
+    }
+
+    function appliquer(menus) {
+        Object.keys(menus).forEach(function(menuId) {
+            const menu = menus[menuId];
+            const restants = Object.values(menu.plats);
+
+            const places = page.querySelector('[data-stock-menu="' + menuId + '"]');
+            if (places) {
+                places.classList.toggle('d-none', menu.restant === null);
+                places.textContent = texteRestant(menu.restant, 'place restante', 'places restantes');
+            }
+            Object.keys(menu.plats).forEach(function(platId) {
+                const badge = page.querySelector('[data-stock-plat="' + menuId + '-' + platId + '"]');
+                if (badge) {
+                    afficherPlat(badge, menu.plats[platId]);
+                }
+            });
+
+            const complet = menu.restant === 0 || (restants.length > 0 && restants.every(function(restant) {
+                return restant === 0;
+            }));
+            const commander = page.querySelector('[data-commander-menu="' + menuId + '"]');
+            const bouton = page.querySelector('[data-complet-menu="' + menuId + '"]');
+            if (commander && bouton) {
+                commander.classList.toggle('d-none', complet);
+                bouton.classList.toggle('d-none', !complet);
+            }
+        });
+    }
+
+    function rafraichir() {
+        if (document.hidden) {
+            return;
+        }
+        // no-cache : le navigateur revalide par ETag, un stock inchangé revient en 304
+        fetch(page.dataset.stockUrl, {cache: 'no-cache', credentials: 'same-origin'})
+            .then(function(response) {
+                return response.ok ? response.json() : null;
+            })
+            .then(function(stock) {
+                if (stock) {
+                    appliquer(stock.menus);
+                }
+            })
+            .catch(function() {
+                // Réseau indisponible : nouvel essai au prochain intervalle
+            });
+    }
+
+    setInterval(rafraichir, INTERVALLE);
+    document.addEventListener('visibilitychange', rafraichir);
+});